@@ -1,40 +1,64 @@
 # file_system_logic.py
 
 import os
+import sys
+import codecs
 from datetime import datetime
+import pfs_log
+import pfs_crc
 
 FILENAME = "private.pfs"
 index = {}
 
-def open_or_create_pfs():
-    if not os.path.exists(FILENAME):
-        with open(FILENAME, "wb") as f:
-            pass  # create empty file
+def open_volume():
+    return pfs_log.LogVolume(FILENAME, legacy=convert_legacy)
 
-def load_index():
-    global index
-    index = {}
-    
-    if not os.path.exists(FILENAME):
-        return
+def open_or_create_pfs():
+    open_volume()
 
-    with open(FILENAME, "rb") as f:
-        lines = f.read().split(b"\n")
-    
-    for line in lines:
+def convert_legacy(volume, data):
+    """Move an old header-then-content private.pfs into a log volume."""
+    old = parse_index(data)
+    for meta in old.values():
+        if meta["type"] == "F":
+            content = data[meta["offset"]:meta["offset"] + meta["length"]]
+            meta["offset"] = volume.store(content)
+            meta["length"] = len(content)
+    volume.commit(build_header(old))
+
+def parse_index(block):
+    entries = {}
+    for line in block.split(b"\n"):
         if not line.strip():
             continue
         try:
             text = line.decode()
             type_, path, offset, length, timestamp = text.strip().split("|")
-            index[path] = {
+            entries[path] = {
                 "type": type_,
                 "offset": int(offset),
                 "length": int(length),
                 "timestamp": timestamp
             }
         except Exception:
-            break  
+            break
+    return entries
+
+def read_index(snapshot=None):
+    """Metadata of the live tree, or of the tree frozen by a snapshot."""
+    return parse_index(open_volume().root(snapshot))
+
+def load_index():
+    global index
+    index = read_index()
+
+def writing():
+    """Hold the writer lock over a whole command, from load_index() to write_metadata().
+
+    Other shells can keep reading meanwhile; another writer waits, so it
+    loads the index only after this change is committed and loses nothing.
+    """
+    return open_volume().lock.writing()
 
 def update_index(path, type_, length, content_bytes):
     index[path] = {
@@ -45,66 +69,56 @@ def update_index(path, type_, length, content_bytes):
         "content": content_bytes
     }
 
-def compute_offsets():
+def build_header(entries):
+    """Build the metadata block for the given entries."""
     lines = []
-    for path, meta in index.items():
-        lines.append(f"{meta['type']}|{path}|0|{meta['length']}|{meta['timestamp']}")
-    encoded = ("\n".join(lines) + "\n").encode()
-
-
-    pad = (16 - len(encoded) % 16) % 16
-    header_size = len(encoded) + pad
-
-    offset = header_size
-    for path, meta in index.items():
-        if meta["type"] == "F" and "content" in meta:
-            meta["offset"] = offset
-            offset += meta["length"]
-
-def build_header():
-    """Build the final metadata header after offsets are assigned."""
-    lines = []
-    for path, meta in index.items():
+    for path, meta in entries.items():
         lines.append(f"{meta['type']}|{path}|{meta['offset']}|{meta['length']}|{meta['timestamp']}")
-    header = ("\n".join(lines) + "\n").encode()
-    pad = (16 - len(header) % 16) % 16
-    return header + b"" * pad
+    return ("\n".join(lines) + "\n").encode()
 
 def write_metadata():
-    """Write metadata and content to private.pfs."""
-    compute_offsets()
-    header = build_header()
-
-
-    content_blocks = []
-
-    for path, meta in index.items():
-        if meta["type"] == "F":
-            if "content" not in meta:
-                # Load file content if missing
-                with open(FILENAME, "rb") as f:
-                    f.seek(meta["offset"])
-                    meta["content"] = f.read(meta["length"])
-            # Refresh length to be 100% safe
-            meta["length"] = len(meta["content"])
-            content_blocks.append((path, meta["content"]))
-
-    with open(FILENAME, "wb") as f:
-        f.write(header)
-        for _, content in content_blocks:
-            f.write(content)
-    
-def hydrate_all_content():
-    """Ensure all file entries in index have their content and correct length."""
-    if not os.path.exists(FILENAME):
+    """Append new content and a new metadata block to private.pfs.
+
+    Content that is already on disk is never moved or overwritten, so the
+    blocks frozen by earlier snapshots keep pointing at valid data. Chunks
+    that are already stored are shared instead of written again.
+    """
+    volume = open_volume()
+    for meta in index.values():
+        if meta["type"] == "F" and "content" in meta:
+            meta["offset"] = volume.store(meta["content"])
+            meta["length"] = len(meta.pop("content"))
+    volume.commit(build_header(index))
+
+def read_content(meta):
+    return open_volume().load(meta["offset"], meta["length"])
+
+def stream_content(meta):
+    return open_volume().stream(meta["offset"], meta["length"])
+
+def resolve(path):
+    """Look up a path that may name a snapshot (+dir/file@name)."""
+    path, snapshot = pfs_log.split_snapshot(path)
+    if snapshot is None:
+        return path, index.get(path)
+    try:
+        return path, read_index(snapshot).get(path)
+    except KeyError:
+        print(f"Error: Snapshot '{snapshot}' not found")
+        return path, None
+
+def snapshot(name=None):
+    volume = open_volume()
+    if name is None:
+        for snap, (_, _, timestamp) in volume.snapshots().items():
+            print(f"{snap}  {datetime.fromtimestamp(timestamp).isoformat()}")
         return
-    with open(FILENAME, "rb") as f:
-        for meta in index.values():
-            if meta["type"] == "F":
-                f.seek(meta["offset"])
-                content = f.read(meta["length"])
-                meta["content"] = content
-                meta["length"] = len(content)
+    try:
+        volume.snapshot(name)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    print(f"Snapshot created: {name}")
 
 def cp(source, dest):
     load_index()
@@ -115,12 +129,20 @@ def cp(source, dest):
 
     # Copy from supplemental source
     if source.startswith("+"):
-        if source not in index or index[source]["type"] != "F":
+        _, meta = resolve(source)
+        if not meta or meta["type"] != "F":
             print(f"Error: Supplemental file '{source}' not found")
             return
-        with open(FILENAME, "rb") as f:
-            f.seek(index[source]["offset"])
-            content = f.read(index[source]["length"])
+        # metadata only: the copy points at the content already stored
+        index[dest] = {
+            "type": "F",
+            "offset": meta["offset"],
+            "length": meta["length"],
+            "timestamp": datetime.now().isoformat()
+        }
+        write_metadata()
+        print(f"Copied {source} -> {dest}")
+        return
 
     # Copy from normal source
     else:
@@ -136,28 +158,46 @@ def cp(source, dest):
 
 def show(path):
     load_index()
-    if path not in index:
+    _, meta = resolve(path)
+    if not meta:
         print("File not found in supplemental FS")
         return
-    meta = index[path]
-    with open(FILENAME, "rb") as f:
-        f.seek(meta["offset"])
-        content = f.read(meta["length"])
-    print(content.decode("utf-8").strip())
+    # print the content stripped, as it is decompressed, holding back only
+    # trailing whitespace that may turn out to be the end of the file
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    started = False
+    pending = ""
+    for piece in stream_content(meta):
+        text = decoder.decode(piece)
+        if not started:
+            text = text.lstrip()
+            started = bool(text)
+        text = pending + text
+        stripped = text.rstrip()
+        pending = text[len(stripped):]
+        sys.stdout.write(stripped)
+    print()
 
 def ls(path):
     load_index()
     
-    if path not in index:
+    path, snap = pfs_log.split_snapshot(path)
+    try:
+        entries = read_index(snap) if snap else index
+    except KeyError:
+        print(f"Error: Snapshot '{snap}' not found")
+        return
+
+    if path not in entries:
         print("File or directory not found in supplemental FS")
         return
 
-    meta = index[path]
+    meta = entries[path]
 
     if meta["type"] == "F":
         print(f"{path}  {meta['timestamp']}")
     elif meta["type"] == "D":
-        for other_path, other_meta in index.items():
+        for other_path, other_meta in entries.items():
             if other_path.startswith(path + "/"):
                 print(f"{other_path}  {other_meta['timestamp']}")
 
@@ -176,7 +216,6 @@ def mkdir(path):
         "timestamp": datetime.now().isoformat()
     }
 
-    hydrate_all_content()
     write_metadata()
     print(f"Directory created: {path}")
 
@@ -190,20 +229,18 @@ def merge(src1, src2, dest):
     # Load source 1 (supplemental required)
     if not src1.startswith("+"):
         raise ValueError("First source must be a supplemental file starting with '+'")
-    if src1 not in index or index[src1]["type"] != "F":
+    _, meta1 = resolve(src1)
+    if not meta1 or meta1["type"] != "F":
         raise FileNotFoundError(f"{src1} not found in supplemental FS")
 
-    with open(FILENAME, "rb") as f:
-        f.seek(index[src1]["offset"])
-        content1 = f.read(index[src1]["length"])
+    content1 = read_content(meta1)
 
     # Load source 2 (can be normal or supplemental)
     if src2.startswith("+"):
-        if src2 not in index or index[src2]["type"] != "F":
+        _, meta2 = resolve(src2)
+        if not meta2 or meta2["type"] != "F":
             raise FileNotFoundError(f"{src2} not found in supplemental FS")
-        with open(FILENAME, "rb") as f:
-            f.seek(index[src2]["offset"])
-            content2 = f.read(index[src2]["length"])
+        content2 = read_content(meta2)
     else:
         if not os.path.exists(src2):
             raise FileNotFoundError(f"{src2} not found on disk")
@@ -244,3 +281,13 @@ def rm(path):
     del index[path]
     write_metadata()
     print(f"Removed file: {path}")
+
+def fsck(quiet=False):
+    """Check the checksum of every block in private.pfs; quiet only prints problems."""
+    volume = open_volume()
+    if not volume.framed:
+        if not quiet:
+            print(f"fsck: {FILENAME}: {volume.magic} volumes have no checksums")
+        return True
+    checked, bad = volume.fsck()
+    return pfs_crc.report(FILENAME, checked, bad, quiet)
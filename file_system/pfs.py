@@ -1,62 +1,108 @@
 import os
+import sys
 import time
+import codecs
+import pfs_log
+import pfs_crc
 
 PFS_FILENAME = "private.pfs"
 
 
 
-def read_metadata():
-    if not os.path.exists(PFS_FILENAME):
-        return []
+def open_volume():
+    return pfs_log.LogVolume(PFS_FILENAME, legacy=convert_legacy)
+
+def convert_legacy(volume, data):
+    # old files were rewritten as bare metadata lines, so copy whatever bytes
+    # each FILE line pointed at into the new volume
+    entries = parse_metadata(data)
+    for entry in entries:
+        if entry['type'] == 'FILE':
+            content = data[entry['offset']:entry['offset'] + entry['size']]
+            entry['offset'] = volume.store(content)
+            entry['size'] = len(content)
+    volume.commit(encode_metadata(entries))
+
+def writing():
+    """Hold the writer lock over a whole command, from read_metadata() to write_metadata().
 
+    Other shells can keep reading meanwhile; another writer waits, so it
+    reads the metadata only after this change is committed and loses nothing.
+    """
+    return open_volume().lock.writing()
+
+def read_metadata(snapshot=None):
+    return parse_metadata(open_volume().root(snapshot))
+
+def parse_metadata(block):
     entries = []
-    with open(PFS_FILENAME, 'r', encoding='utf-8') as f:
-        for line in f:
-            if not line.strip():
-                continue
-            parts = line.strip().split(':', 4)
-            if parts[0] == "FILE" and len(parts) == 5:
-                entry = {
-                    'type': parts[0],
-                    'path': parts[1],
-                    'offset': int(parts[2]),
-                    'size': int(parts[3]),
-                    'timestamp': int(parts[4])
-                }
-                entries.append(entry)
-            elif parts[0] == "DIR" and len(parts) == 3:
-                entry = {
-                    'type': parts[0],
-                    'path': parts[1],
-                    'timestamp': int(parts[2])
-                }
-                entries.append(entry)
-            else:
-                
-                continue
+    for line in block.decode('utf-8', errors='replace').splitlines():
+        if not line.strip():
+            continue
+        parts = line.strip().split(':', 4)
+        if parts[0] == "FILE" and len(parts) == 5:
+            entry = {
+                'type': parts[0],
+                'path': parts[1],
+                'offset': int(parts[2]),
+                'size': int(parts[3]),
+                'timestamp': int(parts[4])
+            }
+            entries.append(entry)
+        elif parts[0] == "DIR" and len(parts) == 3:
+            entry = {
+                'type': parts[0],
+                'path': parts[1],
+                'timestamp': int(parts[2])
+            }
+            entries.append(entry)
+        else:
+            
+            continue
     return entries
 
+def encode_metadata(entries):
+    lines = []
+    for entry in entries:
+        if entry['type'] == "FILE":
+            lines.append(f"FILE:{entry['path']}:{entry['offset']}:{entry['size']}:{entry['timestamp']}\n")
+        elif entry['type'] == "DIR":
+            lines.append(f"DIR:{entry['path']}:{entry['timestamp']}\n")
+    return "".join(lines).encode('utf-8')
+
 def write_metadata(entries):
-    with open(PFS_FILENAME, 'w', encoding='utf-8') as f:
-        for entry in entries:
-            if entry['type'] == "FILE":
-                f.write(f"FILE:{entry['path']}:{entry['offset']}:{entry['size']}:{entry['timestamp']}\n")
-            elif entry['type'] == "DIR":
-                f.write(f"DIR:{entry['path']}:{entry['timestamp']}\n")
+    # appends a new metadata block, older blocks stay readable through snapshots
+    open_volume().commit(encode_metadata(entries))
 
 def append_content(data):
-    with open(PFS_FILENAME, 'ab') as f:
-        f.seek(0, os.SEEK_END)
-        offset = f.tell()
-        f.write(data.encode('utf-8'))
-        return offset
-
-def find_entry(path):
-    for entry in read_metadata():
+    # identical chunks are stored once, so this may append nothing at all
+    return open_volume().store(data.encode('utf-8'))
+
+def read_content(entry):
+    return open_volume().load(entry['offset'], entry['size']).decode('utf-8')
+
+def stream_content(entry):
+    # chunks are decompressed one at a time; utf-8 sequences may span chunks
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for piece in open_volume().stream(entry['offset'], entry['size']):
+        yield decoder.decode(piece)
+    yield decoder.decode(b'', final=True)
+
+def find_entry(path, snapshot=None):
+    for entry in read_metadata(snapshot):
         if entry['path'] == path:
             return entry
     return None
 
+def find_source(path):
+    # sources may name a snapshot: +dir/file@name
+    path, snapshot = pfs_log.split_snapshot(path)
+    try:
+        return find_entry(path, snapshot)
+    except KeyError:
+        print(f"Snapshot '{snapshot}' not found.")
+        return None
+
 def remove_entry(path):
     entries = read_metadata()
     new_entries = [e for e in entries if e['path'] != path]
@@ -79,17 +125,17 @@ def cp_pfs(src, dst):
             return
         with open(src, 'r', encoding='utf-8') as f:
             content = f.read()
+        offset = append_content(content)
+        size = len(content.encode('utf-8'))
     else:
-        entry = find_entry(src)
+        entry = find_source(src)
         if not entry or entry['type'] != 'FILE':
             print(f"cp_pfs: Supplemental file '{src}' not found.")
             return
-        with open(PFS_FILENAME, 'rb') as f:
-            f.seek(entry['offset'])
-            content = f.read(entry['size']).decode('utf-8')
+        # stored content never changes, so the copy can share it
+        offset = entry['offset']
+        size = entry['size']
 
-    offset = append_content(content)
-    size = len(content)
     timestamp = int(time.time())
 
     entries = read_metadata()
@@ -137,13 +183,18 @@ def rmdir_pfs(path):
     remove_entry(path)
 
 def ls_pfs(path=None):
-    entries = read_metadata()
+    path, snapshot = pfs_log.split_snapshot(path) if path else (path, None)
+    try:
+        entries = read_metadata(snapshot)
+    except KeyError:
+        print(f"ls: snapshot '{snapshot}' not found.")
+        return
     if not path:
         for entry in entries:
             print(f"{entry['path']} (last modified: {time.ctime(entry['timestamp'])})")
         return
 
-    entry = find_entry(path)
+    entry = next((e for e in entries if e['path'] == path), None)
     if not entry:
         print(f"ls: '{path}' not found.")
         return
@@ -159,13 +210,11 @@ def merge_pfs(src1, src2, dst):
     content = ""
     for src in [src1, src2]:
         if src.startswith('+'):
-            entry = find_entry(src)
+            entry = find_source(src)
             if not entry or entry['type'] != 'FILE':
                 print(f"merge: Source '{src}' not found or not a file.")
                 return
-            with open(PFS_FILENAME, 'rb') as f:
-                f.seek(entry['offset'])
-                content += f.read(entry['size']).decode('utf-8')
+            content += read_content(entry)
         else:
             if not os.path.exists(src):
                 print(f"merge: Normal file '{src}' not found.")
@@ -174,7 +223,7 @@ def merge_pfs(src1, src2, dst):
                 content += f.read()
 
     offset = append_content(content)
-    size = len(content)
+    size = len(content.encode('utf-8'))
     timestamp = int(time.time())
 
     entries = read_metadata()
@@ -188,11 +237,35 @@ def merge_pfs(src1, src2, dst):
     write_metadata(entries)
 
 def show_pfs(path):
-    entry = find_entry(path)
+    entry = find_source(path)
     if not entry or entry['type'] != 'FILE':
         print(f"show: File '{path}' not found.")
         return
-    with open(PFS_FILENAME, 'rb') as f:
-        f.seek(entry['offset'])
-        content = f.read(entry['size']).decode('utf-8')
-        print(content)
\ No newline at end of file
+    for text in stream_content(entry):
+        sys.stdout.write(text)
+    print()
+
+def snapshot_pfs(name=None):
+    volume = open_volume()
+    if name is None:
+        for snap, (_, _, timestamp) in volume.snapshots().items():
+            print(f"{snap} (taken: {time.ctime(timestamp)})")
+        return
+    try:
+        volume.snapshot(name)
+    except ValueError as e:
+        print(f"snapshot: {e}")
+        return
+    print(f"Snapshot '{name}' created.")
+
+def fsck_pfs(quiet=False):
+    # quiet is for the check at startup, which only speaks up about problems
+    if not os.path.exists(PFS_FILENAME):
+        return True
+    volume = open_volume()
+    if not volume.framed:
+        if not quiet:
+            print(f"fsck: {PFS_FILENAME}: {volume.magic} volumes have no checksums")
+        return True
+    checked, bad = volume.fsck()
+    return pfs_crc.report(PFS_FILENAME, checked, bad, quiet)
@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+import tempfile
+import argparse
+import contextlib
+import pfs_engines
+
+# Times the supplemental file system commands on every storage engine.
+#
+#   python pfs_bench.py [--files N] [--size BYTES] [engine ...]
+#
+# Each engine runs in a forked child inside its own empty directory, because
+# the engines keep state per process and each writes private.pfs in its own
+# format. Command output is discarded; only the timings are printed.
+
+PHASES = ["cp", "show", "ls", "merge", "rm"]
+
+
+def make_sources(count, size):
+    line = "the quick brown fox jumps over the lazy dog\n"
+    text = (line * (size // len(line) + 1))[:size]
+    names = []
+    for i in range(count):
+        name = f"src{i}.txt"
+        with open(name, "w") as f:
+            # a different first line per file, so deduplicating engines still store each one
+            f.write(f"file {i}\n" + text)
+        names.append(name)
+    return names
+
+
+def run(name, count, size):
+    sources = make_sources(count, size)
+    engine = pfs_engines.open_engine(name)
+    steps = {
+        "cp": [(engine.cp, (src, f"+f{i}")) for i, src in enumerate(sources)],
+        "show": [(engine.show, (f"+f{i}",)) for i in range(count)],
+        "ls": [(engine.ls, (f"+f{i}",)) for i in range(count)],
+        "merge": [(engine.merge, (f"+f{i}", f"+f{(i + 1) % count}", f"+m{i}")) for i in range(count)],
+        "rm": [(engine.rm, (f"+f{i}",)) for i in range(count)],
+    }
+    timings = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for phase in PHASES:
+            start = time.perf_counter()
+            for command, args in steps[phase]:
+                command(*args)
+            timings.append(time.perf_counter() - start)
+    size_on_disk = os.path.getsize("private.pfs") if os.path.exists("private.pfs") else 0
+    engine.close()
+    cells = "".join(f"{t * 1000:>10.1f}" for t in timings)
+    print(f"{name:<10}{cells}{size_on_disk:>12}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the private.pfs storage engines.")
+    parser.add_argument("engines", nargs="*", default=list(pfs_engines.ENGINES))
+    parser.add_argument("--files", type=int, default=20)
+    parser.add_argument("--size", type=int, default=4096)
+    options = parser.parse_args()
+
+    print(f"{options.files} files of {options.size} bytes, milliseconds per phase")
+    print(f"{'engine':<10}" + "".join(f"{phase:>10}" for phase in PHASES) + f"{'pfs bytes':>12}")
+    for name in options.engines:
+        if name not in pfs_engines.ENGINES:
+            print(f"{name:<10}unknown engine")
+            continue
+        pid = os.fork()
+        if pid == 0:
+            try:
+                with tempfile.TemporaryDirectory() as workdir:
+                    os.chdir(workdir)
+                    run(name, options.files, options.size)
+            except Exception as e:
+                print(f"{name:<10}failed: {e!r}", flush=True)
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    main()
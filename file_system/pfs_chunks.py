@@ -0,0 +1,196 @@
+import os
+import lzma
+import zlib
+import struct
+import hashlib
+
+# Content-addressed chunk storage shared by pfs_log and supplemental_fs_2.
+#
+# File content is cut into CHUNK_SIZE pieces and each distinct piece is stored
+# once. A file is then a recipe: the volume offsets of its chunks, packed as
+# CHUNK_REF. Every chunk but the last is CHUNK_SIZE long, so the content size
+# alone says how long the recipe is and how long each chunk is.
+#
+# private.pfs.chunks maps the digest of every stored blob (chunks and recipes)
+# to where it lives. It is only a cache: a hit is compared against the bytes
+# in the volume before it is reused, so a stale or missing index only costs
+# deduplication, never correctness.
+#
+# Packed recipes also compress each chunk. Their references carry the stored
+# length and a codec byte, picked per chunk by compressing a sample of it.
+
+CHUNK_SIZE = 64 * 1024
+CHUNK_REF = struct.Struct("<Q")
+# packed reference: offset, stored length, codec
+PACKED_REF = struct.Struct("<QIB")
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_LZMA = 2
+
+PROBE_SIZE = 16 * 1024
+# a sample that zlib shrinks less than this is stored raw
+MIN_RATIO = 1.1
+# text this redundant gets lzma, whose better ratio pays for its speed
+LZMA_RATIO = 4.0
+
+INDEX_MAGIC = b"PFSCHK1\n"
+# index entry: digest, offset, length
+INDEX_ENTRY = struct.Struct("<32sQQ")
+
+
+def digest(data):
+    return hashlib.sha256(data).digest()
+
+
+def split(data):
+    return [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+
+
+def chunk_count(size):
+    return (size + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+
+def choose_codec(data):
+    """Pick a codec from how well a fast zlib pass shrinks the start of data."""
+    sample = data[:PROBE_SIZE]
+    if not sample:
+        return CODEC_RAW
+    ratio = len(sample) / len(zlib.compress(sample, 1))
+    if ratio < MIN_RATIO:
+        return CODEC_RAW
+    if ratio >= LZMA_RATIO:
+        return CODEC_LZMA
+    return CODEC_ZLIB
+
+
+def encode(data):
+    """Compress data with the codec the probe picks; returns (codec, payload)."""
+    codec = choose_codec(data)
+    if codec == CODEC_ZLIB:
+        payload = zlib.compress(data, 6)
+    elif codec == CODEC_LZMA:
+        payload = lzma.compress(data)
+    else:
+        return CODEC_RAW, data
+    if len(payload) >= len(data):
+        return CODEC_RAW, data
+    return codec, payload
+
+
+def decode(payload, codec):
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(payload)
+    if codec == CODEC_LZMA:
+        return lzma.decompress(payload)
+    return payload
+
+
+def decode_stream(blocks, codec):
+    """Decompress a payload that arrives as an iterable of blocks, block by block."""
+    if codec == CODEC_RAW:
+        yield from blocks
+        return
+    decompressor = zlib.decompressobj() if codec == CODEC_ZLIB else lzma.LZMADecompressor()
+    for block in blocks:
+        data = decompressor.decompress(block)
+        if data:
+            yield data
+    if codec == CODEC_ZLIB:
+        data = decompressor.flush()
+        if data:
+            yield data
+
+
+class ChunkIndex:
+    def __init__(self, volume_path):
+        self.path = volume_path + ".chunks"
+        self.table = None
+
+    def _load(self):
+        if self.table is not None:
+            return self.table
+        self.table = {}
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b""
+        if not data.startswith(INDEX_MAGIC):
+            with open(self.path, "wb") as f:
+                f.write(INDEX_MAGIC)
+            return self.table
+        pos = len(INDEX_MAGIC)
+        while pos + INDEX_ENTRY.size <= len(data):
+            key, offset, length = INDEX_ENTRY.unpack_from(data, pos)
+            self.table[key] = (offset, length)
+            pos += INDEX_ENTRY.size
+        return self.table
+
+    def find(self, data, read):
+        """Offset of a stored copy of data, or None; read(offset, length) reads the volume."""
+        location = self._load().get(digest(data))
+        if location is None or location[1] != len(data):
+            return None
+        if read(*location) != data:
+            return None
+        return location[0]
+
+    def add(self, data, offset):
+        key = digest(data)
+        self._load()[key] = (offset, len(data))
+        with open(self.path, "ab") as f:
+            f.write(INDEX_ENTRY.pack(key, offset, len(data)))
+
+    def reset(self):
+        # the volume was rewritten, so none of the recorded offsets hold
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.table = None
+
+
+def store_blob(data, index, read, append):
+    offset = index.find(data, read)
+    if offset is None:
+        offset = append(data)
+        index.add(data, offset)
+    return offset
+
+
+def store(data, index, read, append, packed=False):
+    """Store data as deduplicated chunks and return the offset of its recipe.
+
+    Identical content yields an identical recipe, which is itself only stored
+    once, so storing a file that is already in the volume appends nothing.
+    The codec is chosen per chunk from the chunk alone, so identical chunks
+    still compress to identical bytes and deduplicate.
+    """
+    refs = []
+    for chunk in split(data):
+        if packed:
+            codec, payload = encode(chunk)
+            refs.append(PACKED_REF.pack(store_blob(payload, index, read, append), len(payload), codec))
+        else:
+            refs.append(CHUNK_REF.pack(store_blob(chunk, index, read, append)))
+    return store_blob(b"".join(refs), index, read, append)
+
+
+def stream(offset, size, read, packed=False):
+    """Yield the content stored at offset one decompressed chunk at a time."""
+    count = chunk_count(size)
+    if not count:
+        return
+    ref = PACKED_REF if packed else CHUNK_REF
+    recipe = read(offset, count * ref.size)
+    for i in range(count):
+        if packed:
+            chunk_offset, length, codec = PACKED_REF.unpack_from(recipe, i * ref.size)
+            yield decode(read(chunk_offset, length), codec)
+        else:
+            chunk_offset, = CHUNK_REF.unpack_from(recipe, i * ref.size)
+            yield read(chunk_offset, min(CHUNK_SIZE, size - i * CHUNK_SIZE))
+
+
+def load(offset, size, read, packed=False):
+    """Reassemble size bytes of content from the recipe at offset."""
+    return b"".join(stream(offset, size, read, packed))
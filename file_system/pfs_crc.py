@@ -0,0 +1,101 @@
+import os
+import zlib
+import struct
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# CRC32 checks shared by the private.pfs backends.
+#
+# verify() checks many blocks of a volume at once. Nearby blocks are read as
+# one span with a single pread, and spans are checked by a pool of threads.
+# Both pread and zlib.crc32 release the GIL, so a scan runs at about disk
+# bandwidth and is cheap enough to do when a shell starts.
+
+TRAILER = struct.Struct("<I")
+# blocks closer together than this are read in one pread
+SPAN_GAP = 64 * 1024
+SPAN_SIZE = 4 * 1024 * 1024
+WORKERS = min(8, (os.cpu_count() or 1) + 2)
+
+# crc None means the checksum is the TRAILER right after the block; seed is
+# the CRC of anything that was checksummed along with the block but is not in it
+Block = namedtuple("Block", "offset length crc seed", defaults=(None, 0))
+
+
+class ChecksumError(ValueError):
+    pass
+
+
+def crc32(data, seed=0):
+    return zlib.crc32(data, seed)
+
+
+def seal(data):
+    """data followed by its CRC32 trailer."""
+    return data + TRAILER.pack(crc32(data))
+
+
+def unseal(data, where=""):
+    """Strip and check the trailer that seal() added."""
+    body = data[:-TRAILER.size]
+    if len(data) < TRAILER.size or TRAILER.unpack(data[-TRAILER.size:])[0] != crc32(body):
+        raise ChecksumError(f"checksum mismatch {where}".strip())
+    return body
+
+
+def _block_ok(span, start, block):
+    begin = block.offset - start
+    data = span[begin:begin + block.length]
+    if len(data) != block.length:
+        return False
+    expected = block.crc
+    if expected is None:
+        trailer = span[begin + block.length:begin + block.length + TRAILER.size]
+        if len(trailer) != TRAILER.size:
+            return False
+        expected, = TRAILER.unpack(trailer)
+    return crc32(data, block.seed) == expected
+
+
+def _check_span(fd, blocks):
+    start = blocks[0].offset
+    end = max(b.offset + b.length + (TRAILER.size if b.crc is None else 0) for b in blocks)
+    span = os.pread(fd, end - start, start)
+    return [b for b in blocks if not _block_ok(span, start, b)]
+
+
+def _spans(blocks):
+    span = []
+    end = 0
+    for block in sorted(set(blocks)):
+        block_end = block.offset + block.length + TRAILER.size
+        if span and (block.offset - end > SPAN_GAP or block_end - span[0].offset > SPAN_SIZE):
+            yield span
+            span = []
+        span.append(block)
+        end = max(end, block_end) if len(span) > 1 else block_end
+    if span:
+        yield span
+
+
+def verify(path, blocks):
+    """Return the blocks of path whose checksum does not match."""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        with ThreadPoolExecutor(WORKERS) as pool:
+            results = pool.map(lambda span: _check_span(fd, span), _spans(blocks))
+            return [block for bad in results for block in bad]
+    finally:
+        os.close(fd)
+
+
+def report(name, checked, bad, quiet=False):
+    """Print the result of a check; with quiet only problems are printed."""
+    if bad:
+        print(f"fsck: {name}: {len(bad)} of {checked} blocks are corrupt")
+        for block in bad[:10]:
+            size = f" ({block.length} bytes)" if block.length else ""
+            print(f"fsck:   block at offset {block.offset}{size}")
+    elif not quiet:
+        print(f"fsck: {name}: {checked} blocks ok")
+    return not bad
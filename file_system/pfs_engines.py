@@ -0,0 +1,321 @@
+import sys
+from typing import Protocol
+
+# One interface over the private.pfs backends, so a shell can run any of them.
+#
+# Every engine takes the same '+path' arguments for the seven commands. Its
+# module is only imported when the engine is opened: each one has its own
+# on-disk format and some create or migrate private.pfs on import, so a shell
+# must only touch the engine it runs. A volume written by one engine is not
+# readable by another.
+#
+# Shells pick an engine with `--engine NAME` (see select()); without the flag
+# they keep the engine they were written for.
+
+
+class StorageEngine(Protocol):
+    """The supplemental file system commands. Paths in private.pfs start with '+'.
+
+    Engines subclass this; a command an engine does not have prints that it
+    is not supported.
+    """
+    name = None
+
+    def cp(self, src, dst):
+        self._unsupported("cp")
+
+    def show(self, path):
+        self._unsupported("show")
+
+    def ls(self, path):
+        self._unsupported("ls")
+
+    def mkdir(self, path):
+        self._unsupported("mkdir")
+
+    def rmdir(self, path):
+        self._unsupported("rmdir")
+
+    def rm(self, path):
+        self._unsupported("rm")
+
+    def merge(self, src1, src2, dst):
+        self._unsupported("merge")
+
+    def snapshot(self, name=None):
+        self._unsupported("snapshot")
+
+    def fsck(self, quiet=False):
+        # the startup check stays quiet about engines that cannot check anything
+        if not quiet:
+            self._unsupported("fsck")
+        return True
+
+    def close(self):
+        pass
+
+    def _unsupported(self, command):
+        print(f"{command}: not supported by the {self.name} engine")
+
+
+ENGINES = {}
+
+
+def register(name):
+    """Class decorator that adds a StorageEngine to the registry under name."""
+    def add(cls):
+        cls.name = name
+        ENGINES[name] = cls
+        return cls
+    return add
+
+
+def open_engine(name):
+    if name not in ENGINES:
+        raise KeyError(f"unknown storage engine '{name}' (choose from {', '.join(ENGINES)})")
+    return ENGINES[name]()
+
+
+def select(argv, default):
+    """Open the engine named by '--engine NAME' or '--engine=NAME' in argv, or default.
+
+    The flag is removed from argv, so the shell sees its usual arguments.
+    """
+    name = default
+    for i, word in enumerate(argv):
+        if word.startswith("--engine="):
+            name = word.split("=", 1)[1]
+            del argv[i]
+            break
+        if word == "--engine" and i + 1 < len(argv):
+            name = argv[i + 1]
+            del argv[i:i + 2]
+            break
+    try:
+        return open_engine(name)
+    except KeyError as e:
+        sys.exit(f"Error: {e.args[0]}")
+
+
+@register("log")
+class LogEngine(StorageEngine):
+    """pfs.py: one metadata block per change in a LogVolume (shell_martinez)."""
+
+    def __init__(self):
+        import pfs
+        self.fs = pfs
+
+    def _change(self, command, *args):
+        # held from read_metadata() to write_metadata(), so a concurrent writer's update is not lost
+        with self.fs.writing():
+            command(*args)
+
+    def cp(self, src, dst):
+        self._change(self.fs.cp_pfs, src, dst)
+
+    def show(self, path):
+        self.fs.show_pfs(path)
+
+    def ls(self, path):
+        self.fs.ls_pfs(path)
+
+    def mkdir(self, path):
+        self._change(self.fs.mkdir_pfs, path)
+
+    def rmdir(self, path):
+        self._change(self.fs.rmdir_pfs, path)
+
+    def rm(self, path):
+        self._change(self.fs.rm_pfs, path)
+
+    def merge(self, src1, src2, dst):
+        self._change(self.fs.merge_pfs, src1, src2, dst)
+
+    def snapshot(self, name=None):
+        self._change(self.fs.snapshot_pfs, name)
+
+    def fsck(self, quiet=False):
+        return self.fs.fsck_pfs(quiet)
+
+
+@register("index")
+class IndexEngine(StorageEngine):
+    """file_system_logic.py: a path index per change in a LogVolume (shell_rodriguez)."""
+
+    def __init__(self):
+        import file_system_logic
+        self.fs = file_system_logic
+        self.fs.open_or_create_pfs()
+
+    def _read(self, command, *args):
+        self.fs.load_index()
+        command(*args)
+
+    def _change(self, command, *args):
+        # held from load to commit, so a concurrent writer's update is not lost
+        with self.fs.writing():
+            self.fs.load_index()
+            command(*args)
+
+    def cp(self, src, dst):
+        self._change(self.fs.cp, src, dst)
+
+    def show(self, path):
+        self._read(self.fs.show, path)
+
+    def ls(self, path):
+        self._read(self.fs.ls, path)
+
+    def mkdir(self, path):
+        self._change(self.fs.mkdir, path)
+
+    def rmdir(self, path):
+        self._change(self.fs.rmdir, path)
+
+    def rm(self, path):
+        self._change(self.fs.rm, path)
+
+    def merge(self, src1, src2, dst):
+        self._change(self.fs.merge, src1, src2, dst)
+
+    def snapshot(self, name=None):
+        with self.fs.writing():
+            self.fs.snapshot(name)
+
+    def fsck(self, quiet=False):
+        return self.fs.fsck(quiet)
+
+
+@register("tree")
+class TreeEngine(StorageEngine):
+    """supplemental_fs_2.py: copy-on-write directory tree (shell_nares)."""
+
+    def __init__(self):
+        import supplemental_fs_2
+        self.fs = supplemental_fs_2.pfs
+
+    def _read(self, command, *args):
+        self.fs.refresh()
+        command(*args)
+
+    def _change(self, command, *args):
+        with self.fs.writing():
+            command(*args)
+
+    def cp(self, src, dst):
+        self._change(self.fs.cp, src, dst)
+
+    def show(self, path):
+        self._read(self.fs.show, path)
+
+    def ls(self, path):
+        self._read(self.fs.ls, path)
+
+    def mkdir(self, path):
+        self._change(self.fs.mkdir, path)
+
+    def rmdir(self, path):
+        self._change(self.fs.rmdir, path)
+
+    def rm(self, path):
+        self._change(self.fs.rm, path)
+
+    def merge(self, src1, src2, dst):
+        self._change(self.fs.merge, src1, src2, dst)
+
+    def snapshot(self, name=None):
+        self._change(self.fs.snapshot, name)
+
+    def fsck(self, quiet=False):
+        self.fs.refresh()
+        return self.fs.fsck(quiet)
+
+    def close(self):
+        self.fs.close()
+
+
+@register("text")
+class TextEngine(StorageEngine):
+    """supplemental_fs.py: fixed-width metadata lines followed by content (shell_mondragon)."""
+
+    def __init__(self):
+        import supplemental_fs
+        self.fs = supplemental_fs
+
+    def cp(self, src, dst):
+        self.fs.cp(src, dst)
+
+    def show(self, path):
+        self.fs.show(path)
+
+    def ls(self, path):
+        self.fs.ls(path)
+
+    def mkdir(self, path):
+        self.fs.mkdir(path)
+
+    def rmdir(self, path):
+        self.fs.rmdir(path)
+
+    def rm(self, path):
+        self.fs.rm(path)
+
+    def merge(self, src1, src2, dst):
+        self.fs.merge(src1, src2, dst)
+
+    def fsck(self, quiet=False):
+        return self.fs.fsck(quiet)
+
+
+@register("lines")
+class LinesEngine(StorageEngine):
+    """fsCommands.py: one '|' separated record per line (shell_nahuat)."""
+
+    def __init__(self):
+        import fsCommands
+        self.fs = fsCommands
+        # fsCommands only creates private.pfs on the first cp
+        open(self.fs.PFS_FILENAME, "a").close()
+
+    def cp(self, src, dst):
+        self.fs.fs_cp(src, dst)
+
+    def show(self, path):
+        self.fs.fs_show(path)
+
+    def ls(self, path):
+        self.fs.fs_ls(path)
+
+    def mkdir(self, path):
+        self.fs.fs_mkdir(path)
+
+    def rmdir(self, path):
+        self.fs.fs_rmdir(path)
+
+    def rm(self, path):
+        self.fs.fs_rm(path)
+
+    def merge(self, src1, src2, dst):
+        self.fs.fs_merge(src1, src2, dst)
+
+
+@register("sections")
+class SectionsEngine(StorageEngine):
+    """pfs_commands.py: FILES, DIRS and DATA sections (shell_sandante); has no rm, mkdir or rmdir."""
+
+    def __init__(self):
+        import pfs_commands
+        self.fs = pfs_commands
+        self.fs.init_pfs()
+
+    def cp(self, src, dst):
+        self.fs.pfs_cp(src, dst)
+
+    def show(self, path):
+        self.fs.pfs_show(path)
+
+    def ls(self, path):
+        self.fs.pfs_ls(path)
+
+    def merge(self, src1, src2, dst):
+        self.fs.pfs_merge(src1, src2, dst)
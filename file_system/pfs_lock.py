@@ -0,0 +1,68 @@
+import os
+import fcntl
+from contextlib import contextmanager
+
+# fcntl range locks that let several shells share one private.pfs.
+#
+# The locks live on private.pfs.lock rather than the volume, which migration
+# replaces with a new file. Each byte of the lock file guards one part of the
+# volume:
+#   HEADER  the root pointers: shared while reading them, exclusive while a
+#           writer swaps them
+#   APPEND  the end of the volume: exclusive for the whole of a change, so
+#           writers take turns and never lose each other's updates
+# Everything before the end of the volume is never rewritten, so readers need
+# no lock on it and only wait for a writer while it swaps the header.
+#
+# fcntl locks belong to the process and are all dropped when any descriptor of
+# the file is closed, so there is one VolumeLock per volume per process and its
+# descriptor stays open. Holding a region again from inside it is a no-op.
+
+HEADER = 0
+APPEND = 1
+
+_locks = {}
+
+
+def for_volume(volume_path):
+    path = os.path.abspath(volume_path)
+    if path not in _locks:
+        _locks[path] = VolumeLock(path)
+    return _locks[path]
+
+
+class VolumeLock:
+    def __init__(self, volume_path):
+        self.path = volume_path + ".lock"
+        self.fd = None
+        # region -> True if held exclusively
+        self.held = {}
+
+    @contextmanager
+    def _hold(self, region, exclusive):
+        if region in self.held:
+            if exclusive and not self.held[region]:
+                raise RuntimeError("a shared lock cannot be upgraded to an exclusive one")
+            yield
+            return
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH, 1, region)
+        self.held[region] = exclusive
+        try:
+            yield
+        finally:
+            del self.held[region]
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, 1, region)
+
+    def reading(self):
+        """Read the root pointers without a writer swapping them underneath."""
+        return self._hold(HEADER, False)
+
+    def swapping(self):
+        """Rewrite the root pointers."""
+        return self._hold(HEADER, True)
+
+    def writing(self):
+        """Make a change; only one process at a time appends to the volume."""
+        return self._hold(APPEND, True)
@@ -0,0 +1,240 @@
+import os
+import mmap
+import time
+import struct
+import pfs_crc
+import pfs_lock
+import pfs_chunks
+
+# Log-structured private.pfs shared by pfs.py and file_system_logic.py.
+#
+# The file starts with a fixed-width header line holding the offset and length
+# of the current metadata block and of the snapshot table. File content and
+# metadata blocks are only ever appended, so nothing a metadata block points at
+# is overwritten later. A commit appends a new metadata block and rewrites the
+# header with one pwrite. A snapshot records the current metadata block under a
+# name, which stays readable while the live tree keeps changing.
+#
+# Content goes through pfs_chunks, so every distinct chunk is stored once and
+# a metadata entry's (offset, size) is the offset of a recipe plus the content
+# size. Chunks are compressed with the codec pfs_chunks picks for each one.
+#
+# Every blob appended after the header is framed as FRAME (its length), the
+# blob, and a CRC32 trailer. read() checks the trailer, and fsck() walks the
+# frames from the header to the end of the file and checks them all. The
+# header itself only holds offsets and lengths, which are caught by the frame
+# they point at.
+#
+# Several processes may share a volume. Changes hold the pfs_lock writer lock,
+# so appends and commits never interleave, and the header is read and
+# rewritten under its range lock. Readers take no other lock: nothing a header
+# points at is ever rewritten.
+#
+# Older volumes keep the layout they were created with: PFSLOG3 blobs are not
+# framed, PFSLOG2 chunks are uncompressed and PFSLOG1 content is not chunked.
+
+MAGIC = "PFSLOG4"
+UNFRAMED_MAGIC = "PFSLOG3"
+UNCOMPRESSED_MAGIC = "PFSLOG2"
+UNCHUNKED_MAGIC = "PFSLOG1"
+# magic -> (chunked, packed, framed)
+FORMATS = {
+    MAGIC: (True, True, True),
+    UNFRAMED_MAGIC: (True, True, False),
+    UNCOMPRESSED_MAGIC: (True, False, False),
+    UNCHUNKED_MAGIC: (False, False, False),
+}
+FRAME = struct.Struct("<Q")
+HEADER_FORMAT = "{magic} {root:016d} {root_len:016d} {snaps:016d} {snaps_len:016d}\n"
+HEADER_SIZE = len(HEADER_FORMAT.format(magic=MAGIC, root=0, root_len=0, snaps=0, snaps_len=0))
+
+
+class LogVolume:
+    def __init__(self, path, legacy=None):
+        # legacy(volume, data) moves an old-format file into the new volume
+        self.path = os.path.abspath(path)
+        self.chunks = pfs_chunks.ChunkIndex(self.path)
+        self.lock = pfs_lock.for_volume(self.path)
+        self.magic = self._magic()
+        if self.magic not in FORMATS:
+            # checked again under the locks, another shell may be doing this too
+            with self.lock.writing(), self.lock.swapping():
+                self.magic = self._magic()
+                if self.magic is None:
+                    self._create(self.path)
+                    self.chunks.reset()
+                    self.magic = MAGIC
+                elif self.magic not in FORMATS:
+                    self._migrate(legacy)
+        self.chunked, self.packed, self.framed = FORMATS[self.magic]
+
+    def _magic(self):
+        try:
+            with open(self.path, "rb") as f:
+                return f.read(len(MAGIC)).decode(errors="replace")
+        except FileNotFoundError:
+            return None
+
+    def _migrate(self, legacy):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.chunks.reset()
+        real = self.path
+        self.path = real + ".tmp"
+        self._create(self.path)
+        self.magic = MAGIC
+        self.chunked, self.packed, self.framed = FORMATS[MAGIC]
+        if legacy:
+            legacy(self, data)
+        os.replace(self.path, real)
+        self.path = real
+
+    def _create(self, path):
+        with open(path, "wb") as f:
+            f.write(HEADER_FORMAT.format(magic=MAGIC, root=0, root_len=0, snaps=0, snaps_len=0).encode())
+
+    def _header(self):
+        with self.lock.reading(), open(self.path, "rb") as f:
+            fields = f.read(HEADER_SIZE).decode().split()
+        return [int(field) for field in fields[1:]]
+
+    def _write_header(self, root, root_len, snaps, snaps_len):
+        header = HEADER_FORMAT.format(magic=self.magic, root=root, root_len=root_len,
+                                      snaps=snaps, snaps_len=snaps_len)
+        with self.lock.swapping():
+            fd = os.open(self.path, os.O_WRONLY)
+            try:
+                os.pwrite(fd, header.encode(), 0)
+            finally:
+                os.close(fd)
+
+    def append(self, data):
+        """Append a blob and return the offset of its first byte."""
+        with self.lock.writing(), open(self.path, "ab") as f:
+            offset = f.tell()
+            if self.framed:
+                f.write(FRAME.pack(len(data)) + pfs_crc.seal(data))
+                return offset + FRAME.size
+            f.write(data)
+        return offset
+
+    def read(self, offset, length):
+        with open(self.path, "rb") as f:
+            return self._read(f.fileno(), offset, length)
+
+    def _read(self, fd, offset, length):
+        if not self.framed:
+            return os.pread(fd, length, offset)
+        frame = os.pread(fd, FRAME.size + length + pfs_crc.TRAILER.size, offset - FRAME.size)
+        if len(frame) < FRAME.size or FRAME.unpack_from(frame)[0] != length:
+            raise pfs_crc.ChecksumError(f"{self.path}: no block of {length} bytes at offset {offset}")
+        return pfs_crc.unseal(frame[FRAME.size:], f"in {self.path} at offset {offset}")
+
+    def store(self, data):
+        """Store file content and return the offset to keep in its metadata entry."""
+        if not self.chunked:
+            return self.append(data)
+        with self.lock.writing():
+            return pfs_chunks.store(data, self.chunks, self._find_read, self.append, packed=self.packed)
+
+    def _find_read(self, offset, length):
+        # the chunk index is only a hint, so a bad block just means no match
+        try:
+            return self.read(offset, length)
+        except pfs_crc.ChecksumError:
+            return None
+
+    def stream(self, offset, size):
+        """Yield the content stored at offset by store(), a chunk at a time."""
+        if not self.chunked:
+            yield self.read(offset, size)
+            return
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            def read(off, length):
+                return self._read(fd, off, length)
+            yield from pfs_chunks.stream(offset, size, read, packed=self.packed)
+        finally:
+            os.close(fd)
+
+    def load(self, offset, size):
+        """Read back the content stored at offset by store()."""
+        return b"".join(self.stream(offset, size))
+
+    def root(self, snapshot=None):
+        """The current metadata block, or the one frozen by a snapshot."""
+        if snapshot is None:
+            root, root_len, _, _ = self._header()
+        else:
+            snaps = self.snapshots()
+            if snapshot not in snaps:
+                raise KeyError(snapshot)
+            root, root_len, _ = snaps[snapshot]
+        return self.read(root, root_len) if root_len else b""
+
+    def commit(self, block):
+        with self.lock.writing():
+            root = self.append(block)
+            _, _, snaps, snaps_len = self._header()
+            self._write_header(root, len(block), snaps, snaps_len)
+
+    def snapshots(self):
+        _, _, snaps, snaps_len = self._header()
+        table = {}
+        for line in self.read(snaps, snaps_len).decode().splitlines() if snaps_len else []:
+            name, offset, length, timestamp = line.split("|")
+            table[name] = (int(offset), int(length), int(timestamp))
+        return table
+
+    def snapshot(self, name):
+        """Freeze the current metadata block under name."""
+        if not name or "|" in name or "@" in name or "\n" in name:
+            raise ValueError(f"invalid snapshot name '{name}'")
+        with self.lock.writing():
+            table = self.snapshots()
+            if name in table:
+                raise ValueError(f"snapshot '{name}' already exists")
+            root, root_len, _, _ = self._header()
+            table[name] = (root, root_len, int(time.time()))
+            lines = "".join(f"{n}|{o}|{l}|{t}\n" for n, (o, l, t) in table.items()).encode()
+            snaps = self.append(lines)
+            self._write_header(root, root_len, snaps, len(lines))
+
+    def fsck(self):
+        """Check every block in the volume; returns (blocks checked, bad blocks).
+
+        The frames are walked through an mmap to find the blocks, which are
+        then checked by pfs_crc.verify in parallel. A frame that runs past the
+        end of the file (a torn append) is reported as a bad block too.
+        Only what was in the volume when no change was under way is checked,
+        so another shell's append in progress does not look torn.
+        Volumes without frames have nothing to check.
+        """
+        if not self.framed:
+            return 0, []
+        blocks = []
+        bad = []
+        with open(self.path, "rb") as f:
+            with self.lock.writing():
+                size = os.fstat(f.fileno()).st_size
+            if size <= HEADER_SIZE:
+                return 0, []
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as view:
+                pos = HEADER_SIZE
+                while pos < size:
+                    length = FRAME.unpack_from(view, pos)[0] if pos + FRAME.size <= size else size
+                    end = pos + FRAME.size + length + pfs_crc.TRAILER.size
+                    if end > size:
+                        bad.append(pfs_crc.Block(pos, size - pos))
+                        break
+                    blocks.append(pfs_crc.Block(pos + FRAME.size, length))
+                    pos = end
+        return len(blocks) + len(bad), pfs_crc.verify(self.path, blocks) + bad
+
+
+def split_snapshot(path):
+    """Split '+dir/file@name' into ('+dir/file', 'name'); no '@' means the live tree."""
+    if "@" in path:
+        path, name = path.rsplit("@", 1)
+        return path, name
+    return path, None
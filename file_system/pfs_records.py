@@ -0,0 +1,285 @@
+import os
+import time
+import struct
+import pfs_chunks
+from collections import namedtuple
+
+# Length-prefixed record store for private.pfs, shared by shell_galvan and shell_corona.
+#
+# private.pfs is MAGIC followed by one record per write:
+#   kind (F, D, or X once deleted) | codec | name length | timestamp |
+#   content length | stored length | name | stored content
+# Content is stored as bytes, so newlines and '|' need no escaping, and is
+# compressed with the pfs_chunks codec a probe of it picks.
+#
+# private.pfs.idx is an append-only log of name -> record, so opening the store
+# never scans the volume and reading a file is a single pread of its content.
+
+MAGIC = b"PFSREC2\n"
+RECORD = struct.Struct("<cBHQQQ")
+# PFSREC1 records had no codec and were always raw; migrated on load
+V1_MAGIC = b"PFSREC1\n"
+V1_RECORD = struct.Struct("<cHQQ")
+INDEX_MAGIC = b"PRX2"
+# index header: magic, volume size the index covers, dead bytes in the volume
+INDEX_HEADER = struct.Struct("<4sQQ")
+# index entry: record offset, timestamp, content length, stored length, kind (X = removed), codec, name length
+INDEX_ENTRY = struct.Struct("<QQQQcBH")
+
+FILE = b"F"
+DIR = b"D"
+DELETED = b"X"
+
+# compact once this many bytes are dead and they are over half the volume
+COMPACT_MIN_DEAD = 64 * 1024
+# stream() reads stored content this much at a time
+STREAM_BLOCK = 1024 * 1024
+
+# offset is where the record starts, the content follows the name; size is
+# the content length and stored its length on disk
+Entry = namedtuple("Entry", "kind offset timestamp size name_len codec stored")
+
+
+def content_offset(entry):
+    return entry.offset + RECORD.size + entry.name_len
+
+
+def record_length(entry):
+    return RECORD.size + entry.name_len + entry.stored
+
+
+class RecordStore:
+    def __init__(self, path="private.pfs", legacy=None):
+        # legacy(text) yields (kind, name, timestamp, content) for an old volume
+        self.path = os.path.abspath(path)
+        self.index_path = self.path + ".idx"
+        self.legacy = legacy
+        self.entries = {}
+        self.dead = 0
+        self.stamp = None
+
+    def _stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self):
+        if os.path.exists(self.path) and self.stamp == self._stamp():
+            return self
+        if not os.path.exists(self.path):
+            with open(self.path, "wb") as f:
+                f.write(MAGIC)
+        with open(self.path, "rb") as f:
+            magic = f.read(len(MAGIC))
+        if magic != MAGIC:
+            self._migrate()
+        if not self._read_index():
+            self._rebuild_index()
+        self.stamp = self._stamp()
+        return self
+
+    def _migrate(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if data.startswith(V1_MAGIC):
+            records = read_v1_records(data)
+        elif self.legacy is None:
+            raise ValueError(f"{self.path} is not a record store")
+        else:
+            records = self.legacy(data.decode())
+        with open(self.path + ".tmp", "wb") as out:
+            out.write(MAGIC)
+            for kind, name, timestamp, content in records:
+                out.write(pack_record(kind, name, timestamp, content))
+        os.replace(self.path + ".tmp", self.path)
+        if os.path.exists(self.index_path):
+            os.remove(self.index_path)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        if len(data) < INDEX_HEADER.size:
+            return False
+        magic, size, dead = INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or size != os.path.getsize(self.path):
+            return False
+        entries = {}
+        pos = INDEX_HEADER.size
+        while pos + INDEX_ENTRY.size <= len(data):
+            offset, timestamp, length, stored, kind, codec, name_len = INDEX_ENTRY.unpack_from(data, pos)
+            pos += INDEX_ENTRY.size
+            name = data[pos:pos + name_len].decode()
+            pos += name_len
+            if kind == DELETED:
+                entries.pop(name, None)
+            else:
+                entries[name] = Entry(kind, offset, timestamp, length, name_len, codec, stored)
+        self.entries = entries
+        self.dead = dead
+        return True
+
+    def _rebuild_index(self):
+        # only runs when the index is missing or does not match the volume
+        entries = {}
+        dead = 0
+        with open(self.path, "rb") as f:
+            data = f.read()
+        pos = len(MAGIC)
+        while pos + RECORD.size <= len(data):
+            kind, codec, name_len, timestamp, length, stored = RECORD.unpack_from(data, pos)
+            name = data[pos + RECORD.size:pos + RECORD.size + name_len].decode()
+            entry = Entry(kind, pos, timestamp, length, name_len, codec, stored)
+            if kind == DELETED:
+                dead += record_length(entry)
+            else:
+                if name in entries:
+                    dead += record_length(entries[name])
+                entries[name] = entry
+            pos += record_length(entry)
+        self.entries = entries
+        self.dead = dead
+        self._write_index()
+
+    def _write_index(self):
+        with open(self.index_path + ".tmp", "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, os.path.getsize(self.path), self.dead))
+            for name, entry in self.entries.items():
+                f.write(pack_index_entry(name, entry))
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def _log(self, name, entry):
+        with open(self.index_path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            f.write(pack_index_entry(name, entry))
+            f.seek(0)
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, os.path.getsize(self.path), self.dead))
+        self.stamp = self._stamp()
+
+    def get(self, name):
+        return self.load().entries.get(name)
+
+    def read(self, name):
+        entry = self.get(name)
+        if entry is None:
+            return None
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            return pfs_chunks.decode(os.pread(fd, entry.stored, content_offset(entry)), entry.codec)
+        finally:
+            os.close(fd)
+
+    def stream(self, name):
+        """Yield the content of name in decompressed pieces, without holding all of it."""
+        entry = self.get(name)
+        if entry is None:
+            return
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            yield from pfs_chunks.decode_stream(_blocks(fd, content_offset(entry), entry.stored), entry.codec)
+        finally:
+            os.close(fd)
+
+    def items(self):
+        # live entries in the order they were written
+        return sorted(self.load().entries.items(), key=lambda item: item[1].offset)
+
+    def write(self, kind, name, content=b"", timestamp=None):
+        self.load()
+        if name in self.entries:
+            self._kill(name)
+        if timestamp is None:
+            timestamp = int(time.time())
+        record = pack_record(kind, name, timestamp, content)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND)
+        try:
+            offset = os.fstat(fd).st_size
+            os.write(fd, record)
+        finally:
+            os.close(fd)
+        entry = unpack_entry(record, offset)
+        self.entries[name] = entry
+        self._log(name, entry)
+        self.compact()
+        return entry
+
+    def remove(self, name):
+        if self.get(name) is None:
+            return False
+        self._kill(name)
+        self.compact()
+        return True
+
+    def _kill(self, name):
+        # flips the kind byte in place, the bytes are reclaimed by compact()
+        entry = self.entries.pop(name)
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, DELETED, entry.offset)
+        finally:
+            os.close(fd)
+        self.dead += record_length(entry)
+        self._log(name, entry._replace(kind=DELETED))
+
+    def compact(self):
+        if self.dead < COMPACT_MIN_DEAD or self.dead * 2 <= os.path.getsize(self.path):
+            return
+        entries = {}
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            with open(self.path + ".tmp", "wb") as out:
+                out.write(MAGIC)
+                for name, entry in self.items():
+                    entries[name] = entry._replace(offset=out.tell())
+                    out.write(os.pread(fd, record_length(entry), entry.offset))
+        finally:
+            os.close(fd)
+        os.replace(self.path + ".tmp", self.path)
+        self.entries = entries
+        self.dead = 0
+        self._write_index()
+        self.stamp = self._stamp()
+
+
+def _blocks(fd, offset, length):
+    end = offset + length
+    while offset < end:
+        block = os.pread(fd, min(STREAM_BLOCK, end - offset), offset)
+        if not block:
+            return
+        yield block
+        offset += len(block)
+
+
+def pack_record(kind, name, timestamp, content):
+    name = name.encode()
+    codec, payload = pfs_chunks.encode(content)
+    return RECORD.pack(kind, codec, len(name), timestamp, len(content), len(payload)) + name + payload
+
+
+def unpack_entry(record, offset):
+    kind, codec, name_len, timestamp, length, stored = RECORD.unpack_from(record)
+    return Entry(kind, offset, timestamp, length, name_len, codec, stored)
+
+
+def read_v1_records(data):
+    """The live (kind, name, timestamp, content) records of a PFSREC1 volume, in write order."""
+    live = {}
+    pos = len(V1_MAGIC)
+    while pos + V1_RECORD.size <= len(data):
+        kind, name_len, timestamp, length = V1_RECORD.unpack_from(data, pos)
+        start = pos + V1_RECORD.size
+        name = data[start:start + name_len].decode()
+        content = data[start + name_len:start + name_len + length]
+        live.pop(name, None)
+        if kind != DELETED:
+            live[name] = (kind, name, timestamp, content)
+        pos = start + name_len + length
+    return list(live.values())
+
+
+def pack_index_entry(name, entry):
+    name = name.encode()
+    return INDEX_ENTRY.pack(entry.offset, entry.timestamp, entry.size, entry.stored,
+                            entry.kind, entry.codec, len(name)) + name
@@ -0,0 +1,385 @@
+import os
+import sys
+import time
+import mmap
+import struct
+
+# Append-only private.pfs shared by shell_valerio and shell_prine.
+#
+# private.pfs layout: a fixed header, then file contents appended one after
+# another with metadata blocks (DIR:/FILE: lines, byte offsets) among them.
+# The header points at the newest metadata block. A block either lists the
+# whole volume, or starts with PREV:<offset>:<length> and lists only what
+# changed since that block (-DIR:/-FILE: lines remove an entry), so a save
+# appends a few lines instead of a copy of all the metadata. Every CHECKPOINT
+# saves the whole list is written again, so a load follows a short chain.
+# Removed content and old metadata are dropped later by compact_private_fs.
+
+private_fs = "private.pfs"
+
+PFS_MAGIC = b"PFS2"
+HEADER = struct.Struct("<4sQQ")  # magic, metadata offset, metadata length
+HEADER_SIZE = 32
+COMPACT_MIN_BYTES = 64 * 1024
+CHECKPOINT = 32
+
+#the data region of private.pfs, memory mapped for reads and appended to for writes
+class DataStore:
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR)
+        st = os.fstat(self.fd)
+        self.inode = st.st_ino
+        self.end = st.st_size
+        self.map = None
+        # metadata as of the header last read or written; chain is the
+        # (offset, length) of each block it was read from, newest first
+        self.header = None
+        self.dirs = []
+        self.files = {}
+        self.chain = []
+
+    def read(self, offset, length):
+        if self.map is None or offset + length > len(self.map):
+            self.map = mmap.mmap(self.fd, 0, access=mmap.ACCESS_READ)
+        return memoryview(self.map)[offset:offset + length]
+
+    def append(self, content):
+        offset = self.end
+        os.pwrite(self.fd, content, offset)
+        self.end += len(content)
+        return offset
+
+    def close(self):
+        os.close(self.fd)
+        self.map = None
+
+store = None
+
+#the store for private.pfs in the current directory
+def get_store():
+    global store
+    # keyed on the absolute path, so after a cd the store and the checks in
+    # load_private_fs look at the same file; a compaction replaces the inode
+    path = os.path.abspath(private_fs)
+    if store is not None and (store.path != path or os.stat(path).st_ino != store.inode):
+        store.close()
+        store = None
+    if store is None:
+        store = DataStore(path)
+    else:
+        store.end = os.fstat(store.fd).st_size
+    return store
+
+def encode_metadata(dirs, files):
+    lines = [f"DIR:{d}\n" for d in dirs]
+    for path, (offset, length, timestamp) in files.items():
+        lines.append(f"FILE:{path}:{offset}:{length}:{timestamp}\n")
+    return "".join(lines).encode()
+
+#the lines that turn the old dirs and files into the new ones
+def encode_changes(old_dirs, old_files, dirs, files):
+    old_dir_set, dir_set = set(old_dirs), set(dirs)
+    lines = [f"-DIR:{d}\n" for d in old_dirs if d not in dir_set]
+    lines += [f"DIR:{d}\n" for d in dirs if d not in old_dir_set]
+    lines += [f"-FILE:{path}\n" for path in old_files if path not in files]
+    for path, entry in files.items():
+        if old_files.get(path) != entry:
+            offset, length, timestamp = entry
+            lines.append(f"FILE:{path}:{offset}:{length}:{timestamp}\n")
+    return "".join(lines).encode()
+
+#applies the lines of one metadata block to dirs and files
+def apply_metadata(block, dirs, files):
+    for line in block.splitlines():
+        if line.startswith("DIR:"):
+            dirname = line[len("DIR:"):].strip()
+            if dirname and dirname not in dirs:
+                dirs.append(dirname)
+        elif line.startswith("-DIR:"):
+            dirname = line[len("-DIR:"):].strip()
+            if dirname in dirs:
+                dirs.remove(dirname)
+        elif line.startswith("FILE:"):
+            parts = line[len("FILE:"):].split(":")
+            if len(parts) == 4:
+                path, offset, length, timestamp = parts
+                files.pop(path, None)
+                files[path] = [int(offset), int(length), int(timestamp)]
+        elif line.startswith("-FILE:"):
+            files.pop(line[len("-FILE:"):], None)
+
+#reads the metadata chain the header points at into the store
+def read_metadata(data, header):
+    _, offset, length = HEADER.unpack(header)
+    blocks = []
+    while True:
+        block = os.pread(data.fd, length, offset).decode()
+        blocks.append((offset, length, block))
+        if not block.startswith("PREV:"):
+            break
+        first = block[:block.index("\n")]
+        offset, length = (int(n) for n in first[len("PREV:"):].split(":"))
+    dirs = []
+    files = {}
+    for _, _, block in reversed(blocks):
+        apply_metadata(block, dirs, files)
+    data.header = header
+    data.dirs = dirs
+    data.files = files
+    data.chain = [(offset, length) for offset, length, _ in blocks]
+
+#writes a fresh volume holding only the given contents
+def write_volume(dirs, contents):
+    global store
+    files = {}
+    tmp = private_fs + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(b"\0" * HEADER_SIZE)
+        for path, (content, timestamp) in contents.items():
+            files[path] = [f.tell(), len(content), timestamp]
+            f.write(content)
+        meta_offset = f.tell()
+        meta = encode_metadata(dirs, files)
+        f.write(meta)
+        f.seek(0)
+        f.write(HEADER.pack(PFS_MAGIC, meta_offset, len(meta)))
+    os.replace(tmp, private_fs)
+    if store is not None:
+        store.close()
+        store = None
+
+#converts the old text layout (metadata, END, one text data block) once
+def migrate_private_fs():
+    with open(private_fs, 'r') as f:
+        text = f.read()
+    head, _, data = text.partition("END\n")
+    dirs = []
+    contents = {}
+    for line in head.splitlines():
+        if line.startswith("DIR:"):
+            dirname = line[len("DIR:"):].strip()
+            if dirname:
+                dirs.append(dirname)
+        elif line.startswith("FILE:"):
+            parts = line[len("FILE:"):].split(":")
+            if len(parts) == 4:
+                path, offset, length, timestamp = parts
+                offset, length = int(offset), int(length)
+                contents[path] = (data[offset:offset+length].encode(), int(timestamp))
+    write_volume(dirs, contents)
+
+def load_private_fs():
+    if not os.path.exists(private_fs):
+        # initialize with an empty metadata block
+        write_volume([], {})
+    with open(private_fs, 'rb') as f:
+        head = f.read(HEADER.size)
+    if not head.startswith(PFS_MAGIC):
+        migrate_private_fs()
+    data = get_store()
+    # the metadata is only parsed again when the header moved
+    header = os.pread(data.fd, HEADER.size, 0)
+    if header != data.header:
+        read_metadata(data, header)
+    return list(data.dirs), {path: list(entry) for path, entry in data.files.items()}, data
+
+
+def save_private_fs(dirs, files, data):
+    if len(data.chain) >= CHECKPOINT:
+        meta = encode_metadata(dirs, files)
+        chain = []
+    else:
+        offset, length = data.chain[0]
+        meta = f"PREV:{offset}:{length}\n".encode() + encode_changes(data.dirs, data.files, dirs, files)
+        chain = data.chain
+    meta_offset = data.append(meta)
+    header = HEADER.pack(PFS_MAGIC, meta_offset, len(meta))
+    os.pwrite(data.fd, header, 0)
+    data.header = header
+    data.dirs = list(dirs)
+    data.files = {path: list(entry) for path, entry in files.items()}
+    data.chain = [(meta_offset, len(meta))] + chain
+    live = HEADER_SIZE + sum(length for _, length in data.chain) + sum(length for _, length, _ in files.values())
+    dead = data.end - live
+    if dead >= COMPACT_MIN_BYTES and dead * 2 > data.end:
+        compact_private_fs(dirs, files, data)
+
+
+#drops removed content and old metadata blocks by rewriting the live files
+def compact_private_fs(dirs, files, data):
+    contents = {}
+    for path, (offset, length, timestamp) in files.items():
+        contents[path] = (data.read(offset, length), timestamp)
+    write_volume(dirs, contents)
+
+
+def sup_cp(src, dest):
+    if not dest.startswith("+"):
+        print("cp: destination must start with +")
+        return
+    dest_path = dest[1:]
+    dirs, files, data = load_private_fs()
+    if src.startswith("+"):
+        src_path = src[1:]
+        if src_path not in files:
+            print(f"cp: {src}: No such file")
+            return
+        off, length, _ = files[src_path]
+        content = data.read(off, length)
+    else:
+        try:
+            with open(src, 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            print(f"cp: {src}: No such file or directory")
+            return
+    if '/' in dest_path:
+        dir_name, _ = dest_path.split('/', 1)
+        if dir_name not in dirs:
+            print(f"cp: cannot create regular file '{dest}': No such directory")
+            return
+    files.pop(dest_path, None)
+    timestamp = int(time.time())
+    offset = data.append(content)
+    length = len(content)
+    files[dest_path] = [offset, length, timestamp]
+    save_private_fs(dirs, files, data)
+
+
+def sup_rm(arg):
+    if not arg.startswith("+"):
+        print("rm: argument must start with +")
+        return
+    file_name = arg[1:]
+    dirs, files, data = load_private_fs()
+    if file_name not in files:
+        print(f"rm: cannot remove '{arg}': No such file")
+        return
+    # the bytes stay in place until the compactor runs
+    del files[file_name]
+    save_private_fs(dirs, files, data)
+
+
+def sup_mkdir(arg):
+    if not arg.startswith("+"):
+        print("mkdir: argument must start with +")
+        return
+    dir_name = arg[1:]
+    dirs, files, data = load_private_fs()
+    if dir_name in dirs:
+        print(f"mkdir: cannot create directory '{arg}': File exists")
+        return
+    if '/' in dir_name:
+        print(f"mkdir: cannot create directory '{arg}': Nested directories not supported")
+        return
+    dirs.append(dir_name)
+    save_private_fs(dirs, files, data)
+
+
+def sup_rmdir(arg):
+    if not arg.startswith("+"):
+        print("rmdir: argument must start with +")
+        return
+    dir_name = arg[1:]
+    dirs, files, data = load_private_fs()
+    if dir_name not in dirs:
+        print(f"rmdir: failed to remove '{arg}': No such directory")
+        return
+    for path in files:
+        if path.startswith(dir_name + "/"):
+            print(f"rmdir: failed to remove '{arg}': Directory not empty")
+            return
+    dirs.remove(dir_name)
+    save_private_fs(dirs, files, data)
+
+
+def sup_ls(arg=None):
+    dirs, files, data = load_private_fs()
+    if arg is None:
+        for d in dirs:
+            print(f"{d}/")
+        for path, (_, _, ts) in files.items():
+            if '/' not in path:
+                print(f"{path}\t{ts}")
+        return
+    if arg.startswith("+"):
+        path = arg[1:]
+    else:
+        path = arg
+    if path in dirs:
+        for fpath, (_, _, ts) in files.items():
+            if fpath.startswith(path + "/"):
+                name = fpath.split('/',1)[1]
+                print(f"{name}\t{ts}")
+    elif path in files:
+        _, _, ts = files[path]
+        print(f"{path}\t{ts}")
+    else:
+        print(f"ls: cannot access '{arg}': No such file or directory")
+
+
+def sup_show(arg):
+    if not arg.startswith("+"):
+        print("show: argument must start with +")
+        return
+    file_name = arg[1:]
+    dirs, files, data = load_private_fs()
+    if file_name not in files:
+        print(f"show: cannot show '{arg}': No such file")
+        return
+    off, length, _ = files[file_name]
+    sys.stdout.flush()
+    sys.stdout.buffer.write(data.read(off, length))
+    sys.stdout.buffer.flush()
+
+
+def sup_merge(src1, src2, dest):
+    if not dest.startswith("+"):
+        print("merge: destination must start with +")
+        return
+    dest_path = dest[1:]
+    dirs, files, data = load_private_fs()
+    # first source
+    if src1.startswith("+"):
+        s1 = src1[1:]
+        if s1 not in files:
+            print(f"merge: {src1}: No such file")
+            return
+        off, length, _ = files[s1]
+        c1 = data.read(off, length)
+    else:
+        try:
+            with open(src1,'rb') as f:
+                c1 = f.read()
+        except FileNotFoundError:
+            print(f"merge: {src1}: No such file or directory")
+            return
+    # second source
+    if src2.startswith("+"):
+        s2 = src2[1:]
+        if s2 not in files:
+            print(f"merge: {src2}: No such file")
+            return
+        off, length, _ = files[s2]
+        c2 = data.read(off, length)
+    else:
+        try:
+            with open(src2,'rb') as f:
+                c2 = f.read()
+        except FileNotFoundError:
+            print(f"merge: {src2}: No such file or directory")
+            return
+    if '/' in dest_path:
+        dn, fn = dest_path.split('/',1)
+        if dn not in dirs:
+            print(f"merge: cannot create file '{dest}': No such directory")
+            return
+    files.pop(dest_path, None)
+    ts = int(time.time())
+    # the two parts are appended back to back, no merged copy is built
+    off = data.append(c1)
+    data.append(c2)
+    ln = len(c1) + len(c2)
+    files[dest_path] = [off, ln, ts]
+    save_private_fs(dirs, files, data)
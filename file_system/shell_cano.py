@@ -4,6 +4,7 @@ import sys
 import re
 import time
 import datetime
+import struct
 
 
 # command to split the command but keeps any double quotes
@@ -137,51 +138,110 @@ def do_pipe(command):
     os.waitpid(pid1, 0)
     os.waitpid(pid2, 0)
 
-def readSupp(name):
-    with open('private.pfs', "rb") as f:
-        privatecont = f.read()
-
+# private.pfs layout: every write appends file data, a metadata block and a fixed
+# trailer holding the metadata offset and length (like a zip central directory).
+# only the last trailer counts, older metadata blocks are left behind unused.
+# lookups only read the trailer and metadata, then pread the file extent
+PFS_NAME = "private.pfs"
+PFS_MAGIC = b"CANOPFS1"
+TRAILER = struct.Struct("<8sQQ")
+
+# creates an empty private.pfs with just the trailer
+def initSupp():
+    with open(PFS_NAME, "wb") as f:
+        f.write(TRAILER.pack(PFS_MAGIC, 0, 0))
+
+# old private.pfs files were content + "--metadata--\n" + metadata
+# the content keeps its offsets so only the metadata and trailer get appended
+def migrateSupp(fd, end):
+    privatecont = os.pread(fd, end, 0)
     parts = privatecont.split(b"--metadata--\n")
     if len(parts) != 2:
+        return None
+    metadata_lines = [line.strip() for line in parts[1].decode().splitlines() if line.strip()]
+    return writeSuppMeta(fd, metadata_lines), metadata_lines
+
+# finds the last trailer that matches its metadata block, used when an append was cut short
+def findSuppTrailer(fd, end):
+    privatecont = os.pread(fd, end, 0)
+    pos = privatecont.rfind(PFS_MAGIC)
+    while pos >= 0:
+        if pos + TRAILER.size <= end:
+            magic, meta_offset, meta_len = TRAILER.unpack_from(privatecont, pos)
+            if meta_offset + meta_len == pos:
+                return meta_offset, meta_len
+        pos = privatecont.rfind(PFS_MAGIC, 0, pos)
+    return None
+
+# returns (metadata offset, metadata lines) using only the trailer and the metadata block
+def readSuppMeta(fd):
+    end = os.fstat(fd).st_size
+    if end < TRAILER.size:
+        return migrateSupp(fd, end)
+    magic, meta_offset, meta_len = TRAILER.unpack(os.pread(fd, TRAILER.size, end - TRAILER.size))
+    if magic != PFS_MAGIC or meta_offset + meta_len + TRAILER.size != end:
+        found = findSuppTrailer(fd, end)
+        if found is None:
+            return migrateSupp(fd, end)
+        meta_offset, meta_len = found
+    block = os.pread(fd, meta_len, meta_offset)
+    return meta_offset, [line for line in block.decode().splitlines() if line.strip()]
+
+# appends data, then the new metadata block and trailer, after the current end
+# the live metadata is never overwritten, so a cut short write keeps the old index
+# returns the offset the data was written at
+def writeSuppMeta(fd, metadata_lines, data=b""):
+    offset = os.fstat(fd).st_size
+    block = "".join(line + "\n" for line in metadata_lines).encode()
+    os.pwrite(fd, data + block + TRAILER.pack(PFS_MAGIC, offset + len(data), len(block)), offset)
+    return offset
+
+# opens private.pfs and loads its metadata, prints an error and returns None if invalid
+def openSupp():
+    fd = os.open(PFS_NAME, os.O_RDWR)
+    meta = readSuppMeta(fd)
+    if meta is None:
+        os.close(fd)
         print("Invalid PFS format.")
         return None
+    return fd, meta[0], meta[1]
 
-    content_bytes = parts[0]
-    metadata_lines = parts[1].decode().splitlines()
+def readSupp(name):
+    opened = openSupp()
+    if opened is None:
+        return None
+    fd, _, metadata_lines = opened
 
-    for line in metadata_lines:
-        if not line.strip():
-            continue
-        parts = line.strip().split("|")
-        if len(parts) != 5:
-            continue
-        type, filename, offset, timestamp, size = parts
-        if type != 'F':
-            continue
-        if filename.strip() == name.strip():
-            offset = int(offset)
-            size = int(size)
-            filedata = content_bytes[offset:offset+size]
-            return filedata.decode()
+    try:
+        for line in metadata_lines:
+            parts = line.strip().split("|")
+            if len(parts) != 5:
+                continue
+            type, filename, offset, timestamp, size = parts
+            if type != 'F':
+                continue
+            if filename.strip() == name.strip():
+                #only read the bytes for this file
+                filedata = os.pread(fd, int(size), int(offset))
+                return filedata.decode()
+    finally:
+        os.close(fd)
 
     print(f"File '{name}' not found in private.pfs.")
     return None
 
 #for ls command of supp files
 def listSuppEntry(name):
-    if not os.path.exists("private.pfs"):
+    if not os.path.exists(PFS_NAME):
         print("private.pfs does not exist.")
         return
 
-    with open("private.pfs", "rb") as f:
-        privatecont = f.read()
-        #split metadata and content
-    parts = privatecont.split(b"--metadata--\n")
-    if len(parts) != 2:
-        print("Invalid PFS format.")
+    #only the metadata is needed for ls
+    opened = openSupp()
+    if opened is None:
         return
-
-    metadata_lines = parts[1].decode().splitlines()
+    fd, _, metadata_lines = opened
+    os.close(fd)
     #if file/director is found
     found = False
 
@@ -235,16 +295,10 @@ def listSuppEntry(name):
 
 # function for writing supp files
 def writeSupp(name, content):
-    with open("private.pfs", "rb") as f:
-        privatecont = f.read()
-
-    parts = privatecont.split(b"--metadata--\n")
-    if len(parts) != 2:
-        print("Invalid PFS format. Expecting '--metadata--'.")
+    opened = openSupp()
+    if opened is None:
         return
-
-    content_bytes = parts[0]
-    metadata_block = parts[1].decode().splitlines()
+    fd, _, metadata_block = opened
 
     #make sure there isnt any unnecesary metadata
     cleaned_metadata = []
@@ -258,24 +312,22 @@ def writeSupp(name, content):
         #check if file already exists
         if filename.strip() == name.strip():
             print(f"File '{name}' already exists in PFS.")
+            os.close(fd)
             return
         cleaned_metadata.append(line.strip())
 
-    #compute the new offset for content
-    offset = len(content_bytes)
+    #new content goes after everything already in the file
+    offset = os.fstat(fd).st_size
     data = content.encode()
     size = len(data)
     timestamp = int(time.time())
-    newmeta = f"F|{name}|{offset}|{timestamp}|{size}"
-
-    #update the private.pfs with the new file metaadata and content
-    with open("private.pfs", "wb") as f:
-        f.write(content_bytes)
-        f.write(data)
-        f.write(b"\n--metadata--\n")
-        for line in cleaned_metadata:
-            f.write((line + "\n").encode())
-        f.write((newmeta + "\n").encode())
+    cleaned_metadata.append(f"F|{name}|{offset}|{timestamp}|{size}")
+
+    #append the content with the new metadata and trailer after it
+    try:
+        writeSuppMeta(fd, cleaned_metadata, data)
+    finally:
+        os.close(fd)
     #notify the success
     print(f"File '{name}' written to PFS.")
 
@@ -291,15 +343,11 @@ def mergeSuppFiles(file1, file2, result):
         print("Some input files dont exist.")
         return
 
-    with open("private.pfs", "rb") as f:
-        privatecont = f.read()
-
-    parts = privatecont.split(b"--metadata--\n")
-    if len(parts) != 2:
-        print("Invalid PFS format.")
+    opened = openSupp()
+    if opened is None:
         return
-
-    metadata_lines = parts[1].decode().splitlines()
+    fd, _, metadata_lines = opened
+    os.close(fd)
     for line in metadata_lines:
         if not line.strip():
             continue
@@ -315,16 +363,10 @@ def mergeSuppFiles(file1, file2, result):
     writeSupp(result, combined)
 
 def makeSuppDir(name):
-    with open("private.pfs", "rb") as f:
-        privatecont = f.read()
-    #separate metadata from content
-    parts = privatecont.split(b"--metadata--\n")
-    if len(parts) != 2:
-        print("Invalid PFS format.")
+    opened = openSupp()
+    if opened is None:
         return
-
-    content_bytes = parts[0]
-    metadata_lines = parts[1].decode().splitlines()
+    fd, _, metadata_lines = opened
 
     #checks if directory already exists
     for line in metadata_lines:
@@ -336,37 +378,30 @@ def makeSuppDir(name):
         _, existing_name, *_ = parts
         if existing_name == name:
             print(f"Directory '{name}' already exists.")
+            os.close(fd)
             return
 
     timestamp = int(time.time())
     newmeta = f"D|{name}|0|{timestamp}|0"
 
-    #update all the metadata
-    with open("private.pfs", "wb") as f:
-        f.write(content_bytes)
-        f.write(b"--metadata--\n")
-        for line in metadata_lines:
-            f.write((line + "\n").encode())
-        f.write((newmeta + "\n").encode())
+    #update only the metadata, file content is left alone
+    try:
+        writeSuppMeta(fd, metadata_lines + [newmeta])
+    finally:
+        os.close(fd)
 
     print(f"Directory '{name}' created in PFS.")
 
 #for removing a directory
 def removeSuppDir(name):
-    if not os.path.exists("private.pfs"):
+    if not os.path.exists(PFS_NAME):
         print("private.pfs does not exist.")
         return
 
-    with open("private.pfs", "rb") as f:
-        privatecont = f.read()
-    #split metadata and content
-    parts = privatecont.split(b"--metadata--\n")
-    if len(parts) != 2:
-        print("Invalid PFS format.")
+    opened = openSupp()
+    if opened is None:
         return
-
-    content_bytes = parts[0]
-    metadata = parts[1].decode().splitlines()
+    fd, _, metadata = opened
 
     newMetadata = []
     dir_found = False
@@ -396,32 +431,27 @@ def removeSuppDir(name):
     #error code if directory isnt found/doesnt exist
     if not dir_found:
         print(f"Directory '{name}' not found.")
+        os.close(fd)
         return
     #can only delete if the directory is empty
     if not_empty:
         print(f"Directory '{name}' is not empty.")
+        os.close(fd)
         return
     #update/remove the metadata for directory
-    with open("private.pfs", "wb") as f:
-        f.write(content_bytes)
-        f.write(b"--metadata--\n")
-        for line in newMetadata:
-            f.write((line + "\n").encode())
+    try:
+        writeSuppMeta(fd, newMetadata)
+    finally:
+        os.close(fd)
 
     print(f"Directory '{name}' removed.")
 
 
 def removeSuppFile(name):
-    with open("private.pfs", "rb") as f:
-        privatecont = f.read()
-    #separate metadata and content
-    parts = privatecont.split(b"--metadata--\n")
-    if len(parts) != 2:
-        print("Invalid PFS format.")
+    opened = openSupp()
+    if opened is None:
         return
-
-    content_bytes = parts[0]
-    metadata_lines = parts[1].decode().splitlines()
+    fd, _, metadata_lines = opened
 
     updated_metadata = []
     #checking that the file is found
@@ -443,14 +473,14 @@ def removeSuppFile(name):
     #alert that file is not found or doesnt exist
     if not found:
         print(f"File '{name}' not found.")
+        os.close(fd)
         return
 
-    #update/remove metadata
-    with open("private.pfs", "wb") as f:
-        f.write(content_bytes)
-        f.write(b"--metadata--\n")
-        for line in updated_metadata:
-            f.write((line + "\n").encode())
+    #update/remove metadata, the file bytes stay in the data region
+    try:
+        writeSuppMeta(fd, updated_metadata)
+    finally:
+        os.close(fd)
     #for succesful removing
     print(f"File '{name}' removed from PFS.")
 
@@ -628,10 +658,13 @@ def process_in(fd):
 
 def main():
     # creates the private.pfs if it doesnt exist already
-    if not os.path.exists("private.pfs"):
-        with open("private.pfs", 'w') as f:
-            f.write("--content--\n")
-            f.write("--metadata--\n")
+    if not os.path.exists(PFS_NAME):
+        initSupp()
+    else:
+        #upgrades an old --metadata-- private.pfs before any commands run
+        opened = openSupp()
+        if opened is not None:
+            os.close(opened[0])
 
     # check if the argument provided was a file
     if len(sys.argv) > 1:
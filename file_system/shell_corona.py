@@ -1,55 +1,68 @@
 import os
+import sys
 import time
+import codecs
+import pfs_records
 
 PFS_FILENAME = "private.pfs"
 
-# Ensure private.pfs exists
-if not os.path.exists(PFS_FILENAME):
-    with open(PFS_FILENAME, 'w') as f:
-        pass
+
+def parse_legacy(text):
+    """Convert the old "T|name|size|timestamp|content" lines into records."""
+    seen = set()
+    for line in text.splitlines():
+        parts = line.strip().split('|')
+        if len(parts) < 5 or parts[0] not in ('F', 'D') or parts[1] in seen:
+            continue
+        # read_file used to return the first line for a name, so keep that one
+        seen.add(parts[1])
+        yield parts[0].encode(), parts[1], int(parts[3]), parts[4].encode()
+
+
+# Opens (and creates or converts) private.pfs
+store = pfs_records.RecordStore(PFS_FILENAME, legacy=parse_legacy)
+store.load()
 
 def write_file(filename, content):
     """Write a file to the supplementary file system."""
-    timestamp = int(time.time())
-    record = f"F|{filename}|{len(content)}|{timestamp}|{content}\n"
-    with open(PFS_FILENAME, 'a') as f:
-        f.write(record)
+    store.write(pfs_records.FILE, filename, content.encode())
 
 def read_file(filename):
     """Read a file from the supplementary file system."""
-    with open(PFS_FILENAME, 'r') as f:
-        for line in f:
-            parts = line.strip().split('|')
-            if len(parts) < 5:
-                continue
-            if parts[0] == 'F' and parts[1] == filename:
-                return {
-                    'filename': parts[1],
-                    'size': int(parts[2]),
-                    'timestamp': int(parts[3]),
-                    'content': parts[4]
-                }
-    return None
+    entry = store.get(filename)
+    if entry is None or entry.kind != pfs_records.FILE:
+        return None
+    return {
+        'filename': filename,
+        'size': entry.size,
+        'timestamp': entry.timestamp,
+        'content': store.read(filename).decode()
+    }
+
+def stream_file(filename):
+    """Yield the text of a supplementary file as it is decompressed."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for piece in store.stream(filename):
+        yield decoder.decode(piece)
+    yield decoder.decode(b'', final=True)
 
 def show_file(filename):
     """Display the contents of a supplementary file."""
-    file_data = read_file(filename)
-    if file_data:
-        print(file_data['content'])
+    entry = store.get(filename)
+    if entry and entry.kind == pfs_records.FILE:
+        for text in stream_file(filename):
+            sys.stdout.write(text)
+        print()
     else:
         print(f"Error: File '{filename}' not found.")
 
 def list_files_in_dir(directory):
     """List files in a directory with timestamps."""
     found = False
-    with open(PFS_FILENAME, 'r') as f:
-        for line in f:
-            parts = line.strip().split('|')
-            if len(parts) < 5:
-                continue
-            if parts[0] == 'F' and (parts[1].startswith(directory + '/') or parts[1] == directory):  # Match files inside or matching the filename
-                found = True
-                print(f"{parts[1]} - Last modified: {time.ctime(int(parts[3]))}")
+    for name, entry in store.items():
+        if entry.kind == pfs_records.FILE and (name.startswith(directory + '/') or name == directory):  # Match files inside or matching the filename
+            found = True
+            print(f"{name} - Last modified: {time.ctime(entry.timestamp)}")
     if not found:
         print(f"Error: No files found in directory or matching filename '{directory}'.")
 
@@ -92,54 +105,23 @@ def merge_files(src1, src2, dest):
 
 def remove_file(filename):
     """Remove a supplementary file from the system."""
-    lines = []
-    file_found = False
-
-    with open(PFS_FILENAME, 'r') as f:
-        lines = f.readlines()
-
-    with open(PFS_FILENAME, 'w') as f:
-        for line in lines:
-            parts = line.strip().split('|')
-            if len(parts) < 5:
-                continue
-            if parts[0] == 'F' and parts[1] == filename:
-                file_found = True
-            else:
-                f.write(line)
-
-    if file_found:
+    entry = store.get(filename)
+    if entry and entry.kind == pfs_records.FILE:
+        store.remove(filename)
         print(f"File {filename} removed.")
     else:
         print(f"Error: File '{filename}' not found.")
 
 def create_directory(directory):
     """Create a supplementary directory."""
-    timestamp = int(time.time())
-    record = f"D|{directory}|0|{timestamp}|\n"
-    with open(PFS_FILENAME, 'a') as f:
-        f.write(record)
+    store.write(pfs_records.DIR, directory)
     print(f"Directory {directory} created.")
 
 def remove_directory(directory):
     """Remove a supplementary directory."""
-    lines = []
-    dir_found = False
-
-    with open(PFS_FILENAME, 'r') as f:
-        lines = f.readlines()
-
-    with open(PFS_FILENAME, 'w') as f:
-        for line in lines:
-            parts = line.strip().split('|')
-            if len(parts) < 5:
-                continue
-            if parts[0] == 'D' and parts[1] == directory:
-                dir_found = True
-            else:
-                f.write(line)
-
-    if dir_found:
+    entry = store.get(directory)
+    if entry and entry.kind == pfs_records.DIR:
+        store.remove(directory)
         print(f"Directory {directory} removed.")
     else:
         print(f"Error: Directory '{directory}' not found.")
@@ -182,10 +164,11 @@ def shell_loop():
                 # Case 3: PFS to real file
                 elif src.startswith('+') and not dest.startswith('+'):
                     src = src[1:]
-                    file_data = read_file(src)
-                    if file_data:
+                    entry = store.get(src)
+                    if entry and entry.kind == pfs_records.FILE:
                         with open(dest, 'w') as f:
-                            f.write(file_data['content'])
+                            for text in stream_file(src):
+                                f.write(text)
                         print(f"Copied '+{src}' to '{dest}' (real file).")
                     else:
                         print(f"Error: Source file '+{src}' not found.")
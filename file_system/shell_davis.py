@@ -7,6 +7,7 @@ import time
 PFS_FILENAME = "private.pfs"
 HEADER = {}
 DIRECTORIES = {}
+# (dir_id, name) -> entry for every live file
 FILES = {}
 
 #command to split the command but keeps any double quotes 
@@ -275,6 +276,14 @@ def main():
 def split_command(command):
     return re.findall(r'".*?"|\S+', command)
 
+# private.pfs layout: a fixed-width HEADER2 line that update_header() rewrites in
+# place, then DIR lines and FILE lines, each FILE line directly followed by its
+# content. The last field of DIR and FILE lines is the deleted flag.
+HEADER_FORMAT = "HEADER2|{dir_count:010d}|{file_count:010d}|{next_dir_id:010d}|{next_file_id:010d}\n"
+HEADER_SIZE = len(HEADER_FORMAT.format(dir_count=0, file_count=0, next_dir_id=0, next_file_id=0))
+# (mtime, size) of private.pfs when it was last loaded or written by this shell
+PFS_STAMP = None
+
 def parse_virtual_path(path):
     if path.startswith("+"):
         path = path[1:]
@@ -288,54 +297,142 @@ def parse_virtual_path(path):
         return 0, path
 
 def find_file_entry(dir_id, fname):
-    for name, entry in FILES.items():
-        if name == fname and entry["dir_id"] == dir_id and not entry["deleted"]:
-            return entry
-    return None
+    return FILES.get((dir_id, fname))
 
 def read_file_content(entry):
     with open(PFS_FILENAME, "rb") as f:
         f.seek(entry["offset"])
         return f.read(entry["length"])
 
-def load_pfs():
-    global HEADER, DIRECTORIES, FILES
-    try:
-        with open(PFS_FILENAME, "r") as f:
-            lines = f.readlines()
-    except FileNotFoundError:
-        with open(PFS_FILENAME, "w") as f:
-            f.write("HEADER|0|0|1|1\n")
-        lines = ["HEADER|0|0|1|1\n"]
-    HEADER = {}
-    DIRECTORIES.clear()
-    FILES.clear()
-    for line in lines:
-        if line.startswith("HEADER"):
+def pfs_stamp():
+    st = os.stat(PFS_FILENAME)
+    return (st.st_mtime_ns, st.st_size)
+
+def migrate_pfs():
+    # old volumes put each file's content before its FILE line and had a variable-width header
+    with open(PFS_FILENAME, "rb") as f:
+        data = f.read()
+    header = {"dir_count": 0, "file_count": 0, "next_dir_id": 1, "next_file_id": 1}
+    dirs = []
+    files = {}
+    for raw in data.splitlines():
+        line = raw.decode(errors="replace")
+        if line.startswith("HEADER|"):
             _, dir_count, file_count, next_dir_id, next_file_id = line.strip().split("|")
-            HEADER.update({
+            header.update({
                 "dir_count": int(dir_count),
                 "file_count": int(file_count),
                 "next_dir_id": int(next_dir_id),
                 "next_file_id": int(next_file_id)
             })
-        elif line.startswith("DIR"):
-            _, dir_id, name, mod_time = line.strip().split("|")
-            DIRECTORIES[name] = {"id": int(dir_id), "mod": int(mod_time)}
-        elif line.startswith("FILE"):
+        elif line.startswith("DIR|"):
+            dirs.append(line.strip() + "|0\n")
+        elif line.startswith("FILE|"):
             parts = line.strip().split("|")
-            FILES[parts[3]] = {
-                "id": int(parts[1]), "dir_id": int(parts[2]),
-                "offset": int(parts[4]), "length": int(parts[5]),
-                "mod": int(parts[6]), "deleted": parts[7] == "1"
-            }
+            if parts[7] == "1":
+                continue
+            offset, length = int(parts[4]), int(parts[5])
+            files[(parts[2], parts[3])] = (parts, data[offset:offset + length])
+    with open(PFS_FILENAME + ".tmp", "wb") as f:
+        f.write(HEADER_FORMAT.format(**header).encode())
+        for line in dirs:
+            f.write(line.encode())
+        for parts, content in files.values():
+            write_file_record(f, parts[1], parts[2], parts[3], content, parts[6])
+    os.replace(PFS_FILENAME + ".tmp", PFS_FILENAME)
+
+def load_pfs():
+    global HEADER, PFS_STAMP
+    if not os.path.exists(PFS_FILENAME):
+        with open(PFS_FILENAME, "w") as f:
+            f.write(HEADER_FORMAT.format(dir_count=0, file_count=0, next_dir_id=1, next_file_id=1))
+    with open(PFS_FILENAME, "rb") as f:
+        current = f.read(HEADER_SIZE).startswith(b"HEADER2|")
+    if not current:
+        migrate_pfs()
+    # nothing to do if only this shell has written to the file since the last load
+    if PFS_STAMP == pfs_stamp():
+        return
+    HEADER = {}
+    DIRECTORIES.clear()
+    FILES.clear()
+    with open(PFS_FILENAME, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        pos = 0
+        while pos < size:
+            # only metadata lines are read, file content is skipped by its length
+            f.seek(pos)
+            raw = f.readline()
+            line = raw.decode().rstrip("\n")
+            flag = pos + len(raw) - 2
+            if line.startswith("HEADER2|"):
+                _, dir_count, file_count, next_dir_id, next_file_id = line.split("|")
+                HEADER.update({
+                    "dir_count": int(dir_count),
+                    "file_count": int(file_count),
+                    "next_dir_id": int(next_dir_id),
+                    "next_file_id": int(next_file_id)
+                })
+            elif line.startswith("DIR|"):
+                _, dir_id, name, mod_time, deleted = line.split("|")
+                if deleted != "1":
+                    DIRECTORIES[name] = {"id": int(dir_id), "mod": int(mod_time), "flag": flag}
+            elif line.startswith("FILE|"):
+                parts = line.split("|")
+                entry = {
+                    "id": int(parts[1]), "dir_id": int(parts[2]),
+                    "offset": int(parts[4]), "length": int(parts[5]),
+                    "mod": int(parts[6]), "deleted": parts[7] == "1", "flag": flag
+                }
+                if not entry["deleted"]:
+                    FILES[(entry["dir_id"], parts[3])] = entry
+                pos = entry["offset"] + entry["length"]
+                continue
+            pos += len(raw)
+    PFS_STAMP = pfs_stamp()
 
 def update_header():
-    with open(PFS_FILENAME, "r") as f:
-        lines = f.readlines()
-    lines[0] = f"HEADER|{HEADER['dir_count']}|{HEADER['file_count']}|{HEADER['next_dir_id']}|{HEADER['next_file_id']}\n"
-    with open(PFS_FILENAME, "w") as f:
-        f.writelines(lines)
+    global PFS_STAMP
+    fd = os.open(PFS_FILENAME, os.O_WRONLY)
+    try:
+        os.pwrite(fd, HEADER_FORMAT.format(**HEADER).encode(), 0)
+    finally:
+        os.close(fd)
+    PFS_STAMP = pfs_stamp()
+
+def mark_deleted(entry):
+    # flips the deleted flag at the end of a DIR or FILE line in place
+    fd = os.open(PFS_FILENAME, os.O_WRONLY)
+    try:
+        os.pwrite(fd, b"1", entry["flag"])
+    finally:
+        os.close(fd)
+
+def write_file_record(f, file_id, dir_id, fname, content, mod):
+    # FILE line then content, the offset is zero padded so the line length is known up front
+    start = f.tell()
+    line = f"FILE|{file_id}|{dir_id}|{fname}|{0:020d}|{len(content)}|{mod}|0\n"
+    offset = start + len(line)
+    line = f"FILE|{file_id}|{dir_id}|{fname}|{offset:020d}|{len(content)}|{mod}|0\n"
+    f.write(line.encode() + content)
+    return {
+        "id": int(file_id), "dir_id": int(dir_id), "offset": offset, "length": len(content),
+        "mod": int(mod), "deleted": False, "flag": offset - 2
+    }
+
+def add_file(dir_id, fname, content):
+    # a file that already exists is replaced by the new copy
+    old = find_file_entry(dir_id, fname)
+    if old:
+        mark_deleted(old)
+        HEADER["file_count"] -= 1
+    file_id = HEADER["next_file_id"]
+    now = int(time.time())
+    with open(PFS_FILENAME, "ab") as f:
+        FILES[(dir_id, fname)] = write_file_record(f, file_id, dir_id, fname, content, now)
+    HEADER["file_count"] += 1
+    HEADER["next_file_id"] += 1
+    update_header()
 
 def mkdir_plus(name):
     load_pfs()
@@ -344,8 +441,11 @@ def mkdir_plus(name):
         return
     now = int(time.time())
     dir_id = HEADER["next_dir_id"]
-    with open(PFS_FILENAME, "a") as f:
-        f.write(f"DIR|{dir_id}|{name}|{now}\n")
+    with open(PFS_FILENAME, "ab") as f:
+        line = f"DIR|{dir_id}|{name}|{now}|0\n"
+        flag = f.tell() + len(line) - 2
+        f.write(line.encode())
+    DIRECTORIES[name] = {"id": dir_id, "mod": now, "flag": flag}
     HEADER["dir_count"] += 1
     HEADER["next_dir_id"] += 1
     update_header()
@@ -356,10 +456,10 @@ def rmdir_plus(name):
         print("Directory not found.")
         return
     dir_id = DIRECTORIES[name]["id"]
-    if any(file["dir_id"] == dir_id and not file["deleted"] for file in FILES.values()):
+    if any(key[0] == dir_id for key in FILES):
         print("Directory not empty.")
         return
-    del DIRECTORIES[name]
+    mark_deleted(DIRECTORIES.pop(name))
     HEADER["dir_count"] -= 1
     update_header()
     print(f"{name} removed.")
@@ -375,34 +475,8 @@ def rm_plus(name):
         print("File not found.")
         return
 
+    mark_deleted(FILES.pop((dir_id, fname)))
     HEADER["file_count"] -= 1
-
-    with open(PFS_FILENAME, "r") as f:
-        lines = f.readlines()
-
-    new_lines = []
-    skip_mode = False
-
-    for i in range(len(lines)):
-        line = lines[i]
-
-        if line.startswith("FILE|"):
-            parts = line.strip().split("|")
-            if parts[3] == fname and int(parts[2]) == dir_id:
-                # skip content above and this FILE line
-                skip_mode = True
-                # backtrack to remove content just before FILE line
-                while new_lines and not new_lines[-1].startswith(("DIR|", "FILE|", "HEADER|")):
-                    new_lines.pop()
-                continue
-            skip_mode = False
-
-        if not skip_mode:
-            new_lines.append(line)
-
-    with open(PFS_FILENAME, "w") as f:
-        f.writelines(new_lines)
-
     update_header()
     print(f"{fname} deleted.")
 
@@ -423,21 +497,18 @@ def show_plus(name):
 
 def ls_plus(name):
     load_pfs()
-    results = {}
 
     if name in DIRECTORIES:
         dir_id = DIRECTORIES[name]["id"]
-        for fname, entry in FILES.items():
-            if entry["dir_id"] == dir_id and not entry["deleted"]:
-                if fname not in results or entry["mod"] > results[fname]["mod"]:
-                    results[fname] = entry
-
-        for fname, entry in results.items():
-            print(f"{fname}\t{time.ctime(entry['mod'])}")
+        for (file_dir, fname), entry in FILES.items():
+            if file_dir == dir_id:
+                print(f"{fname}\t{time.ctime(entry['mod'])}")
+        return
 
-    elif name in FILES and not FILES[name]["deleted"]:
-        entry = FILES[name]
-        print(f"{name}\t{time.ctime(entry['mod'])}")
+    dir_id, fname = parse_virtual_path(name)
+    entry = find_file_entry(dir_id, fname) if dir_id is not None else None
+    if entry:
+        print(f"{fname}\t{time.ctime(entry['mod'])}")
     else:
         print("Not found.")
 
@@ -465,17 +536,7 @@ def cp_plus(src, dst):
         except FileNotFoundError:
             print("Source file not found.")
             return
-    file_id = HEADER["next_file_id"]
-    now = int(time.time())
-    length = len(content)
-    with open(PFS_FILENAME, "ab") as f:
-        offset = f.tell()
-        f.write(content)
-    with open(PFS_FILENAME, "a") as f:
-        f.write(f"FILE|{file_id}|{dir_id}|{fname}|{offset}|{length}|{now}|0\n")
-    HEADER["file_count"] += 1
-    HEADER["next_file_id"] += 1
-    update_header()
+    add_file(dir_id, fname, content)
 
 def merge_plus(f1, f2, f3):
     load_pfs()
@@ -502,17 +563,7 @@ def merge_plus(f1, f2, f3):
     if dir_id is None:
         print("Target directory not found.")
         return
-    file_id = HEADER["next_file_id"]
-    now = int(time.time())
-    length = len(content)
-    with open(PFS_FILENAME, "ab") as f:
-        offset = f.tell()
-        f.write(content)
-    with open(PFS_FILENAME, "a") as f:
-        f.write(f"FILE|{file_id}|{dir_id}|{fname}|{offset}|{length}|{now}|0\n")
-    HEADER["file_count"] += 1
-    HEADER["next_file_id"] += 1
-    update_header()
+    add_file(dir_id, fname, content)
 
 
 
@@ -12,55 +12,171 @@ METADATA_BLOCK_SIZE = METADATA_ENTRY_SIZE * MAX_ENTRIES
 BITMAP_SIZE = MAX_ENTRIES
 CONTENT_START = SUPERBLOCK_SIZE + BITMAP_SIZE + METADATA_BLOCK_SIZE
 
+# Format version 2 keeps the original 100-slot area as the first metadata
+# block and chains further blocks, appended at the end of the file, through
+# a next-block pointer (superblock offset 16 for the first block).
+FORMAT_VERSION = 2
+EXTENSION_SLOTS = 256
+SB_VERSION_FORMAT = struct.Struct("=IQ")    # at offset 12: version, next block
+BLOCK_HEADER_FORMAT = struct.Struct("=QI4x")  # next block, slot count
+SLOT_FORMAT = struct.Struct("=32sc31xQQ32s16x")
+
 def initialize_pfs():
     if not os.path.exists(PFS_FILE):
         with open(PFS_FILE, "wb") as f:
             f.write(struct.pack("I", 0))  # number of files
             f.write(struct.pack("I", METADATA_ENTRY_SIZE))
             f.write(struct.pack("I", CONTENT_START))
-            f.write(b'\x00' * (SUPERBLOCK_SIZE - 12))
+            f.write(SB_VERSION_FORMAT.pack(FORMAT_VERSION, 0))
+            f.write(b'\x00' * (SUPERBLOCK_SIZE - 12 - SB_VERSION_FORMAT.size))
             f.write(b'\x00' * BITMAP_SIZE)
             f.write(b'\x00' * METADATA_BLOCK_SIZE)
             print("[File system initialized in private.pfs]")
 
+class MetadataIndex:
+    """Bitmap and slot table of every metadata block.
+
+    Read once and kept while private.pfs only changes through this index;
+    get_index() reads it again once another shell has written to the file.
+    """
+
+    def __init__(self):
+        self.fd = os.open(PFS_FILE, os.O_RDWR)
+        self.bitmap = bytearray()
+        self.bitmap_pos = []  # file offset of each slot's bitmap byte
+        self.slot_pos = []    # file offset of each slot's record
+        self.entries = {}     # slot -> (name, type, size, offset, timestamp)
+        self.names = {}       # name -> sorted slots using it
+        version, link = SB_VERSION_FORMAT.unpack(
+            os.pread(self.fd, SB_VERSION_FORMAT.size, 12))
+        self.last_link = 16
+        self._load_block(SUPERBLOCK_SIZE, MAX_ENTRIES)
+        while link:
+            next_link, count = BLOCK_HEADER_FORMAT.unpack(
+                os.pread(self.fd, BLOCK_HEADER_FORMAT.size, link))
+            self.last_link = link
+            self._load_block(link + BLOCK_HEADER_FORMAT.size, count)
+            link = next_link
+        self._restamp()
+
+    def _stamp(self):
+        st = os.stat(PFS_FILE)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _restamp(self):
+        self.stamp = self._stamp()
+
+    def current(self):
+        return self._stamp() == self.stamp
+
+    def _load_block(self, pos, count):
+        raw = os.pread(self.fd, count * (1 + METADATA_ENTRY_SIZE), pos)
+        base = len(self.bitmap)
+        self.bitmap += raw[:count]
+        for i in range(count):
+            self.bitmap_pos.append(pos + i)
+            self.slot_pos.append(pos + count + i * METADATA_ENTRY_SIZE)
+            record = SLOT_FORMAT.unpack_from(raw, count + i * METADATA_ENTRY_SIZE)
+            self._index(base + i, record)
+
+    def _index(self, slot, record):
+        name, ftype, size, offset, timestamp = record
+        name = name.rstrip(b'\x00').decode()
+        if name == '' or name == 'EMPTY':
+            return
+        self.entries[slot] = (name, ftype.decode(), size, offset,
+                              timestamp.rstrip(b'\x00').decode())
+        slots = self.names.setdefault(name, [])
+        slots.append(slot)
+        slots.sort()
+
+    def _unindex(self, slot):
+        entry = self.entries.pop(slot, None)
+        if entry is not None:
+            slots = self.names[entry[0]]
+            slots.remove(slot)
+            if not slots:
+                del self.names[entry[0]]
+
+    def _grow(self):
+        count = max(EXTENSION_SLOTS, len(self.bitmap))
+        pos = os.lseek(self.fd, 0, os.SEEK_END)
+        os.pwrite(self.fd, BLOCK_HEADER_FORMAT.pack(0, count)
+                  + b'\x00' * (count * (1 + METADATA_ENTRY_SIZE)), pos)
+        os.pwrite(self.fd, struct.pack("=Q", pos), self.last_link)
+        os.pwrite(self.fd, struct.pack("=I", FORMAT_VERSION), 12)
+        self.last_link = pos
+        self._load_block(pos + BLOCK_HEADER_FORMAT.size, count)
+
+    def allocate(self):
+        slot = self.bitmap.find(0)
+        if slot == -1:
+            self._grow()
+            slot = self.bitmap.find(0)
+        self.bitmap[slot] = 1
+        os.pwrite(self.fd, b'\x01', self.bitmap_pos[slot])
+        self._restamp()
+        return slot
+
+    def append(self, content):
+        offset = os.fstat(self.fd).st_size
+        os.pwrite(self.fd, content, offset)
+        self._restamp()
+        return offset
+
+    def write(self, slot, name, file_type, size, offset):
+        record = (name.encode(), file_type.encode(), size, offset,
+                  time.ctime().encode())
+        os.pwrite(self.fd, SLOT_FORMAT.pack(*record), self.slot_pos[slot])
+        self._restamp()
+        self._unindex(slot)
+        self._index(slot, record)
+
+    def clear(self, slot):
+        os.pwrite(self.fd, b'EMPTY'.ljust(METADATA_ENTRY_SIZE, b'\x00'),
+                  self.slot_pos[slot])
+        self.bitmap[slot] = 0
+        os.pwrite(self.fd, b'\x00', self.bitmap_pos[slot])
+        self._restamp()
+        self._unindex(slot)
+
+    def find(self, name, file_type=None):
+        for slot in self.names.get(name, ()):
+            if file_type is None or self.entries[slot][1] == file_type:
+                return slot
+        return None
+
+    def read(self, slot):
+        _, _, size, offset, _ = self.entries[slot]
+        return os.pread(self.fd, size, offset)
+
+    def listing(self):
+        return [self.entries[slot] for slot in sorted(self.entries)]
+
+_index = None
+
+def get_index():
+    global _index
+    # another shell may have taken slots since the bitmap was read
+    if _index is not None and not _index.current():
+        os.close(_index.fd)
+        _index = None
+    if _index is None:
+        _index = MetadataIndex()
+    return _index
+
 def find_free_metadata_slot():
-    with open(PFS_FILE, "r+b") as f:
-        f.seek(SUPERBLOCK_SIZE)
-        bitmap = f.read(BITMAP_SIZE)
-        for i in range(MAX_ENTRIES):
-            if bitmap[i] == 0:
-                f.seek(SUPERBLOCK_SIZE + i)
-                f.write(b'\x01')
-                return i
-    return -1
+    return get_index().allocate()
 
 def write_metadata(slot, name, file_type, size, offset):
-    with open(PFS_FILE, "r+b") as f:
-        entry_offset = SUPERBLOCK_SIZE + BITMAP_SIZE + (slot * METADATA_ENTRY_SIZE)
-        f.seek(entry_offset)
-        f.write(name.encode().ljust(32, b'\x00'))
-        f.write(file_type.encode())  # 'F' or 'D'
-        f.write(b'\x00' * 31)
-        f.write(struct.pack("Q", size))
-        f.write(struct.pack("Q", offset))
-        f.write(time.ctime().encode().ljust(32, b'\x00'))
-        f.write(b'\x00' * 15)
+    get_index().write(slot, name, file_type, size, offset)
 
 def read_supplemental_file(name):
-    with open(PFS_FILE, "rb") as f:
-        for i in range(MAX_ENTRIES):
-            offset = SUPERBLOCK_SIZE + BITMAP_SIZE + i * METADATA_ENTRY_SIZE
-            f.seek(offset)
-            fname = f.read(32).rstrip(b'\x00').decode()
-            ftype = f.read(1).decode()
-            f.read(31)
-            size = struct.unpack("Q", f.read(8))[0]
-            content_offset = struct.unpack("Q", f.read(8))[0]
-            f.read(32 + 15)
-            if fname == name:
-                f.seek(content_offset)
-                return f.read(size)
-    return None
+    index = get_index()
+    slot = index.find(name)
+    if slot is None:
+        return None
+    return index.read(slot)
 
 def cp_command(src, dest):
     if not dest.startswith('+'):
@@ -78,9 +194,7 @@ def cp_command(src, dest):
         except:
             print("cp: source not found in normal FS")
             return
-    with open(PFS_FILE, "ab") as f:
-        offset = f.tell()
-        f.write(content)
+    offset = get_index().append(content)
     slot = find_free_metadata_slot()
     if slot == -1:
         print("cp: no metadata space")
@@ -102,55 +216,29 @@ def mkdir_command(name):
     if slot == -1:
         print("mkdir: no metadata space")
         return
-    with open(PFS_FILE, "ab") as f:
-        offset = f.tell()
-        f.write(b'')
+    offset = get_index().append(b'')
     write_metadata(slot, name, 'D', 0, offset)
 
 def rmdir_command(name):
-    with open(PFS_FILE, "r+b") as f:
-        for i in range(MAX_ENTRIES):
-            offset = SUPERBLOCK_SIZE + BITMAP_SIZE + i * METADATA_ENTRY_SIZE
-            f.seek(offset)
-            fname = f.read(32).rstrip(b'\x00').decode()
-            ftype = f.read(1).decode()
-            if fname == name and ftype == 'D':
-                f.seek(offset)
-                f.write(b'EMPTY'.ljust(32, b'\x00'))
-                f.write(b'\x00' * (METADATA_ENTRY_SIZE - 32))
-                f.seek(SUPERBLOCK_SIZE + i)
-                f.write(b'\x00')
-                return
-    print("rmdir: not found or not directory")
+    index = get_index()
+    slot = index.find(name, 'D')
+    if slot is None:
+        print("rmdir: not found or not directory")
+        return
+    index.clear(slot)
 
 def rm_command(name):
-    with open(PFS_FILE, "r+b") as f:
-        for i in range(MAX_ENTRIES):
-            offset = SUPERBLOCK_SIZE + BITMAP_SIZE + i * METADATA_ENTRY_SIZE
-            f.seek(offset)
-            fname = f.read(32).rstrip(b'\x00').decode()
-            if fname == name:
-                f.seek(offset)
-                f.write(b'EMPTY'.ljust(32, b'\x00'))
-                f.write(b'\x00' * (METADATA_ENTRY_SIZE - 32))
-                f.seek(SUPERBLOCK_SIZE + i)
-                f.write(b'\x00')
-                return
-    print("rm: file not found")
+    index = get_index()
+    slot = index.find(name)
+    if slot is None:
+        print("rm: file not found")
+        return
+    index.clear(slot)
 
 def ls_command(target=None):
-    with open(PFS_FILE, "rb") as f:
-        for i in range(MAX_ENTRIES):
-            offset = SUPERBLOCK_SIZE + BITMAP_SIZE + i * METADATA_ENTRY_SIZE
-            f.seek(offset)
-            fname = f.read(32).rstrip(b'\x00').decode()
-            ftype = f.read(1).decode()
-            f.read(31 + 8 + 8)
-            timestamp = f.read(32).rstrip(b'\x00').decode()
-            f.read(15)
-            if fname != '' and fname != 'EMPTY':
-                if target is None or fname == target:
-                    print(f"{fname} (modified: {timestamp})")
+    for fname, _, _, _, timestamp in get_index().listing():
+        if target is None or fname == target:
+            print(f"{fname} (modified: {timestamp})")
 
 def merge_command(f1, f2, dest):
     if not (f1.startswith('+') and f2.startswith('+') and dest.startswith('+')):
@@ -164,9 +252,7 @@ def merge_command(f1, f2, dest):
         return
     combined = data1 + data2
     
-    with open(PFS_FILE, "ab") as f:
-        offset = f.tell()
-        f.write(combined)
+    offset = get_index().append(combined)
 
     slot = find_free_metadata_slot()
     if slot == -1:
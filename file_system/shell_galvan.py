@@ -2,6 +2,8 @@ import os
 import sys
 import re
 import time
+import codecs
+import pfs_records
 
 def split_command(command):
     return re.findall(r'".*?"|\S+', command)
@@ -227,42 +229,59 @@ def main():
 
 PFS_FILENAME = "private.pfs"
 
+sfs_records = None
 
-def sfs_read_all_entries():
-    entries = []
-    if not os.path.exists(PFS_FILENAME):
-        return entries
-    with open(PFS_FILENAME, "rb") as f:
-        for line in f:
-            parts = line.decode().strip().split("|", 4)
-            if len(parts) == 5:
-                entries.append(parts)
-    return entries
+
+# old volumes were "T|name|size|timestamp|content" lines with newlines escaped as \\n
+def sfs_parse_legacy(text):
+    seen = set()
+    for line in text.splitlines():
+        parts = line.strip().split("|", 4)
+        if len(parts) != 5 or parts[0] not in ('F', 'D') or parts[1] in seen:
+            continue
+        # lookups used to return the first live line for a name, so keep that one
+        seen.add(parts[1])
+        content = parts[4].replace('\\n', '\n') if parts[0] == 'F' else ''
+        yield parts[0].encode(), parts[1], int(parts[3]), content.encode()
+
+
+def sfs_store():
+    global sfs_records
+    if sfs_records is None:
+        sfs_records = pfs_records.RecordStore(PFS_FILENAME, legacy=sfs_parse_legacy)
+    return sfs_records.load()
 
 ###
 def sfs_read_file(name):
     if not name.startswith('+'):
         print(f"Invalid supplementary file name: {name}")
         return ""
-    entries = sfs_read_all_entries()
-    for entry in entries:
-        if entry[0] == 'F' and entry[1] == name:
-            return entry[4].replace('\\n', '\n')
+    entry = sfs_store().get(name)
+    if entry and entry.kind == pfs_records.FILE:
+        return sfs_store().read(name).decode()
     print(f"{name} not found")
     return ""
 
 ##
 def sfs_write_file(name, content):
-    timestamp = str(int(time.time()))
-    entry = f"F|{name}|{len(content)}|{timestamp}|{content.replace(chr(10), '\\n')}\n"
-    with open(PFS_FILENAME, "ab") as f:
-        f.write(entry.encode())
+    sfs_store().write(pfs_records.FILE, name, content.encode())
 
 ##
 def sfs_show(name):
-    content = sfs_read_file(name)
-    if content:
-        print(content)
+    if not name.startswith('+'):
+        print(f"Invalid supplementary file name: {name}")
+        return
+    entry = sfs_store().get(name)
+    if not entry or entry.kind != pfs_records.FILE:
+        print(f"{name} not found")
+        return
+    if entry.size:
+        # written as it is decompressed
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        for piece in sfs_store().stream(name):
+            sys.stdout.write(decoder.decode(piece))
+        sys.stdout.write(decoder.decode(b'', final=True))
+        print()
 
 ##
 def sfs_cp(src, dest):
@@ -283,62 +302,43 @@ def sfs_cp(src, dest):
 
 ###
 def sfs_rm(name):
-    try:
-        with open(PFS_FILENAME, "r+b") as f:
-            offset = 0
-            for line in f:
-                parts = line.decode().strip().split("|", 4)
-                if len(parts) == 5 and parts[1] == name:
-                    f.seek(offset)
-                    f.write(b"X")
-                    print(f"{name} removed from supplementary file system.")
-                    return
-                offset += len(line)
+    if sfs_store().remove(name):
+        print(f"{name} removed from supplementary file system.")
+    else:
         print(f"{name} not found.")
-    except FileNotFoundError:
-        print("private.pfs not found")
 
 #
 def sfs_mkdir(name):
-    timestamp = str(int(time.time()))
-    entry = f"D|{name}|0|{timestamp}|\n"
-    with open(PFS_FILENAME, "ab") as f:
-        f.write(entry.encode())
+    sfs_store().write(pfs_records.DIR, name)
     print(f"Directory {name} created.")
 
 #
 def sfs_rmdir(name):
-    entries = sfs_read_all_entries()
-    for entry in entries:
-        if entry[0] == 'F' and entry[1].startswith(name + '/'):
+    store = sfs_store()
+    for path, entry in store.items():
+        if entry.kind == pfs_records.FILE and path.startswith(name + '/'):
             print(f"Cannot remove {name}: Directory not empty.")
             return
-    with open(PFS_FILENAME, "r+b") as f:
-        offset = 0
-        for line in f:
-            parts = line.decode().strip().split("|", 4)
-            if len(parts) == 5 and parts[0] == 'D' and parts[1] == name:
-                f.seek(offset)
-                f.write(b"X")
-                print(f"{name} removed.")
-                return
-            offset += len(line)
+    entry = store.get(name)
+    if entry and entry.kind == pfs_records.DIR:
+        store.remove(name)
+        print(f"{name} removed.")
 
 #################
 def sfs_ls(name):
-    entries = sfs_read_all_entries()
-    for entry in entries:
-        if entry[0] == 'F' and entry[1] == name:
-            ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(int(entry[3])))
-            print(f"{entry[1]} (Last Modified: {ts})")
-            return
-        elif entry[0] == 'D' and entry[1] == name:
-            print(f"{name}/ contents:")
-            for e in entries:
-                if e[0] == 'F' and e[1].startswith(name + '/'):
-                    ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(int(e[3])))
-                    print(f"  {e[1].split('/')[-1]} (Last Modified: {ts})")
-            return
+    store = sfs_store()
+    entry = store.get(name)
+    if entry and entry.kind == pfs_records.FILE:
+        ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry.timestamp))
+        print(f"{name} (Last Modified: {ts})")
+        return
+    elif entry and entry.kind == pfs_records.DIR:
+        print(f"{name}/ contents:")
+        for path, e in store.items():
+            if e.kind == pfs_records.FILE and path.startswith(name + '/'):
+                ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(e.timestamp))
+                print(f"  {path.split('/')[-1]} (Last Modified: {ts})")
+        return
     print(f"{name} not found.")
 
 
@@ -2,39 +2,127 @@ import os
 import sys
 import time
 import re
+import struct
 
 PFS_FILENAME = "private.pfs"
 
+# Layout: HEADER, then a directory region of fixed-size RECORDs somewhere in
+# the file, then file contents appended at the end. When the directory
+# region fills up it is copied to the end of the file with twice the room.
+MAGIC = b'SFS2'
+HEADER = struct.Struct('<4sQII')      # magic, directory offset, capacity, records used
+RECORD = struct.Struct('<c64sQQQ')    # type, name, size, timestamp, content offset
+INITIAL_CAPACITY = 64
+
 class SupplementaryFileSystem:
     def __init__(self, filename=PFS_FILENAME):
         self.filename = filename
+        self._entries = None
+        self._stamp = None
+        if not os.path.exists(self.filename):
+            with open(self.filename, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, HEADER.size, INITIAL_CAPACITY, 0))
+                f.write(b'\x00' * (INITIAL_CAPACITY * RECORD.size))
+        else:
+            with open(self.filename, 'rb') as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    self._migrate()
+
+    def _file_stamp(self):
+        st = os.stat(self.filename)
+        return (st.st_mtime_ns, st.st_size)
 
     def _read_directory(self):
+        stamp = self._file_stamp()
+        if self._entries is not None and stamp == self._stamp:
+            return self._entries
         entries = {}
-        try:
-            with open(self.filename, 'rb') as f:
-                while True:
-                    pos = f.tell()
-                    line = f.readline()
-                    if not line:
-                        break
-                    if line[0:1] == b'X':
-                        continue
-                    if len(line) < 93:
-                        continue
-                    type_char = chr(line[0])
-                    name = line[1:65].split(b'\x00', 1)[0].decode()
-                    size = int(line[65:73])
-                    timestamp = int(line[73:83])
-                    offset = int(line[83:93])
-                    entries[name] = {'type': type_char, 'size': size, 'timestamp': timestamp, 'offset': offset}
-        except FileNotFoundError:
-            pass
+        with open(self.filename, 'rb') as f:
+            magic, self.dir_offset, self.capacity, self.used = HEADER.unpack(f.read(HEADER.size))
+            f.seek(self.dir_offset)
+            raw = f.read(self.used * RECORD.size)
+        for slot, (type_char, name, size, timestamp, offset) in enumerate(RECORD.iter_unpack(raw)):
+            if type_char == b'X':
+                continue
+            name = name.split(b'\x00', 1)[0].decode()
+            entries[name] = {'type': type_char.decode(), 'size': size, 'timestamp': timestamp,
+                             'offset': offset, 'slot': slot}
+        self._entries = entries
+        self._stamp = stamp
         return entries
 
-    def _write_entry(self, entry):
+    def _write_entry(self, type_char, name, size, offset):
+        entries = self._read_directory()
+        timestamp = int(time.time())
+        record = RECORD.pack(type_char.encode(), name.encode(), size, timestamp, offset)
+        with open(self.filename, 'r+b') as f:
+            if self.used == self.capacity:
+                self._grow_directory(f)
+            f.seek(self.dir_offset + self.used * RECORD.size)
+            f.write(record)
+            self.used += 1
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, self.dir_offset, self.capacity, self.used))
+        entries[name] = {'type': type_char, 'size': size, 'timestamp': timestamp,
+                         'offset': offset, 'slot': self.used - 1}
+        self._stamp = self._file_stamp()
+
+    def _grow_directory(self, f):
+        f.seek(self.dir_offset)
+        raw = f.read(self.used * RECORD.size)
+        self.capacity *= 2
+        self.dir_offset = f.seek(0, os.SEEK_END)
+        f.write(raw)
+        f.write(b'\x00' * ((self.capacity - self.used) * RECORD.size))
+
+    def _append_content(self, content):
+        # the directory region is untouched, so a cached directory stays valid
+        current = self._entries is not None and self._file_stamp() == self._stamp
         with open(self.filename, 'ab') as f:
-            f.write(entry.encode('utf-8'))
+            offset = f.seek(0, os.SEEK_END)
+            f.write(content)
+        if current:
+            self._stamp = self._file_stamp()
+        return offset
+
+    def _read_content(self, meta):
+        with open(self.filename, 'rb') as f:
+            f.seek(meta['offset'])
+            return f.read(meta['size'])
+
+    def _migrate(self):
+        # Old layout: 93-byte text headers interleaved with the contents
+        old = []
+        with open(self.filename, 'rb') as f:
+            while True:
+                line = f.readline()
+                if not line:
+                    break
+                if line[0:1] == b'X' or len(line) < 93:
+                    continue
+                try:
+                    old.append((chr(line[0]), line[1:65].split(b'\x00', 1)[0].decode(),
+                                int(line[65:73]), int(line[73:83]), int(line[83:93])))
+                except ValueError:
+                    continue
+            records = []
+            capacity = INITIAL_CAPACITY
+            while capacity < len(old):
+                capacity *= 2
+            data_offset = HEADER.size + capacity * RECORD.size
+            contents = []
+            for type_char, name, size, timestamp, offset in old:
+                f.seek(offset)
+                content = f.read(size) if type_char == 'F' else b''
+                records.append(RECORD.pack(type_char.encode(), name.encode(), len(content),
+                                           timestamp, data_offset if type_char == 'F' else 0))
+                contents.append(content)
+                data_offset += len(content)
+        with open(self.filename + '.tmp', 'wb') as f:
+            f.write(HEADER.pack(MAGIC, HEADER.size, capacity, len(records)))
+            f.write(b''.join(records).ljust(capacity * RECORD.size, b'\x00'))
+            f.write(b''.join(contents))
+        os.replace(self.filename + '.tmp', self.filename)
 
     def cp(self, source, destination):
         if not destination.startswith('+'):
@@ -47,10 +135,7 @@ class SupplementaryFileSystem:
             if source_name not in entries:
                 print("Source file not found.")
                 return
-            meta = entries[source_name]
-            with open(self.filename, 'rb') as f:
-                f.seek(meta['offset'])
-                content = f.read(meta['size'])
+            content = self._read_content(entries[source_name])
         else:
             try:
                 with open(source, 'rb') as f:
@@ -64,29 +149,18 @@ class SupplementaryFileSystem:
         if dest_name in entries:
             self._mark_deleted(dest_name)
 
-        with open(self.filename, 'ab') as f:
-            offset = f.tell()
-            f.write(content)
-        entry = f"F{dest_name.ljust(64, chr(0))}{len(content):08d}{int(time.time()):010d}{offset:010d}\n"
-        self._write_entry(entry)
+        offset = self._append_content(content)
+        self._write_entry('F', dest_name, len(content), offset)
 
     def _mark_deleted(self, name):
-        try:
-            with open(self.filename, 'r+b') as f:
-                while True:
-                    pos = f.tell()
-                    line = f.readline()
-                    if not line:
-                        break
-                    if line[0:1] == b'X':
-                        continue
-                    entry_name = line[1:65].split(b'\x00', 1)[0].decode()
-                    if entry_name == name:
-                        f.seek(pos)
-                        f.write(b'X')
-                        return
-        except FileNotFoundError:
-            pass
+        entries = self._read_directory()
+        meta = entries.pop(name, None)
+        if meta is None:
+            return
+        with open(self.filename, 'r+b') as f:
+            f.seek(self.dir_offset + meta['slot'] * RECORD.size)
+            f.write(b'X')
+        self._stamp = self._file_stamp()
 
     def rm(self, filename):
         if not filename.startswith('+'):
@@ -104,8 +178,7 @@ class SupplementaryFileSystem:
             print("Must create supplementary directories.")
             return
         name = dirname[1:]
-        entry = f"D{name.ljust(64, chr(0))}{0:08d}{int(time.time()):010d}{0:010d}\n"
-        self._write_entry(entry)
+        self._write_entry('D', name, 0, 0)
 
     def rmdir(self, dirname):
         if not dirname.startswith('+'):
@@ -151,10 +224,7 @@ class SupplementaryFileSystem:
                 if src_name not in entries:
                     print(f"File {src} not found.")
                     return
-                meta = entries[src_name]
-                with open(self.filename, 'rb') as f:
-                    f.seek(meta['offset'])
-                    content = f.read(meta['size'])
+                content = self._read_content(entries[src_name])
             else:
                 try:
                     with open(src, 'rb') as f:
@@ -165,11 +235,8 @@ class SupplementaryFileSystem:
             files.append(content)
         merged_content = files[0] + files[1]
         merged_name = merged_filename[1:]
-        with open(self.filename, 'ab') as f:
-            offset = f.tell()
-            f.write(merged_content)
-        entry = f"F{merged_name.ljust(64, chr(0))}{len(merged_content):08d}{int(time.time()):010d}{offset:010d}\n"
-        self._write_entry(entry)
+        offset = self._append_content(merged_content)
+        self._write_entry('F', merged_name, len(merged_content), offset)
 
     def show(self, filename):
         if not filename.startswith('+'):
@@ -180,11 +247,8 @@ class SupplementaryFileSystem:
         if name not in entries:
             print("File not found.")
             return
-        meta = entries[name]
-        with open(self.filename, 'rb') as f:
-            f.seek(meta['offset'])
-            content = f.read(meta['size'])
-            print(content.decode('utf-8'))
+        content = self._read_content(entries[name])
+        print(content.decode('utf-8'))
 
 # Shell Code Below
 
@@ -199,6 +263,15 @@ def expand_variables(command):
             words[i] = os.environ.get(var_name, words[i])
     return " ".join(words)
 
+_pfs = None
+
+def get_pfs():
+    # One instance per session so the directory cache survives between commands
+    global _pfs
+    if _pfs is None:
+        _pfs = SupplementaryFileSystem()
+    return _pfs
+
 def do_command(command):
     command = expand_variables(command)
 
@@ -209,7 +282,7 @@ def do_command(command):
         return
 
     if arg[0] in ["cp", "rm", "mkdir", "rmdir", "ls", "merge", "show"]:
-        pfs = SupplementaryFileSystem()
+        pfs = get_pfs()
         if arg[0] == "cp":
             pfs.cp(arg[1], arg[2])
         elif arg[0] == "rm":
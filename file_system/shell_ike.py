@@ -1,6 +1,7 @@
 import os
 import sys
 import re
+import struct
 from datetime import datetime
 
 # copy a file from the source to the destination
@@ -42,13 +43,11 @@ def cp(source, dest):
     # remove any existing file at the destination
     entries = [entry for entry in entries if not (entry[0] == "F" and entry[1] == dest)]
 
-    offset = get_next_offset(entries) # get the next offset
-    size = len(content) # get the size of the content
+    offset, size = append_data(content) # write the content to the file
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S") # get the current timestamp
 
     entries.append(["F", dest, str(offset), str(size), timestamp]) # add new entry
     write_pfs_header(entries) # write the header
-    append_data(offset, content) # write the content to the file
     print(f"Copied {source} to {dest}")
 
 
@@ -201,12 +200,10 @@ def merge(file1, file2, output):
 
     merged = content1 + content2 # merge the content
     entries = read_pfs_header() # read the header
-    offset = get_next_offset(entries) # get the next offset
-    size = len(merged) # get the size of the merged content
+    offset, size = append_data(merged) # write the content to the file
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S") # get the current timestamp
     entries.append(["F", output, str(offset), str(size), timestamp]) # add new entry
     write_pfs_header(entries) # write the header
-    append_data(offset, merged) # write the content to the file
     print(f"Merged {file1} and {file2} into {output}")
 
 
@@ -232,24 +229,45 @@ def show(filename):
     print("ERROR: File not found")
 
 
-# write data to private.pfs
-def append_data(offset, content):
+# private.pfs layout:
+#   superblock (32 bytes): magic, offset of the first header block, high-water mark
+#   header blocks: capacity, bytes used, next block offset, then header text
+#   file data, appended at the high-water mark
+# the first header block ends at byte 1024 so data written by the old layout stays put
+PFS_MAGIC = b"IKEPFS2\n"
+SUPERBLOCK = struct.Struct("<8sQQ8x")  # magic, first header block, high-water mark
+BLOCK = struct.Struct("<IIQ")  # capacity, used, next block
+FIRST_BLOCK = SUPERBLOCK.size
+DATA_START = 1024
+
+
+# read the superblock, returns (first header block, high-water mark)
+def read_superblock(f):
+    f.seek(0)
+    magic, first_block, high_water = SUPERBLOCK.unpack(f.read(SUPERBLOCK.size))
+    return first_block, high_water
+
+
+def write_superblock(f, first_block, high_water):
+    f.seek(0)
+    f.write(SUPERBLOCK.pack(PFS_MAGIC, first_block, high_water))
+
+
+# write data to private.pfs at the high-water mark and return its offset
+def append_data(content):
+    data = content.encode() # convert content to bytes
     with open("private.pfs", "r+b") as f: # open in read+binary mode
+        first_block, offset = read_superblock(f)
         f.seek(offset) # go to the right spot
-        f.write(content.encode()) # write the content
+        f.write(data) # write the content
+        write_superblock(f, first_block, offset + len(data)) # move the high-water mark
+    return offset, len(data)
 
 
-# get the next offset of private.pfs
-def get_next_offset(entries):
-    max_offset = 1024  # data starts at byte 1024
-    for entry in entries:
-        if entry[0] == "F": # check if the entry is a file
-            offset = int(entry[2]) # get the offset
-            size = int(entry[3]) # get the size
-            end = offset + size 
-            if end > max_offset: # check if the end of the file goes past max offset
-                max_offset = end # update max offset
-    return max_offset
+# get the next offset of private.pfs (the persisted high-water mark)
+def get_next_offset(entries=None):
+    with open("private.pfs", "rb") as f:
+        return read_superblock(f)[1]
 
 
 # write header entry of private.pfs
@@ -259,26 +277,64 @@ def write_pfs_header(entries):
         header_data += "|".join(entry) + "\n" # join the entry with "|"
     header_bytes = header_data.encode() # convert header to bytes
 
-    if len(header_bytes) > 1024: # check if the header is too large
-        raise ValueError("Header too large!")
-
     with open("private.pfs", "r+b") as f: # open in read+binary mode
-        f.seek(0) # go to the start of the file
-        f.write(header_bytes) # write the header
-        f.write(b"\n" * (1024 - len(header_bytes))) # pad the rest with spaces
+        first_block, high_water = read_superblock(f)
+        block = first_block
+        while True:
+            f.seek(block)
+            capacity, used, next_block = BLOCK.unpack(f.read(BLOCK.size))
+            chunk, header_bytes = header_bytes[:capacity], header_bytes[capacity:]
+            if header_bytes and not next_block:
+                # chain a new block at the high-water mark, twice as big or big enough
+                next_block = high_water
+                new_capacity = max(capacity * 2, len(header_bytes))
+                f.seek(next_block)
+                f.write(BLOCK.pack(new_capacity, 0, 0) + b"\n" * new_capacity)
+                high_water = next_block + BLOCK.size + new_capacity
+                write_superblock(f, first_block, high_water)
+            f.seek(block)
+            f.write(BLOCK.pack(capacity, len(chunk), next_block) + chunk)
+            if not next_block:
+                break
+            block = next_block
 
 
 # read header entries and return a list of entries
 def read_pfs_header():
+    header_bytes = b""
     with open("private.pfs", "rb") as f: # open in read+binary mode
-        return [line.strip().split("|") for line in f.read().decode().splitlines() if line.strip().count("|") >= 4] # read the header and split it into entries
+        block = read_superblock(f)[0]
+        while block:
+            f.seek(block)
+            capacity, used, block = BLOCK.unpack(f.read(BLOCK.size))
+            header_bytes += f.read(used) # only the used part of each block
+    return [line.strip().split("|") for line in header_bytes.decode().splitlines() if line.strip().count("|") >= 4] # split it into entries
 
 
 # check if the private.pfs file exists and if not create it
 def initialize_pfs():
     if not os.path.exists("private.pfs"): # check if the file exists
-        with open("private.pfs", "w") as f: # create the file
-            f.write("")  # write an empty string
+        with open("private.pfs", "wb") as f: # create the file
+            f.write(SUPERBLOCK.pack(PFS_MAGIC, FIRST_BLOCK, DATA_START))
+            capacity = DATA_START - FIRST_BLOCK - BLOCK.size
+            f.write(BLOCK.pack(capacity, 0, 0) + b"\n" * capacity)
+        return
+    with open("private.pfs", "rb") as f:
+        if f.read(len(PFS_MAGIC)) == PFS_MAGIC:
+            return
+    upgrade_pfs()
+
+
+# convert the old layout (header text in the first 1024 bytes) in place
+def upgrade_pfs():
+    with open("private.pfs", "r+b") as f:
+        old_header = f.read(DATA_START)
+        entries = [line.strip().split("|") for line in old_header.decode().splitlines() if line.strip().count("|") >= 4]
+        high_water = max(f.seek(0, os.SEEK_END), DATA_START)
+        write_superblock(f, FIRST_BLOCK, high_water)
+        capacity = DATA_START - FIRST_BLOCK - BLOCK.size
+        f.write(BLOCK.pack(capacity, 0, 0) + b"\n" * capacity)
+    write_pfs_header(entries)
 
 
 # run the private.pfs commands
@@ -1,3 +1,4 @@
+import bisect
 import os
 import struct
 
@@ -5,71 +6,130 @@ PFS_FILE = "private.pfs"
 ENTRY_SIZE = 256
 MAX_ENTRIES = 1024
 
+TABLE_SIZE = ENTRY_SIZE * MAX_ENTRIES
+
 def ensure_pfs_exists(): #this makes sure that the pfs exists or make it
     if not os.path.exists(PFS_FILE):
         with open(PFS_FILE, "wb") as f:
-            f.write(b"\x00" * ENTRY_SIZE * MAX_ENTRIES)
+            f.truncate(TABLE_SIZE) #sparse, an empty table uses no disk blocks
+
+class SlotTable: #whole slot table kept in memory until another shell writes private.pfs
+    def __init__(self):
+        self.fd = os.open(PFS_FILE, os.O_RDWR)
+        self.raw = bytearray(os.pread(self.fd, TABLE_SIZE, 0).ljust(TABLE_SIZE, b"\x00"))
+        self.names = {} #name -> slot indexes, lowest first
+        self.free = [] #stack of free slots, lowest on top
+        for i in range(MAX_ENTRIES - 1, -1, -1):
+            if self._is_empty(i):
+                self.free.append(i)
+        for i in range(MAX_ENTRIES):
+            if not self._is_empty(i):
+                self.names.setdefault(self._name(i), []).append(i)
+        self._restamp()
+
+    def _stamp(self):
+        st = os.stat(PFS_FILE)
+        return (st.st_mtime_ns, st.st_size)
+
+    def _restamp(self): #after our own writes, so only other shells' writes make the table stale
+        self.stamp = self._stamp()
+
+    def current(self):
+        return self._stamp() == self.stamp
+
+    def _slot(self, i):
+        return self.raw[i * ENTRY_SIZE:(i + 1) * ENTRY_SIZE]
+
+    def _is_empty(self, i):
+        return self._slot(i).count(0) == ENTRY_SIZE
+
+    def _name(self, i):
+        return self._slot(i)[:128].rstrip(b"\x00").decode()
+
+    def _store(self, i, entry): #write through with one positioned write
+        self.raw[i * ENTRY_SIZE:(i + 1) * ENTRY_SIZE] = entry
+        os.pwrite(self.fd, entry, i * ENTRY_SIZE)
+        self._restamp()
+
+    def append(self, content): #file content goes at the end, returns its offset
+        offset = os.fstat(self.fd).st_size
+        os.pwrite(self.fd, content, offset)
+        self._restamp()
+        return offset
+
+    def entry(self, i):
+        entry = self._slot(i)
+        is_dir = struct.unpack("B", entry[128:129])[0]
+        size = struct.unpack("I", entry[129:133])[0]
+        offset = struct.unpack("Q", entry[133:141])[0]
+        return {"index": i, "name": self._name(i), "is_dir": is_dir, "size": size, "offset": offset}
+
+    def find(self, name):
+        slots = self.names.get(name)
+        return self.entry(slots[0]) if slots else None
+
+    def add(self, entry):
+        if not self.free:
+            return False
+        i = self.free.pop()
+        self._store(i, entry)
+        bisect.insort(self.names.setdefault(self._name(i), []), i)
+        return True
+
+    def delete(self, name):
+        slots = self.names.get(name)
+        if not slots:
+            return False
+        i = slots.pop(0)
+        if not slots:
+            del self.names[name]
+        self._store(i, bytes(ENTRY_SIZE))
+        self.free.append(i)
+        return True
+
+    def entries(self):
+        for i in sorted(i for slots in self.names.values() for i in slots):
+            yield self.entry(i)
+
+    def read(self, entry):
+        return os.pread(self.fd, entry["size"], entry["offset"])
+
+_table = None
+
+def get_table():
+    global _table
+    if _table is not None and not _table.current(): #another shell took or freed slots
+        os.close(_table.fd)
+        _table = None
+    if _table is None:
+        _table = SlotTable()
+    return _table
 
 def find_pfs_entry(name): #find a file or directory using its name
-    with open(PFS_FILE, "rb") as f:
-        for i in range(MAX_ENTRIES):
-            entry = f.read(ENTRY_SIZE)
-            if entry.strip(b"\x00") == b"":
-                continue
-            entry_name = entry[:128].rstrip(b"\x00").decode()
-            if entry_name == name:
-                is_dir = struct.unpack("B", entry[128:129])[0]
-                size = struct.unpack("I", entry[129:133])[0]
-                offset = struct.unpack("Q", entry[133:141])[0]
-                return {"index": i, "name": entry_name, "is_dir": is_dir, "size": size, "offset": offset} #return its data
-    return None
+    return get_table().find(name)
 
 def write_pfs_entry(name, is_dir, size, offset): #make new file or dir
     name_bytes = name.encode().ljust(128, b"\x00")
     entry = name_bytes + struct.pack("B", is_dir) + struct.pack("I", size) + struct.pack("Q", offset)
     entry = entry.ljust(ENTRY_SIZE, b"\x00")
-    with open(PFS_FILE, "rb+") as f:
-        for i in range(MAX_ENTRIES): 
-            f.seek(i * ENTRY_SIZE)
-            e = f.read(ENTRY_SIZE)
-            if e.strip(b"\x00") == b"":
-                f.seek(i * ENTRY_SIZE)
-                f.write(entry)
-                return
+    if not get_table().add(entry):
         print("PFS directory full.")
 
 def delete_pfs_entry(name): #zeros to delete
-    with open(PFS_FILE, "rb+") as f:
-        for i in range(MAX_ENTRIES):
-            f.seek(i * ENTRY_SIZE)
-            entry = f.read(ENTRY_SIZE)
-            entry_name = entry[:128].rstrip(b"\x00").decode() #here
-            if entry_name == name:
-                f.seek(i * ENTRY_SIZE)
-                f.write(b"\x00" * ENTRY_SIZE)
-                return True
-    return False
+    return get_table().delete(name)
 
 def list_pfs_entries(): #show everything
-    with open(PFS_FILE, "rb") as f:
-        for i in range(MAX_ENTRIES):
-            entry = f.read(ENTRY_SIZE)
-            if entry.strip(b"\x00") == b"":
-                continue
-            name = entry[:128].rstrip(b"\x00").decode()
-            is_dir = struct.unpack("B", entry[128:129])[0]
-            size = struct.unpack("I", entry[129:133])[0]
-            print(f"{name} ({'DIR' if is_dir else f'{size} bytes'})")
+    for entry in get_table().entries():
+        name, is_dir, size = entry["name"], entry["is_dir"], entry["size"]
+        print(f"{name} ({'DIR' if is_dir else f'{size} bytes'})")
 
 def show_pfs_file(name): #Show 
     entry = find_pfs_entry(name)
     if not entry or entry["is_dir"]:
         print("File not found or is a directory.")
         return
-    with open(PFS_FILE, "rb") as f:
-        f.seek(entry["offset"])
-        content = f.read(entry["size"])
-        print(content.decode(errors="ignore"))
+    content = get_table().read(entry)
+    print(content.decode(errors="ignore"))
 
 def pfs_cp(args): #copy
     if len(args) != 3:
@@ -79,13 +139,11 @@ def pfs_cp(args): #copy
     if not os.path.isfile(src):
         print("Source file not found.")
         return
-    with open(src, "rb") as f_src, open(PFS_FILE, "ab+") as f_pfs:
+    with open(src, "rb") as f_src:
         content = f_src.read()
-        f_pfs.seek(0, os.SEEK_END)
-        offset = f_pfs.tell()
-        f_pfs.write(content)
-        write_pfs_entry(dest, is_dir=0, size=len(content), offset=offset)
-        print(f"Copied '{src}' to PFS as '{dest}'.")
+    offset = get_table().append(content)
+    write_pfs_entry(dest, is_dir=0, size=len(content), offset=offset)
+    print(f"Copied '{src}' to PFS as '{dest}'.")
 
 def pfs_rm(args): #remove
     if len(args) != 2:
@@ -120,15 +178,10 @@ def pfs_rmdir(args): #remove dir
         print("Directory not found.")
         return
     # Make sure no files are inside the directory
-    with open(PFS_FILE, "rb") as f:
-        for i in range(MAX_ENTRIES):
-            entry_raw = f.read(ENTRY_SIZE)
-            if entry_raw.strip(b"\x00") == b"":
-                continue
-            ename = entry_raw[:128].rstrip(b"\x00").decode()
-            if ename.startswith(name + "/"):
-                print("Directory is not empty.")
-                return
+    for ename in get_table().names:
+        if ename.startswith(name + "/"):
+            print("Directory is not empty.")
+            return
     delete_pfs_entry(name)
     print(f"Removed directory '{name}' from PFS.")
 
@@ -147,19 +200,13 @@ def pfs_merge(args): #combine
         print("Destination file already exists in PFS.")
         return
 
-    with open(PFS_FILE, "rb") as f:
-        f.seek(entry1["offset"])
-        content1 = f.read(entry1["size"])
-
-        f.seek(entry2["offset"])
-        content2 = f.read(entry2["size"])
+    content1 = get_table().read(entry1)
+    content2 = get_table().read(entry2)
 
     merged_content = content1 + content2
 
-    with open(PFS_FILE, "ab") as f:
-        offset = f.tell()
-        f.write(merged_content)
-        write_pfs_entry(dest_name, is_dir=0, size=len(merged_content), offset=offset)
+    offset = get_table().append(merged_content)
+    write_pfs_entry(dest_name, is_dir=0, size=len(merged_content), offset=offset)
     
     print(f"Merged '{file1_name}' and '{file2_name}' into '{dest_name}'")
 
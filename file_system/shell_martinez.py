@@ -1,7 +1,11 @@
 import os
 import sys
 import re
-import pfs  
+import pfs_crc
+import pfs_engines
+
+# the private.pfs backend, pfs.py unless --engine picks another
+engine = None
 
 def split_command(command):
     return re.findall(r'".*?"|\S+', command)
@@ -111,6 +115,14 @@ def do_command(command):
         change_dir(arg)
         return
 
+    if arg[0] == "snapshot":
+        engine.snapshot(arg[1] if len(arg) > 1 else None)
+        return
+
+    if arg[0] == "fsck":
+        engine.fsck()
+        return
+
     
     arg, input_file, output_file = redirection(arg)
     if arg is None:
@@ -120,23 +132,25 @@ def do_command(command):
     if any(word.startswith('+') or '+' in word for word in arg):
         try:
             if arg[0] == "cp":
-                pfs.cp_pfs(arg[1], arg[2])
+                engine.cp(arg[1], arg[2])
             elif arg[0] == "rm":
-                pfs.rm_pfs(arg[1])
+                engine.rm(arg[1])
             elif arg[0] == "mkdir":
-                pfs.mkdir_pfs(arg[1])
+                engine.mkdir(arg[1])
             elif arg[0] == "rmdir":
-                pfs.rmdir_pfs(arg[1])
+                engine.rmdir(arg[1])
             elif arg[0] == "ls":
-                pfs.ls_pfs(arg[1] if len(arg) > 1 else None)
+                engine.ls(arg[1] if len(arg) > 1 else None)
             elif arg[0] == "merge":
-                pfs.merge_pfs(arg[1], arg[2], arg[3])
+                engine.merge(arg[1], arg[2], arg[3])
             elif arg[0] == "show":
-                pfs.show_pfs(arg[1])
+                engine.show(arg[1])
             else:
                 print(f"{arg[0]}: Not implemented for supplemental files")
         except IndexError:
             print(f"{arg[0]}: Missing argument")
+        except pfs_crc.ChecksumError as e:
+            print(f"{arg[0]}: {e}")
         return
 
     
@@ -183,6 +197,9 @@ def process_in(fd):
             do_command(command)
 
 def main():
+    global engine
+    engine = pfs_engines.select(sys.argv, "log")
+    engine.fsck(quiet=True)
     if len(sys.argv) > 1:
         try:
             fd = open(sys.argv[1], "r")
@@ -270,38 +270,254 @@ def handle_supplementalFS_command(args) :
         print(f"\nUnsupported supplemental file system command: {cmd}\n")
 
 
+# finds the start of the next FILE or DIR block in private.pfs
+BLOCK_START = re.compile(rb'(FILE|DIR)_START (\S+)')
+SIZE_FIELD = re.compile(r'^size:\s*(.*)', re.MULTILINE)
+TIME_FIELD = re.compile(r'^last_modified:\s*(.*)', re.MULTILINE)
+TIME_FORMAT = '%m/%d/%Y %I:%M %p'
+# a removed or replaced block has its _START tag overwritten with this, same length
+DEAD_TAG = b'_DEAD_'
+# DIR fields are padded to a fixed width so the block can be rewritten in place
+SIZE_WIDTH = 20
+TIME_WIDTH = 19
+# dead blocks are only compacted away once there is at least this much of them
+COMPACT_MIN = 64 * 1024
+
+# index of the FILE_START/DIR_START blocks in private.pfs
+# built once per session and kept up to date as blocks change. Blocks are
+# appended at the end of the volume or changed in place with writes of the
+# same length, so offsets never shift; only compact() rewrites the file
+class BlockIndex:
+    def __init__(self, path='private.pfs'):
+        self.path = os.path.abspath(path)
+        self.stamp = None
+        self.data = bytearray()
+        # name -> (start, end) byte offsets of the block in the volume
+        self.files = {}
+        self.dirs = {}
+        # bytes of tombstoned blocks still in the volume
+        self.dead = 0
+        # dir -> {file name: (size, last modified)} and dir -> [total size, latest time]
+        self.dir_files = {}
+        self.dir_totals = {}
+
+    # re-reads private.pfs only if it changed outside of this session
+    def load(self):
+        st = os.stat(self.path)
+        if self.stamp == (st.st_mtime_ns, st.st_size):
+            return self
+        with open(self.path, 'rb') as f:
+            self.data = bytearray(f.read())
+        self.files = {}
+        self.dirs = {}
+        self.dir_files = {}
+        self.dir_totals = {}
+        # single pass over the volume, each block ends at the first matching _END tag
+        pos = 0
+        while True:
+            match = BLOCK_START.search(self.data, pos)
+            if not match:
+                break
+            kind, name = match.group(1), match.group(2).decode('utf-8')
+            end = self.data.find(kind + b'_END', match.end())
+            if end == -1:
+                break
+            end += len(kind + b'_END')
+            # a block appended later replaces an earlier one of the same name
+            if kind == b'FILE':
+                self.files[name] = (match.start(), end)
+            else:
+                self.dirs[name] = (match.start(), end)
+            pos = end
+        live = sum(end - start for table in (self.files, self.dirs) for start, end in table.values())
+        self.dead = len(self.data) - live
+        for name in self.files:
+            self._track(name)
+        self.stamp = (st.st_mtime_ns, st.st_size)
+        if self.dead > max(live, COMPACT_MIN):
+            self.compact()
+        return self
+
+    # metadata and content of a block without the START/END tags
+    def block(self, name, table):
+        if name not in table:
+            return None
+        start, end = table[name]
+        body = self.data[start:end].decode('utf-8')
+        tag = 'FILE_END' if table is self.files else 'DIR_END'
+        return body[body.find('\n') + 1:body.rfind(tag)]
+
+    def content(self, name):
+        body = self.block(name, self.files)
+        if body is None:
+            return None
+        at = body.find('content:')
+        if at == -1:
+            return ''
+        return body[at + len('content:'):].strip()
+
+    # (size, last_modified) strings from a FILE or DIR block
+    def info(self, body):
+        size = SIZE_FIELD.search(body)
+        last_modified = TIME_FIELD.search(body)
+        if not size or not last_modified:
+            return None
+        return size.group(1).strip(), last_modified.group(1).strip()
+
+    def _restamp(self):
+        st = os.stat(self.path)
+        self.stamp = (st.st_mtime_ns, st.st_size)
+
+    # appends a block at the end of the volume and returns its (start, end)
+    def _append(self, block):
+        new = f'\n{block}\n'.encode('utf-8')
+        start = len(self.data) + 1
+        with open(self.path, 'ab') as f:
+            f.write(new)
+        self.data += new
+        self._restamp()
+        return (start, start + len(new) - 2)
+
+    # overwrites bytes at start with the same number of new bytes
+    def _overwrite(self, start, new):
+        with open(self.path, 'r+b') as f:
+            f.seek(start)
+            f.write(new)
+        self.data[start:start + len(new)] = new
+        self._restamp()
+
+    # tombstones a block, its bytes stay in the volume until compact()
+    def _kill(self, start, end):
+        self._overwrite(self.data.find(b'_START', start), DEAD_TAG)
+        self.dead += end - start
+
+    # rewrites the volume with only the live blocks, in their current order
+    def compact(self):
+        blocks = sorted(((span, table, name) for table in (self.files, self.dirs) for name, span in table.items()),
+                        key=lambda block: block[0])
+        out = bytearray()
+        for (start, end), table, name in blocks:
+            table[name] = (len(out) + 1, len(out) + 1 + end - start)
+            out += b'\n' + self.data[start:end] + b'\n'
+        with open(self.path + '.tmp', 'wb') as f:
+            f.write(out)
+        os.replace(self.path + '.tmp', self.path)
+        self.data = out
+        self.dead = 0
+        self._restamp()
+
+    # adds the file's size and time to its directory rollup, replacing any old values
+    def _track(self, name):
+        dir_name = name.split('/')[0] if '/' in name else None
+        if dir_name is None:
+            return None
+        info = self.info(self.block(name, self.files))
+        size = int(info[0]) if info and info[0].isdigit() else 0
+        try:
+            last_modified = datetime.strptime(info[1], TIME_FORMAT) if info else None
+        except ValueError:
+            last_modified = None
+        files = self.dir_files.setdefault(dir_name, {})
+        totals = self.dir_totals.setdefault(dir_name, [0, None])
+        if name in files:
+            totals[0] -= files[name][0]
+        files[name] = (size, last_modified)
+        totals[0] += size
+        if last_modified and (totals[1] is None or last_modified > totals[1]):
+            totals[1] = last_modified
+        return dir_name
+
+    # takes the file back out of its directory rollup
+    def _untrack(self, name):
+        if '/' not in name:
+            return
+        dir_name = name.split('/')[0]
+        files = self.dir_files.get(dir_name, {})
+        if name not in files:
+            return
+        size, last_modified = files.pop(name)
+        totals = self.dir_totals[dir_name]
+        totals[0] -= size
+        # only rescan the directory when the newest file was the one removed
+        if last_modified and last_modified == totals[1]:
+            times = [t for _, t in files.values() if t]
+            totals[1] = max(times) if times else None
+
+    # creates or overwrites a file block with new content
+    def write_file(self, name, content):
+        size = len(content.encode('utf-8'))
+        last_modified = datetime.now().strftime(TIME_FORMAT)
+        new_block = f'FILE_START {name}\nsize: {size}\nlast_modified: {last_modified}\ncontent: {content}\nFILE_END'
+        # the new block goes in first, so a crash in between leaves the old or the new file
+        old = self.files.get(name)
+        self.files[name] = self._append(new_block)
+        if old:
+            self._kill(*old)
+        self.update_dir(self._track(name))
+
+    def remove_file(self, name):
+        self._kill(*self.files.pop(name))
+        self._untrack(name)
+        if '/' in name:
+            self.update_dir(name.split('/')[0])
+
+    def _dir_block(self, name, size, last_modified):
+        return f'DIR_START {name}\nsize: {size:<{SIZE_WIDTH}}\nlast_modified: {last_modified:<{TIME_WIDTH}}\nDIR_END'
+
+    def add_dir(self, name):
+        self.dirs[name] = self._append(self._dir_block(name, '??', '??'))
+
+    def remove_dir(self, name):
+        self._kill(*self.dirs.pop(name))
+        self.dir_files.pop(name, None)
+        self.dir_totals.pop(name, None)
+
+    def files_in_dir(self, dir_name):
+        return [name for name in self.files if name.startswith(dir_name + '/')]
+
+    # rewrites the DIR block from the in-memory size and time rollups
+    def update_dir(self, dir_name):
+        if dir_name not in self.dirs:
+            return
+        total_size, latest = self.dir_totals.get(dir_name, [0, None])
+        new_time = latest.strftime(TIME_FORMAT) if latest else '??'
+        new_block = self._dir_block(dir_name, str(total_size), new_time)
+        start, end = self.dirs[dir_name]
+        if len(new_block.encode('utf-8')) == end - start:
+            self._overwrite(start, new_block.encode('utf-8'))
+        else:
+            # unpadded blocks from older volumes move to the end once
+            self.dirs[dir_name] = self._append(new_block)
+            self._kill(start, end)
+
+block_index = None
+
+# returns the session's block index, loading private.pfs if needed
+def get_index():
+    global block_index
+    if block_index is None:
+        block_index = BlockIndex()
+    return block_index.load()
+
 # function to cp within the supplemental file system
 def copy(src, dest):
-    inDir = False
-    # open private.pfs for reading
-    with open('private.pfs', 'r') as f:
-        file_data = f.read()
+    blocks = helper_load()
+    if not blocks:
+        return
     # find out if the dest is within a dir
     if '/' in dest:
         dir_name = dest.split('/')[0]
-        dir_pattern = rf'DIR_START {re.escape(dir_name)}\s+(.*?)DIR_END'
-        dir_block = re.search(dir_pattern, file_data, re.DOTALL)
-        if not dir_block: # the directory does not exist
+        if dir_name not in blocks.dirs: # the directory does not exist
             print(f'Directory: {dir_name} does not exist')
             return
-        inDir = True
     
     # if the src is within the supplemental file system
     if src.startswith('+'):
-        # get the content of src (capture everything between FILE_START and FILE_END '(.*?)')
-        # do it accross multiple lines (re.DOTALL)
-        src_match = re.search(rf'FILE_START {re.escape(src)}\s+(.*?)FILE_END', file_data, re.DOTALL)
-        if not src_match: # src is not within the supplemental file system
+        # get the content of src from its indexed block
+        src_content = blocks.content(src)
+        if src_content is None: # src is not within the supplemental file system
             print(f'File: {src} not found')
             return
-        # otherwise extract the files metadata and only capture the content
-        content_match = re.search(r'content:\s*(.*?)$', src_match.group(1), re.DOTALL)
-        # if there is content
-        if content_match:
-            # clean the content
-            src_content = content_match.group(1).strip()
-        else: # there was no content
-            src_content = ''
     # otherwise the src is in the OS file system
     else:
         # if the file is in the OS file system
@@ -312,51 +528,22 @@ def copy(src, dest):
         with open(src, 'r') as f_src:
             # get its contents
             src_content = f_src.read().strip()
-    # get the content of the dest file
-    dest_match = re.search(rf'(FILE_START {re.escape(dest)}\s+.*?content:)(.*?)(FILE_END)', file_data, re.DOTALL)
-    if not dest_match: # dest is not within the supplemental file system
-        # create the dest supplementary file
-        create_new_file(dest)
-        # re-read the file
-        with open('private.pfs', 'r') as f:
-            file_data = f.read()
-        # get its content
-        dest_match = re.search(rf'(FILE_START {re.escape(dest)}\s+.*?content:)(.*?)(FILE_END)', file_data, re.DOTALL)
-    # create the new file block (split into 3 parts:
-    # group(1) - everything up to content
-    # group(2) - the content section
-    # group(3) - the FILE_END tag
-    new_block = f'{dest_match.group(1)}{dest_match.group(2)}{dest_match.group(3)}'
-    # update the files metadata
-    mod_file = update_file_metadata(new_block, src_content)
-    # set up content to write into dest:
-    # everything before the destination file +
-    # the modified destination file
-    # everythin after the destination file
-    new_data = (file_data[:dest_match.start()] +
-                mod_file +
-                file_data[dest_match.end():])
-    # write content into the supplemental file system
-    with open("private.pfs", "w") as f:
-        f.write(new_data)
-    # update the metadata for the directory (if the file exists within a dir)
-    if inDir:
-        update_dir_metadata(dir_name)
+    # create or overwrite the dest block, this also updates the dir rollup
+    blocks.write_file(dest, src_content)
 
 # function to show within the supplemental file system
 def show(src):
     # find out if the file is within the supplemental file system
-    file = helper_find_file(src)
-    if not file:
+    blocks = helper_load()
+    if not blocks:
+        return
+    content = blocks.content(src)
+    if content is None:
         print(f'File: {src} not found')
         return
-    # get the metadata
-    file_data = file.group(1)
-    # extract the content
-    match = re.search(r'content:\s*(.*?)$', file_data, re.DOTALL)
     # if there is content
-    if match:
-        print(match.group(1).strip())
+    if content:
+        print(content)
     # if there is no content
     else:
         print("No content found")
@@ -366,10 +553,10 @@ def show(src):
 def helper_get_file_content(file):
     #supplementary file system
     if file.startswith('+'):
-        file_data = helper_find_file(file)
-        if not file_data:
+        blocks = helper_load()
+        if not blocks:
             return None
-        return re.search(r'content:\s*(.*?)$', file_data.group(1), re.DOTALL).group(1).strip() #contents of the file in string format
+        return blocks.content(file) #contents of the file in string format
     #regular file
     else:
         if not os.path.exists(file): #file not found
@@ -379,19 +566,15 @@ def helper_get_file_content(file):
 
 # function to merge within the supplemental file system
 def merge(src1, src2, dest):
-    inDir = False
-    # open private.pfs for reading
-    with open('private.pfs', 'r') as f:
-        file_data = f.read()
+    blocks = helper_load()
+    if not blocks:
+        return
     # find out if the dest is within a dir
     if '/' in dest:
         dir_name = dest.split('/')[0]
-        dir_pattern = rf'DIR_START {re.escape(dir_name)}\s+(.*?)DIR_END'
-        dir_block = re.search(dir_pattern, file_data, re.DOTALL)
-        if not dir_block: # the directory does not exist
+        if dir_name not in blocks.dirs: # the directory does not exist
             print(f'Directory: {dir_name} does not exist')
             return
-        inDir = False
     src1_content = helper_get_file_content(src1)
     src2_content = helper_get_file_content(src2)
 
@@ -405,105 +588,66 @@ def merge(src1, src2, dest):
     dest_content = str(src1_content)  + str(src2_content) #contents concat
 
     if dest.startswith("+"): #if dest in supplementary file system
-        dest_file = helper_find_file(dest)
-        if not dest_file: #if dest not found, create it
+        if dest not in blocks.files: #if dest not found, create it
             print(f"File: {dest} not found")
             print(f"Creating new {dest} file")
-            create_new_file(dest)
-            dest_file = helper_find_file(dest)
-                
-        with open('private.pfs', 'r') as f:
-            file_data = f.read()
-
-        #getting and updating the metadata
-        dest_match = re.search(rf'(FILE_START {re.escape(dest)}\s+.*?content:)(.*?)(FILE_END)', file_data, re.DOTALL)
-        new_block = f'{dest_match.group(1)}{dest_match.group(2)}{dest_match.group(3)}'
-        new_dest = update_file_metadata(new_block, dest_content)
-
-        new_data = (file_data[:dest_match.start()] +
-                new_dest +
-                file_data[dest_match.end():])
-        
-        #writing updated info to supplementary file system
-        with open("private.pfs", "w") as f:
-            f.write(new_data)
-
-        #if the dest is in a dir, update the dir as well
-        dir_name = helper_in_directory(dest)
-        if (dir_name):
-            update_dir_metadata(dir_name)
+
+        #writing updated info to supplementary file system, the dir is updated as well
+        blocks.write_file(dest, dest_content)
         return
     
     #if it is a regular file
     with open(dest, "w") as f:
             f.write(dest_content)
-    # if the destination file is in a dir, update dir metadata
-    if inDir:
-        update_dir_metadata(dir_name)
 
 # function to rm within the supplemental file system
 def remove(src):
-
-    src_file = helper_find_file(src)
-    if not src_file: #verify file exists
+    blocks = helper_load()
+    if not blocks:
+        return
+    if src not in blocks.files: #verify file exists
         print(f"File {src} not found")
         return
     
-    #read fle system and ignore the file we wish to remove
-    with open('private.pfs', 'r') as f:
-        file_data = f.read()
-    new_data = (file_data[:src_file.start()].strip() + "\n\n" +
-            file_data[src_file.end():].strip() + "\n\n")
-    
-    #rewrite the file systme
-    with open("private.pfs", "w") as f:
-        f.write(new_data)
-
-    #update the directory if it was in one
-    dir_name = helper_in_directory(src)
-    if (dir_name):
-        update_dir_metadata(dir_name)
+    #tombstone the block in the file system and update the directory if it was in one
+    blocks.remove_file(src)
     
     return
 
 # function to ls within the supplemental file system
 def ls(src):
     # find out if it is a file and is within the supplemental file system
-    file = helper_find_file(src)
-    if not file:
-        file = helper_find_dir(src)
-        if not file:
+    file_data = helper_find_file(src)
+    if file_data is None:
+        file_data = helper_find_dir(src)
+        if file_data is None:
             print(f'File: {src} not found')
             return
-    # get the metadata
-    file_data = file.group(1)
     # extract size and last_modified
-    size = re.search(r'^size:\s*(.*)', file_data, re.MULTILINE)
-    last_modified = re.search(r'^last_modified:\s*(.*)', file_data, re.MULTILINE)
+    info = get_index().info(file_data)
     # if there is metadata
-    if size and last_modified:
-        print(f'Name: {src}\nSize: {size.group(1).strip()}\nLast Modified: {last_modified.group(1).strip()}')
+    if info:
+        print(f'Name: {src}\nSize: {info[0]}\nLast Modified: {info[1]}')
     # if there is no content
     else:
         print("No content found")
 
 # function to mkdir within the supplemental file system
 def mkdir(src):
-    new_dir = f'DIR_START {src}\nsize:??\nlast_modified:??\nDIR_END\n'
-    # open private.pfs for reading and writing
-    try:
-        with open('private.pfs', '+r') as f:
-            # seek to the end of the file
-            f.seek(0, os.SEEK_END)
-            f.write(new_dir)
-    except FileNotFoundError:
-        print('private.pfs not found')
+    blocks = helper_load()
+    if not blocks:
+        return
+    if src in blocks.dirs:
+        print(f'Directory: {src} already exists')
+        return
+    blocks.add_dir(src)
 
 # function to rmdir within the supplemental file system
 def rmdir(src):
-
-    dir_info = helper_find_dir(src)
-    if not dir_info: #verify dir exists
+    blocks = helper_load()
+    if not blocks:
+        return
+    if src not in blocks.dirs: #verify dir exists
         print(f"Dir {src} not found")
         return
     
@@ -514,140 +658,41 @@ def rmdir(src):
     
     print(f"Removing {src} directory")
 
-    dir_info = helper_find_dir(src)
-    #read the file system and ignore the dir metadata
-    with open('private.pfs', 'r') as f:
-        file_data = f.read()
-
-    new_data = (file_data[:dir_info.start()].strip() + "\n" +
-            file_data[dir_info.end():].strip() + "\n")
-    
-    #rewrite the file system
-    with open("private.pfs", "w") as f:
-        f.write(new_data)
+    #remove the dir block from the file system
+    blocks.remove_dir(src)
 
     return
 
-# helper function to find a file within the supplemental file system
-def helper_find_file(file):
-    # open private.pfs for reading
+# helper function to load the block index of the supplemental file system
+def helper_load():
     try:
-        with open('private.pfs', 'r') as f:
-            content = f.read()
-            # get the files metadata
-            pattern = rf'FILE_START {re.escape(file)}\s+(.*?)FILE_END'
-            return re.search(pattern, content, re.DOTALL)
+        return get_index()
     except FileNotFoundError:
         print('private.pfs not found')
         return None
 
+# helper function to find a file within the supplemental file system
+def helper_find_file(file):
+    # get the files metadata
+    blocks = helper_load()
+    if not blocks:
+        return None
+    return blocks.block(file, blocks.files)
+
 # helper function to find a directory within the supplemental file system
 def helper_find_dir(dir):
-    # open private.pfs for reading
-    try:
-        with open('private.pfs', 'r') as f:
-            content = f.read()
-            # get the dir metadata
-            pattern = rf'DIR_START {re.escape(dir)}\s+(.*?)DIR_END'
-            return re.search(pattern, content, re.DOTALL)
-    except FileNotFoundError:
-        print('private.pfs not found')
+    # get the dir metadata
+    blocks = helper_load()
+    if not blocks:
         return None
+    return blocks.block(dir, blocks.dirs)
     
-#helper that returns the dir_name if it is in a dir, false otherwise
-def helper_in_directory(file_name):
-    if '/' in file_name: #path contains dir
-        dir_name = file_name.split('/')[0]
-        dir_data = helper_find_dir(dir_name)
-        if not dir_data: #dir doesnt exist in file system
-            return False
-        return dir_name
-    return False
-
-
-# helper function to create a new file within the supplemental file system
-def create_new_file(file):
-    new_file = f'\nFILE_START {file}\nsize:??\nlast_modified:??\ncontent:??\nFILE_END\n'
-    # open private.pfs for reading and writing
-    try:
-        with open('private.pfs', '+r') as f:
-            # seek to the end of the file
-            f.seek(0, os.SEEK_END)
-            f.write(new_file)
-    except FileNotFoundError:
-        print('private.pfs not found')
-
-# helper function to update the file metadata
-def update_file_metadata(data, content):
-    # get the size of the content in bytes
-    size = len(content.encode('utf-8'))
-    # get the timestamp
-    last_modified = datetime.now().strftime('%m/%d/%Y %I:%M %p')
-    # replace the size, last modified, and content
-    data = re.sub(r'size:\s*.*', f'size: {size}', data)
-    data = re.sub(r'last_modified:\s*.*', f'last_modified: {last_modified}', data)
-    data = re.sub(r'content:\s*.*', f'content: {content}', data)
-    return data
-
-# helper function to update the dir metadata
-def update_dir_metadata(dir):
-    # get all the files within the directory
-    files = get_files_in_dir(dir)
-    # keep track of the size and timestamp
-    total_size = 0
-    latest_timestamp = None
-    # open private.pfs for reading
-    try:
-        with open('private.pfs', 'r') as f:
-            content = f.read()
-    except FileNotFoundError:
-        print('private.pfs not found')
-        return
-    # loop through the files within the directory
-    for filename in files:
-        # get the files metadata
-        data = re.search(rf'FILE_START {re.escape(filename)}\s+(.*?)FILE_END', content, re.DOTALL)
-        if data:
-            block = data.group(1)
-            # get the size and update total size if applicable
-            size = re.search(r'size:\s*(\d+)', block)
-            if size:
-                total_size += int(size.group(1))
-            # get the time and update latest timestamp if applicable
-            time = re.search(r'last_modified:\s*(.*)', block)
-            if time:
-                timestamp = datetime.strptime(time.group(1).strip(), "%m/%d/%Y %I:%M %p")
-                if not latest_timestamp or timestamp > latest_timestamp:
-                    latest_timestamp = timestamp
-    # set up the metadata for writing
-    new_size = f'size: {total_size}'
-    if latest_timestamp:
-        new_time = f'last_modified: {latest_timestamp.strftime("%m/%d/%Y %I:%M %p")}'
-    else:
-        new_time = 'last_modified: ??'
-    # update the metadata
-    dir_block = re.search(rf'(DIR_START {re.escape(dir)}\s+)size:\s*.*\nlast_modified:\s*.*(\s+DIR_END)', content)
-    if dir_block:
-        new_dir_block = f"{dir_block.group(1)}{new_size}\n{new_time}{dir_block.group(2)}"
-        content = content[:dir_block.start()] + new_dir_block + content[dir_block.end():]
-        with open("private.pfs", "w") as f:
-            f.write(content)
-
 # helper function to get all the files within the directory
 def get_files_in_dir(dir):
-    # open private.pfs for reading
-    try:
-        with open('private.pfs', 'r') as f:
-            content = f.read()
-        # Match all file blocks
-        pattern = r'FILE_START\s+(\+\S+)\s+.*?FILE_END'
-        files = re.findall(pattern, content, re.DOTALL)
-        # Filter those that start with +dirname/
-        files_in_dir = [f for f in files if f.startswith(dir + '/')]
-        return files_in_dir
-    except FileNotFoundError:
-        print("private.pfs not found")
+    blocks = helper_load()
+    if not blocks:
         return []
+    return blocks.files_in_dir(dir)
 
 def main():
     #check if the argument provided was a file
@@ -2,27 +2,41 @@ import os
 import sys
 import time
 import base64
+import struct
 
 PFS_FILENAME = 'private.pfs'
 
+# binary container: MAGIC, then records of
+# RECORD header | name (utf-8) | raw content blob
+# a later record for the same name replaces the earlier one, a DELETED
+# record removes it; space is reclaimed by PFSIndex.maybe_compact()
+MAGIC = b'PFSBIN1\n'
+RECORD = struct.Struct('<BHQQQ')  # kind, name length, timestamp, size, blob length
+LIVE = 0
+DELETED = 1
+COMPACT_MIN_BYTES = 64 * 1024
+
 #initialize container file
 
 def init_pfs():
     if not os.path.exists(PFS_FILENAME):
-        open(PFS_FILENAME, 'w').close()
+        with open(PFS_FILENAME, 'wb') as f:
+            f.write(MAGIC)
+        return
+    with open(PFS_FILENAME, 'rb') as f:
+        head = f.read(len(MAGIC))
+    if head != MAGIC:
+        migrate_text_pfs()
 
 # timestamp as string
 
 def get_timestamp():
     return str(int(time.time()))
 
-# load everything from private.pfs
-# name | timestamp | size | encoded_content
+#convert the old name|timestamp|size|base64 text format once
 
-def load_entries():
-    entries = []
-    if not os.path.exists(PFS_FILENAME):
-        return entries
+def migrate_text_pfs():
+    records = []
     with open(PFS_FILENAME, 'r') as f:
         for line in f:
             line = line.rstrip('\n')
@@ -33,61 +47,189 @@ def load_entries():
                 continue
             name, ts, size_str, encoded = parts
             try:
-                content = base64.b64decode(encoded).decode('utf-8')
+                blob = base64.b64decode(encoded)
             except Exception:
-                content = ''
-            entries.append({
+                blob = b''
+            records.append((name, int(ts), int(size_str), blob))
+    write_container(records)
+
+def write_container(records):
+    tmp = PFS_FILENAME + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        for name, ts, size, blob in records:
+            f.write(pack_record(LIVE, name, ts, size, blob))
+    os.replace(tmp, PFS_FILENAME)
+
+def pack_record(kind, name, ts, size, blob):
+    name_bytes = name.encode('utf-8')
+    return RECORD.pack(kind, len(name_bytes), ts, size, len(blob)) + name_bytes + blob
+
+# scan record headers only, skipping over content blobs
+# returns ({name: entry}, dead bytes, container size up to the last whole record)
+
+def scan_entries():
+    entries = {}
+    dead = 0
+    if not os.path.exists(PFS_FILENAME):
+        return entries, dead, 0
+    with open(PFS_FILENAME, 'rb') as f:
+        total = os.fstat(f.fileno()).st_size
+        if f.read(len(MAGIC)) != MAGIC:
+            return entries, dead, total
+        while True:
+            start = f.tell()
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                if head:
+                    total = start  # torn append
+                break
+            kind, name_len, ts, size, length = RECORD.unpack(head)
+            name = f.read(name_len)
+            offset = f.tell()
+            if len(name) < name_len or offset + length > total:
+                total = start  # torn append
+                break
+            name = name.decode('utf-8')
+            f.seek(length, os.SEEK_CUR)
+            old = entries.pop(name, None) if kind == DELETED else entries.get(name)
+            if old:
+                dead += old['record']
+            if kind == DELETED:
+                dead += f.tell() - start
+                continue
+            entries[name] = {
                 'name': name,
-                'timestamp': ts,
-                'size': int(size_str),
-                'content': content
-            })
-    return entries
+                'timestamp': str(ts),
+                'size': size,
+                'offset': offset,
+                'length': length,
+                'record': f.tell() - start
+            }
+    return entries, dead, total
+
+#read and decode the content of one entry
+
+def read_content(e):
+    with open(PFS_FILENAME, 'rb') as f:
+        f.seek(e['offset'])
+        return f.read(e['length']).decode('utf-8')
+
+#append one record, returns (blob offset, record length)
 
-#overwrite file with updated entry
+def append_record(kind, name, ts, size, blob=b''):
+    record = pack_record(kind, name, ts, size, blob)
+    with open(PFS_FILENAME, 'ab') as f:
+        start = f.seek(0, os.SEEK_END)
+        f.write(record)
+    return start + len(record) - len(blob), len(record)
 
-def save_entries(entries):
-    with open(PFS_FILENAME, 'w') as f:
-        for e in entries:
-            encoded = base64.b64encode(e['content'].encode('utf-8')).decode('utf-8')
-            f.write(f"{e['name']}|{e['timestamp']}|{e['size']}|{encoded}\n")
+def basename(name):
+    return name.rsplit('/', 1)[-1]
 
-#find entry by name
+#metadata of the whole volume, built once per shell session
+# entries: exact name -> entry, in listing order
+# by_base: last path component -> names ending in it, in listing order
 
-def find_entry(entries, name):
-    for e in entries:
-        if e['name'] == name:
+class PFSIndex:
+    def __init__(self):
+        self.entries, self.dead, self.total = scan_entries()
+        self.torn = os.path.exists(PFS_FILENAME) and os.path.getsize(PFS_FILENAME) > self.total
+        self.by_base = {}
+        for name in self.entries:
+            self.by_base.setdefault(basename(name), []).append(name)
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    #exact name first, then the first entry whose path ends in /name
+    def resolve(self, name):
+        e = self.entries.get(name)
+        if e:
             return e
-    return None
+        suffix = '/' + name
+        for cand in self.by_base.get(basename(name), ()):
+            if cand.endswith(suffix):
+                return self.entries[cand]
+        return None
 
-#create or update a PFS file/directory entry
+    #cut off a record left short by an interrupted append, or the next one lands behind it
+    def drop_torn_tail(self):
+        if self.torn:
+            os.truncate(PFS_FILENAME, self.total)
+            self.torn = False
 
-def write_file(name, content):
-    entries = load_entries()
-    ts = get_timestamp()
-    size = len(content)
-    existing = find_entry(entries, name)
-    if existing:
-        existing['timestamp'] = ts
-        existing['size'] = size
-        existing['content'] = content
-    else:
-        entries.append({
+    def put(self, name, ts, size, offset, length, record):
+        old = self.entries.get(name)
+        if old:
+            self.dead += old['record']
+        else:
+            self.by_base.setdefault(basename(name), []).append(name)
+        self.entries[name] = {
             'name': name,
-            'timestamp': ts,
+            'timestamp': str(ts),
             'size': size,
-            'content': content
-        })
-    save_entries(entries)
+            'offset': offset,
+            'length': length,
+            'record': record
+        }
+        self.total += record
+
+    def remove(self, name, record):
+        self.dead += self.entries.pop(name)['record'] + record
+        self.total += record
+        names = self.by_base[basename(name)]
+        names.remove(name)
+        if not names:
+            del self.by_base[basename(name)]
+
+    #rewrite only live records once deleted ones take over half the file
+    def maybe_compact(self):
+        if self.dead < COMPACT_MIN_BYTES or self.dead * 2 < self.total:
+            return
+        records = []
+        with open(PFS_FILENAME, 'rb') as f:
+            for e in self.entries.values():
+                f.seek(e['offset'])
+                records.append((e['name'], int(e['timestamp']), e['size'], f.read(e['length'])))
+        write_container(records)
+        self.__init__()
+
+_index = None
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = PFSIndex()
+    return _index
+
+# metadata of every entry
+# name | timestamp | size | blob offset and length
+
+def load_entries():
+    return list(get_index().entries.values())
+
+#create or update a PFS file/directory entry
+
+def write_file(name, content):
+    ts = int(get_timestamp())
+    blob = content.encode('utf-8')
+    index = get_index()
+    index.drop_torn_tail()
+    offset, record = append_record(LIVE, name, ts, len(content), blob)
+    index.put(name, ts, len(content), offset, len(blob), record)
+    index.maybe_compact()
 
 #Delete
 
 def delete_entry(name):
-    entries = load_entries()
-    new_entries = [e for e in entries if e['name'] != name]
-    if len(new_entries) == len(entries):
+    index = get_index()
+    if not index.get(name):
         return False
-    save_entries(new_entries)
+    index.drop_torn_tail()
+    _, record = append_record(DELETED, name, int(get_timestamp()), 0)
+    index.remove(name, record)
+    index.maybe_compact()
     return True
 
 #display files contents
@@ -99,16 +241,9 @@ def show_file(path):
         except FileNotFoundError:
             print(f"Error: '{path}' not found")
         return
-    name = path[1:]
-    entries = load_entries()
-    e = find_entry(entries, name)
-    if not e:
-        for ent in entries:
-            if ent['name'] == name or ent['name'].endswith('/' + name):
-                e = ent
-                break
+    e = get_index().resolve(path[1:])
     if e:
-        print(e['content'], end='')
+        print(read_content(e), end='')
     else:
         print("Error: File not found.")
 
@@ -118,17 +253,11 @@ def ls_file(path):
         os.system(f"ls {path}")
         return
     name = path[1:]
-    entries = load_entries()
     if name in ('', '.'):  # list all
-        for e in entries:
+        for e in load_entries():
             print(f"{e['name']}\t{e['size']} bytes\tLast Modified: {time.ctime(int(e['timestamp']))}")
     else:
-        e = find_entry(entries, name)
-        if not e:
-            for ent in entries:
-                if ent['name'] == name or ent['name'].endswith('/' + name):
-                    e = ent
-                    break
+        e = get_index().resolve(name)
         if e:
             print(f"{e['name']}\t{e['size']} bytes\tLast Modified: {time.ctime(int(e['timestamp']))}")
         else:
@@ -138,11 +267,11 @@ def ls_file(path):
 
 def cp_file(src, dst):
     if src.startswith('+'):
-        e = find_entry(load_entries(), src[1:])
+        e = get_index().get(src[1:])
         if not e:
             print("Source file not found.")
             return
-        content = e['content']
+        content = read_content(e)
     else:
         try:
             with open(src, 'r') as f:
@@ -181,13 +310,11 @@ def rmdir_fs(path):
             print(f"rmdir: {ex}")
         return
     name = path[1:].rstrip('/') + '/'
-    entries = load_entries()
-    e = find_entry(entries, name)
-    if not e:
+    if not get_index().get(name):
         print(f"rmdir: failed to remove '{path}': No directory")
         return
     #check children
-    children = [ent for ent in entries if ent['name'].startswith(name) and ent['name'] != name]
+    children = [ent for ent in load_entries() if ent['name'].startswith(name) and ent['name'] != name]
     if children:
         print(f"rmdir: failed to remove '{path}': Directory is not empty")
     else:
@@ -197,12 +324,11 @@ def merge_files(f1, f2, dst):
     #get content 1
     if f1.startswith('+'):
         name1 = f1[1:]
-        entries = load_entries()
-        e1 = find_entry(entries, name1) or find_entry(entries, name1 + '.txt')
+        e1 = get_index().get(name1) or get_index().get(name1 + '.txt')
         if not e1:
             print("One of the files does not exist.")
             return
-        c1 = e1['content']
+        c1 = read_content(e1)
     else:
         try:
             c1 = open(f1, 'r').read()
@@ -212,12 +338,11 @@ def merge_files(f1, f2, dst):
     #get content 2
     if f2.startswith('+'):
         name2 = f2[1:]
-        entries = load_entries()
-        e2 = find_entry(entries, name2) or find_entry(entries, name2 + '.txt')
+        e2 = get_index().get(name2) or get_index().get(name2 + '.txt')
         if not e2:
             print("One of th files does not exist.")
             return
-        c2 = e2['content']
+        c2 = read_content(e2)
     else:
         try:
             c2 = open(f2, 'r').read()
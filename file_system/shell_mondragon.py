@@ -13,7 +13,10 @@ import re
 
 # Import supplemental FS commands
 
-from supplemental_fs import cp, rm, mkdir, rmdir, ls, show, merge
+import pfs_engines
+
+# the private.pfs backend, supplemental_fs unless --engine picks another
+engine = None
 
 # cd method
 def cdCommand(command):
@@ -161,38 +164,42 @@ def process_line(line):
     if command[0] == 'inspiration':
         inspirationCommand()
         return
+
+    if command[0] == 'fsck':
+        engine.fsck()
+        return
     
     # Handle supplemental FS commands with checks for supplementary files
     if command[0] == "cp":
         if any(is_supplemental_file(arg) for arg in command[1:]):
-            cp(command[1], command[2])
+            engine.cp(command[1], command[2])
         else:
             # if working with regular cp (unix command)
             pass
         return
     
     elif command[0] == "rm" and is_supplemental_file(command[1]):
-        rm(command[1])
+        engine.rm(command[1])
         return
     
     elif command[0] == "mkdir" and is_supplemental_file(command[1]):
-        mkdir(command[1])
+        engine.mkdir(command[1])
         return
     
     elif command[0] == "rmdir" and is_supplemental_file(command[1]):
-        rmdir(command[1])
+        engine.rmdir(command[1])
         return
     
     elif command[0] == "ls" and len(command) >= 2 and is_supplemental_file(command[1]):
-        ls(command[1])
+        engine.ls(command[1])
         return
     
     elif command[0] == "show" and len(command) >= 2 and is_supplemental_file(command[1]):
-        show(command[1])
+        engine.show(command[1])
         return
     
     elif command[0] == "merge" and len(command) >= 4 and any(is_supplemental_file(arg) for arg in command[1:]):
-        merge(command[1], command[2], command[3])
+        engine.merge(command[1], command[2], command[3])
         return
 
     # Handle regular file operations (non-supplementary) -- JUST IN CASE
@@ -240,7 +247,10 @@ def process_line(line):
       
 def shell():
     
+    global engine
+    engine = pfs_engines.select(sys.argv, "text")
     welcomeBanner()
+    engine.fsck(quiet=True)
     
     # Check if a filename is provided, batch mode
     if len(sys.argv) > 1:
@@ -3,6 +3,7 @@ import os
 import sys
 import re
 import time
+import shutil
 
 def executable_path(command):
     paths = os.environ.get("PATH", "").split(":")
@@ -164,7 +165,7 @@ def execute_command(command, task=False):
         # Now safe to write
         new_file_name = dest
         now = get_timestamp()
-        size = len(content)
+        size = len(content.encode("utf-8"))
         data_line = f"F|{new_file_name}|{size}|{now}|{content}\n"
 
         with open("private.pfs", "a+") as pfs:
@@ -173,44 +174,15 @@ def execute_command(command, task=False):
             pfs.write(data_line)
 
         add_toc_entry(new_file_name, offset)
-        rebuild_toc()
 
         # If part of a directory, update directory entry
         if dir_name:
-            with open("private.pfs", "r+") as pfs:
-                lines = pfs.readlines()
-                try:
-                    data_index = lines.index("--DATA--\n")
-                except ValueError:
-                    print("--DATA-- not found")
-                    return
-
-                toc_lines = lines[:data_index]
-                data_lines = lines[data_index + 1:]
-
-                updated = False
-                new_data_lines = []
-                for line in data_lines:
-                    if line.startswith("D|") and line.split("|")[1] == dir_name:
-                        updated = True
-                        parts = line.strip().split("|")
-                        files = [f for f in parts[3:] if f.strip()]
-                        if file_name_only not in files:
-                            files.append(file_name_only)
-                        new_line = f"D|{parts[1]}|{parts[2]}|{'|'.join(files)}\n"
-                        new_data_lines.append(new_line)
-                    else:
-                        new_data_lines.append(line)
-
-                if not updated:
-                    print(f"Directory {dir_name} does not exist in private.pfs")
-                    return
-
-                with open("private.pfs", "w") as pfs:
-                    pfs.writelines(toc_lines)
-                    pfs.write("--DATA--\n")
-                    pfs.writelines(new_data_lines)
-        rebuild_toc()
+            def add_file(files):
+                if file_name_only not in files:
+                    files.append(file_name_only)
+                return files
+            if not update_dir_entry(dir_name, add_file):
+                print(f"Directory {dir_name} does not exist in private.pfs")
         return
 
 
@@ -235,99 +207,23 @@ def execute_command(command, task=False):
             filename = target[1:]
             dir_name = None
 
-        with open("private.pfs", "r") as pfs:
-            lines = pfs.readlines()
-
-        try:
-            data_index = lines.index("--DATA--\n")
-        except ValueError:
-            print("--DATA-- marker not found.")
+        entry = read_entry_line(entry_name)
+        if entry is None:
             return
 
-        toc_lines = lines[:data_index]
-        data_lines = lines[data_index + 1:]
-
         # Check if target is a directory (reject it)
-        for line in data_lines:
-            if line.startswith("D|") and line.split("|")[1] == entry_name:
-                print("Cannot remove directory with rm; use rmdir instead.")
-                return
+        offset, line = entry
+        if line.startswith(b"D|"):
+            print("Cannot remove directory with rm; use rmdir instead.")
+            return
 
-        # Remove matching TOC entry
-        new_toc = []
-        found = False
-        for line in toc_lines:
-            if line.startswith("T|") and line.split("|")[1] == entry_name:
-                found = True
-                continue
-            new_toc.append(line)
-
-        # Remove matching DATA entry
-        new_data = []
-        i = 0
-        while i < len(data_lines):
-            line = data_lines[i]
-            if line.startswith("F|") or line.startswith("D|"):
-                parts = line.split("|", 4)
-                if len(parts) < 4:
-                    new_data.append(line)
-                    i += 1
-                    continue
-
-                entry_type = parts[0]
-                name = parts[1]
-
-                if name == entry_name:
-                    found = True
-                    if entry_type == "F":
-                        try:
-                            size = int(parts[2])
-                            header_len = len(parts[0]) + len(parts[1]) + len(parts[2]) + len(parts[3]) + 4  # plus 4 pipes
-                            body = parts[4]
-
-                            remaining_size = size - len(body.encode("utf-8"))
-                            current_len = len(body.encode("utf-8"))
-                            i += 1
-
-                            while current_len < size and i < len(data_lines):
-                                current_len += len(data_lines[i].encode("utf-8"))
-                                i += 1
-                        except Exception:
-                            # If parsing fails, treat it as malformed and skip just this line
-                            i += 1
-                        continue
-                    else:  # Directory (shouldn’t happen if check earlier passed)
-                        i += 1
-                        continue
-                else:
-                    new_data.append(line)
-                    i += 1
-            else:
-                new_data.append(line)
-                i += 1
+        # Tombstone the record and drop its TOC entry; nothing after it moves
+        tombstone(offset)
+        remove_toc_entry(entry_name)
 
         # If in a directory, remove file from directory listing
         if dir_name:
-            updated_data = []
-            for line in new_data:
-                if line.startswith("D|") and line.split("|")[1] == dir_name:
-                    parts = line.strip().split("|")
-                    files = [f for f in parts[3:] if f != filename]
-                    new_line = "|".join(parts[:3] + files) + "\n"
-                    updated_data.append(new_line)
-                else:
-                    updated_data.append(line)
-            new_data = updated_data
-
-        # Write updated file and rebuild TOC
-        with open("private.pfs", "w") as pfs:
-            pfs.writelines(new_toc)
-            pfs.write("--DATA--\n")
-            pfs.writelines(new_data)
-            pfs.truncate()
-
-        rebuild_toc()
-        rebuild_toc()
+            update_dir_entry(dir_name, lambda files: [f for f in files if f != filename])
         return
 
     # Handle mkdir
@@ -348,8 +244,7 @@ def execute_command(command, task=False):
             offset = pfs.tell()
             pfs.write(dir_entry)
 
-        add_toc_entry(command[1], offset + 1)
-        rebuild_toc()
+        add_toc_entry(command[1], offset)
         return
 
     # Hnadle rmdir
@@ -358,57 +253,23 @@ def execute_command(command, task=False):
             print("Can only remove supplemental directories")
             return
 
-        with open("private.pfs", "r") as pfs:
-            lines = pfs.readlines()
-
-        try:
-            data_index = lines.index("--DATA--\n")
-        except ValueError:
-            print("--DATA-- marker not found.")
-            return
-
         name = command[1]
-        toc_lines = lines[:data_index]
-        data_lines = lines[data_index + 1:]
 
         # Find and inspect the directory entry
-        dir_found = False
-        dir_has_files = False
-        new_data = []
-
-        for line in data_lines:
-            if line.startswith("D|") and line.split("|")[1] == name:
-                dir_found = True
-                parts = line.strip().split("|")
-                if len(parts) > 3 and any(p.strip() for p in parts[3:]):
-                    dir_has_files = True
-                    break  # no need to continue
-            else:
-                new_data.append(line)
-
-        if not dir_found:
+        entry = read_entry_line(name)
+        if entry is None or not entry[1].startswith(b"D|"):
             print("Directory does not exist in private.pfs")
             return
 
-        if dir_has_files:
+        offset, line = entry
+        parts = line.decode("utf-8").strip().split("|")
+        if len(parts) > 3 and any(p.strip() for p in parts[3:]):
             print("Directory is not empty")
             return
 
-        # Remove TOC entry
-        new_toc = []
-        for line in toc_lines:
-            if line.startswith("T|"):
-                parts = line.strip().split("|")
-                if parts[1] == name:
-                    continue
-            new_toc.append(line)
-
-        # Rebuild file without the directory
-        with open("private.pfs", "w") as pfs:
-            pfs.writelines(new_toc)
-            pfs.write("--DATA--\n")
-            pfs.writelines(new_data)
-        rebuild_toc()
+        # Tombstone the directory record and drop its TOC entry
+        tombstone(offset)
+        remove_toc_entry(name)
         return
     
     # Handle ls
@@ -498,7 +359,7 @@ def execute_command(command, task=False):
 
         # Merge with exactly one newline
         merged = content1.rstrip("\n") + "\n" + content2
-        size = len(merged)
+        size = len(merged.encode("utf-8"))
         timestamp = get_timestamp()
         dest = command[3]
 
@@ -526,45 +387,15 @@ def execute_command(command, task=False):
                 pfs.write(header + merged.encode("utf-8") + b"\n")
 
             add_toc_entry(dest, data_offset)
-            rebuild_toc()
 
             # If it's inside a supplemental directory, update that directory
             if dir_name:
-                with open("private.pfs", "r+") as pfs:
-                    lines = pfs.readlines()
-                    try:
-                        data_index = lines.index("--DATA--\n")
-                    except ValueError:
-                        print("--DATA-- not found")
-                        return
-
-                    toc_lines = lines[:data_index]
-                    data_lines = lines[data_index + 1:]
-
-                    updated = False
-                    new_data_lines = []
-                    for line in data_lines:
-                        if line.startswith("D|") and line.split("|")[1] == dir_name:
-                            updated = True
-                            parts = line.strip().split("|")
-                            files = [f for f in parts[3:] if f.strip()]
-                            if file_name_only not in files:
-                                files.append(file_name_only)
-                            new_line = f"D|{parts[1]}|{parts[2]}|{'|'.join(files)}\n"
-                            new_data_lines.append(new_line)
-                        else:
-                            new_data_lines.append(line)
-
-                    if not updated:
-                        print(f"Directory {dir_name} not found")
-                        return
-
-                    with open("private.pfs", "w") as pfs:
-                        pfs.writelines(toc_lines)
-                        pfs.write("--DATA--\n")
-                        pfs.writelines(new_data_lines)
-
-            rebuild_toc()
+                def add_file(files):
+                    if file_name_only not in files:
+                        files.append(file_name_only)
+                    return files
+                if not update_dir_entry(dir_name, add_file):
+                    print(f"Directory {dir_name} not found")
         else:
             try:
                 with open(dest, "w") as f:
@@ -778,91 +609,223 @@ def split_path(path):
     filename = parts[-1]
     return (dirname, filename)
 
+# private.pfs layout:
+#   #TOC <region size>\n      TOC region with reserved space, rewritten in place
+#   T|<name>|<offset>;\n      offsets are relative to the start of the data region
+#   <padding>\n
+#   --DATA--\n
+#   <F|... and D|... records>
+# Records never move once written. A removed or replaced record is tombstoned
+# by overwriting its type letter with X, and only compact_pfs moves data.
+TOC_HEADER = "#TOC {:010d}\n"
+TOC_RESERVE = 16 * 1024
+DATA_MARKER = "--DATA--\n"
+TOMBSTONE = b"X"
+
+# In-memory TOC, reloaded (with one bounded read) only when the file changed
+_toc = {}
+_toc_region = 0
+_toc_stamp = None
+
+def pfs_stamp():
+    st = os.stat("private.pfs")
+    return (st.st_mtime_ns, st.st_size)
+
+def load_toc():
+    global _toc, _toc_region, _toc_stamp
+    stamp = pfs_stamp()
+    if stamp == _toc_stamp:
+        return _toc
+    with open("private.pfs", "rb") as pfs:
+        header = pfs.readline().decode("utf-8")
+        region = int(header[len("#TOC "):].strip())
+        body = pfs.read(region - len(header)).decode("utf-8")
+    toc = {}
+    for line in body.splitlines():
+        parts = line.strip().split('|')
+        if len(parts) >= 3 and parts[0] == 'T':
+            toc.setdefault(parts[1].strip(), int(parts[2].strip(';')))
+    _toc, _toc_region, _toc_stamp = toc, region, stamp
+    return _toc
+
+def data_start():
+    return _toc_region + len(DATA_MARKER)
+
+def encode_toc(toc, region):
+    body = TOC_HEADER.format(region) + "".join(f"T|{name}|{offset};\n" for name, offset in toc.items())
+    body = body.encode("utf-8")
+    pad = region - len(body)
+    if pad < 1:
+        return None
+    return body + b" " * (pad - 1) + b"\n"
+
+# Write the in-memory TOC back in place; only grows (moving the data once) when the reserve is full
+def write_toc():
+    global _toc_region, _toc_stamp
+    body = encode_toc(_toc, _toc_region)
+    if body is not None:
+        with open("private.pfs", "r+b") as pfs:
+            pfs.write(body)
+    else:
+        old_start = data_start()
+        region = _toc_region * 2
+        while encode_toc(_toc, region) is None:
+            region *= 2
+        with open("private.pfs", "rb") as old, open("private.pfs.tmp", "wb") as new:
+            new.write(encode_toc(_toc, region))
+            new.write(DATA_MARKER.encode("utf-8"))
+            old.seek(old_start)
+            shutil.copyfileobj(old, new)
+        os.replace("private.pfs.tmp", "private.pfs")
+        _toc_region = region
+    _toc_stamp = pfs_stamp()
+
+def init_pfs():
+    if not os.path.exists("private.pfs"):
+        with open("private.pfs", "wb") as f:
+            f.write(encode_toc({}, TOC_RESERVE))
+            f.write(DATA_MARKER.encode("utf-8"))
+        return
+    with open("private.pfs", "rb") as f:
+        header = f.readline()
+    if not header.startswith(b"#TOC "):
+        migrate_pfs()
+    # Reclaim tombstoned records once they outweigh the live ones
+    toc = load_toc()
+    live = sum(record_length(offset) for offset in toc.values())
+    dead = os.path.getsize("private.pfs") - data_start() - live
+    if dead > max(live, TOC_RESERVE):
+        compact_pfs()
+
+# Convert the old layout (T lines with absolute offsets right before --DATA--)
+def migrate_pfs():
+    with open("private.pfs", "rb") as pfs:
+        lines = pfs.readlines()
+    data_index = lines.index(DATA_MARKER.encode("utf-8"))
+    names = {}
+    for line in lines[:data_index]:
+        parts = line.decode("utf-8").strip().split("|")
+        if len(parts) >= 3 and parts[0] == "T":
+            names.setdefault(parts[1], 0)
+    with open("private.pfs", "wb") as pfs:
+        pfs.write(encode_toc(names, TOC_RESERVE))
+        pfs.write(DATA_MARKER.encode("utf-8"))
+        pfs.writelines(lines[data_index + 1:])
+    rebuild_toc()
+
 # Function to locate an entry in the private.pfs by name (returns offset or None)
 def locate_entry_in_pfs(name):
-    with open("private.pfs", "r") as pfs:
-        pfs.seek(0)
-        while True:
-            line = pfs.readline()
-            if not line:
-                break
-            line = line.strip()
-            if line == '--DATA--':
-                break
-            parts = line.split('|')
-            if len(parts) >= 3 and parts[0] == 'T':
-                entry_name = parts[1].strip()
-                entry_offset = int(parts[2].strip(';'))
-                if entry_name == name:
-                    return entry_offset
-    return None
+    offset = load_toc().get(name)
+    if offset is None:
+        return None
+    return data_start() + offset
 
 # Function to add an entry to the TOC (Table of Contents) in private.pfs
+# offset is the absolute file position the record was appended at
 def add_toc_entry(full_path, offset):
-    with open("private.pfs", "r+") as pfs:
-        lines = pfs.readlines()
-        data_index = None
-
-        for i, line in enumerate(lines):
-            if line.strip() == "--DATA--":
-                data_index = i
+    toc = load_toc()
+    toc[full_path] = offset - data_start()
+    write_toc()
+
+def remove_toc_entry(name):
+    toc = load_toc()
+    if toc.pop(name, None) is not None:
+        write_toc()
+
+# Mark the record at a data-relative offset as dead, in place and without changing its length
+def tombstone(offset):
+    with open("private.pfs", "r+b") as pfs:
+        pfs.seek(data_start() + offset)
+        pfs.write(TOMBSTONE)
+
+# Read the record line at a TOC entry, returns (data-relative offset, line bytes) or None
+def read_entry_line(name):
+    offset = load_toc().get(name)
+    if offset is None:
+        return None
+    return offset, read_entry_at(offset)
+
+# Length of a whole F| record: header up to the 4th pipe, content, newline
+def file_record_length(offset):
+    with open("private.pfs", "rb") as pfs:
+        pfs.seek(data_start() + offset)
+        header_bytes = bytearray()
+        pipe_count = 0
+        while pipe_count < 4:
+            byte = pfs.read(1)
+            if not byte:
                 break
-
-        if data_index is None:
-            print("Error: --DATA-- marker not found in private.pfs.")
-            return
-
-        new_entry = f"T|{full_path}|{offset};\n"
-        lines.insert(data_index, new_entry)
-
-        pfs.seek(0)
-        pfs.writelines(lines)
-        pfs.truncate()
-
-
+            header_bytes.extend(byte)
+            if byte == b'|':
+                pipe_count += 1
+    size = int(header_bytes.decode("utf-8").split("|")[2])
+    return len(header_bytes) + size + 1
+
+# Length of the live F| or D| record at a data-relative offset
+def record_length(offset):
+    entry = read_entry_at(offset)
+    if entry.startswith(b"F|"):
+        return file_record_length(offset)
+    return len(entry)
+
+def read_entry_at(offset):
+    with open("private.pfs", "rb") as pfs:
+        pfs.seek(data_start() + offset)
+        return pfs.readline()
+
+# Rewrite the file list of a D| record, change gets and returns the list
+def update_dir_entry(dir_name, change):
+    entry = read_entry_line(dir_name)
+    if entry is None or not entry[1].startswith(b"D|"):
+        return False
+    offset, line = entry
+    parts = line.decode("utf-8").strip().split("|")
+    files = change([f for f in parts[3:] if f.strip()])
+    new_line = f"D|{parts[1]}|{parts[2]}|{'|'.join(files)}\n"
+    # Append the new record and tombstone the old one, so no other record moves
+    with open("private.pfs", "ab") as pfs:
+        new_offset = pfs.tell()
+        pfs.write(new_line.encode("utf-8"))
+    tombstone(offset)
+    load_toc()[dir_name] = new_offset - data_start()
+    write_toc()
+    return True
+
+# Copy only the live records into a new file; the one place records are moved
+def compact_pfs():
+    global _toc_stamp
+    toc = load_toc()
+    start = data_start()
+    with open("private.pfs", "rb") as old, open("private.pfs.tmp", "wb") as new:
+        new.write(encode_toc(toc, _toc_region))
+        new.write(DATA_MARKER.encode("utf-8"))
+        position = 0
+        for name, offset in sorted(toc.items(), key=lambda item: item[1]):
+            length = record_length(offset)
+            old.seek(start + offset)
+            new.write(old.read(length))
+            toc[name] = position
+            position += length
+        # offsets only got smaller, so the TOC still fits its region
+        new.seek(0)
+        new.write(encode_toc(toc, _toc_region))
+    os.replace("private.pfs.tmp", "private.pfs")
+    _toc_stamp = pfs_stamp()
+
+# Full offset recomputation by scanning the data region; only needed to repair or migrate
 def rebuild_toc():
-    with open("private.pfs", "r+") as pfs:
-        lines = pfs.readlines()
-
-        # Find where --DATA-- is
-        try:
-            data_index = lines.index("--DATA--\n")
-        except ValueError:
-            raise ValueError("--DATA-- not found")
-
-        # Slice file into parts
-        toc_lines = lines[:data_index]
-        data_lines = lines[data_index + 1:]
-
-        # Build a map of name -> data line index in data_lines
-        data_offsets = {}
-        byte_offset = sum(len(line.encode('utf-8')) for line in toc_lines) + len("--DATA--\n")
-
-        for line in data_lines:
-            if line.startswith("F|") or line.startswith("D|"):
-                parts = line.split("|")
-                name = parts[1]
-                data_offsets[name] = byte_offset
-            byte_offset += len(line.encode('utf-8'))
-
-        # Rebuild TOC with correct offsets
-        new_toc = []
-        for line in toc_lines:
-            if line.startswith("T|"):
-                parts = line.strip().split("|")
-                name = parts[1]
-                offset = data_offsets.get(name, 0)
-                new_toc.append(f"T|{name}|{offset};\n")
-            else:
-                new_toc.append(line)  # Preserve any non-TOC lines
-
-        # Rewrite file
-        with open("private.pfs", "w") as out:
-            out.writelines(new_toc)
-            out.write("--DATA--\n")
-            out.writelines(data_lines)
-
-
+    toc = load_toc()
+    offsets = {}
+    with open("private.pfs", "rb") as pfs:
+        pfs.seek(data_start())
+        byte_offset = 0
+        for line in pfs:
+            if line.startswith(b"F|") or line.startswith(b"D|"):
+                offsets.setdefault(line.split(b"|")[1].decode("utf-8"), byte_offset)
+            byte_offset += len(line)
+    for name in toc:
+        toc[name] = offsets.get(name, 0)
+    write_toc()
 
 
 # Function to get the current timestamp
@@ -872,9 +835,7 @@ def get_timestamp():
 def main():
 
     # Ensure private.pfs exists
-    if not os.path.exists("private.pfs"):
-        with open("private.pfs", "w") as f:
-            f.write("--DATA--\n")  # Initialize with TOC marker
+    init_pfs()
 
     if len(sys.argv) > 1:
         use_file(sys.argv[1])
@@ -4,21 +4,30 @@ import os
 import sys
 import time
 import re
+import pfs_chunks
 
 # --- Persistent Supplementary File System (PFS) ---
 PFS_FILE = 'private.pfs'
 META_HEADER = 'PFS_META_V1'
+RAW_LOG_HEADER = 'PFS_META_V2'
+LOG_HEADER = 'PFS_META_V3'
+# compact once deleted records take at least this much and half the volume
+COMPACT_MIN_BYTES = 64 * 1024
 
 
 class PFSEntry:
-    def __init__(self, type_char, name, parent, length, modified, data_bytes=None):
-        self.type = type_char        # 'F', 'D', or 'X'
+    def __init__(self, type_char, name, parent, length, modified):
+        self.type = type_char        # 'F' or 'D'
         self.name = name             # string
         self.parent = parent         # string
         self.length = length         # int
         self.modified = modified     # int (epoch)
-        self.data_bytes = data_bytes  # bytes for file content
-        self.offset = None           # int (set in load)
+        self.offset = None           # int, start of file content on disk
+        self.footprint = 0           # int, bytes this entry occupies on disk
+        self.chunks = None           # list of chunk digests, None for V1/V2 content
+
+    def record(self):
+        return f"{self.type}|{self.name}|{self.parent}|{self.length}|{self.modified}\n".encode()
 
 
 class PFSManager:
@@ -32,123 +41,307 @@ class PFSManager:
 
     def _load(self):
         """
-        Load metadata header and file contents into memory.
-        Format:
-        PFS_META_V1\n
-        <type>|<name>|<parent>|<length>|<modified>\n ...\n
-        blank line, then raw data blocks in entry order.
+        Load metadata into memory; file contents stay on disk until read.
+        PFS_META_V1: header, metadata lines, blank line, then raw data
+        blocks in entry order. Converted to V3 on the first change.
+        PFS_META_V2: header, then an append-only log of
+        <type>|<name>|<parent>|<length>|<modified>\n records, each 'F'
+        record directly followed by its <length> raw bytes. A record
+        X|<name>|<F or D>|0|<modified> deletes earlier entries of that name.
+        Converted to V3 on the first change.
+        PFS_META_V3: the same log, but file content is deduplicated. A
+        C|<digest>|<codec>|<length>|0 record followed by <length> stored
+        bytes holds one chunk, compressed with the pfs_chunks codec (or
+        stored raw for '-'). An 'F' record is followed by a line with the
+        digests of its chunks. Chunks are reference counted and dropped by
+        compaction once no file uses them.
         """
+        self.entries = []
+        self.chunks = {}
+        self.refs = {}
+        self.dead_bytes = 0
+        self.version = None
+        # offset of a record cut short by an interrupted append, cut off before the next append
+        self.torn = None
         with open(self.filename, 'rb') as f:
-            # read header
+            self.size = os.fstat(f.fileno()).st_size
             first = f.readline().decode(errors='ignore').rstrip('\n')
-            if first != META_HEADER:
-                # no metadata header => empty PFS
-                self.entries = []
-                return
-            # read metadata lines
-            meta_lines = []
-            while True:
-                line = f.readline().decode(errors='ignore')
-                if not line or line == '\n':
-                    break
-                meta_lines.append(line.rstrip('\n'))
-            # parse entries
-            self.entries = []
-            for ln in meta_lines:
-                parts = ln.split('|')
-                if len(parts) != 5:
-                    continue
-                typ, name, parent, length, mod = parts
-                entry = PFSEntry(typ, name, parent, int(length), int(mod))
+            if first == META_HEADER:
+                self.version = META_HEADER
+                self._load_v1(f)
+            elif first in (RAW_LOG_HEADER, LOG_HEADER):
+                self.version = first
+                self._load_log(f)
+            # no metadata header => empty PFS
+        for e in self.entries:
+            if e.chunks is not None:
+                for digest in e.chunks:
+                    self.refs[digest] = self.refs.get(digest, 0) + 1
+        for digest, chunk in self.chunks.items():
+            if not self.refs.get(digest):
+                self.dead_bytes += chunk.footprint
+
+    def _load_v1(self, f):
+        meta_lines = []
+        while True:
+            line = f.readline().decode(errors='ignore')
+            if not line or line == '\n':
+                break
+            meta_lines.append(line.rstrip('\n'))
+        for ln in meta_lines:
+            parts = ln.split('|')
+            if len(parts) != 5:
+                continue
+            typ, name, parent, length, mod = parts
+            entry = PFSEntry(typ, name, parent, int(length), int(mod))
+            if typ == 'F':
+                entry.offset = f.tell()
+                f.seek(entry.length, os.SEEK_CUR)
+            if typ != 'X':
                 self.entries.append(entry)
-            # read data blocks sequentially
-            for e in self.entries:
-                if e.type == 'F':
-                    e.offset = f.tell()
-                    e.data_bytes = f.read(e.length)
+
+    def _load_log(self, f):
+        while True:
+            start = f.tell()
+            line = f.readline()
+            if not line.endswith(b'\n'):
+                if line:
+                    self.torn = start
+                break
+            parts = line.decode(errors='ignore').rstrip('\n').split('|')
+            if len(parts) != 5:
+                continue
+            typ, name, parent, length, mod = parts
+            if typ == 'X':
+                self._drop(parent, name)
+                self.dead_bytes += len(line)
+                continue
+            entry = PFSEntry(typ, name, parent, int(length), int(mod))
+            if typ == 'C' or (typ == 'F' and self.version == RAW_LOG_HEADER):
+                entry.offset = f.tell()
+                if entry.offset + entry.length > self.size:
+                    self.torn = start  # torn append, ignore the tail
+                    break
+                f.seek(entry.length, os.SEEK_CUR)
+            elif typ == 'F':
+                recipe = f.readline()
+                if not recipe.endswith(b'\n'):
+                    self.torn = start  # torn append, ignore the tail
+                    break
+                entry.chunks = recipe.decode().split()
+            entry.footprint = f.tell() - start
+            if typ == 'C':
+                if name in self.chunks:
+                    self.dead_bytes += entry.footprint
                 else:
-                    e.offset = None
-                    e.data_bytes = None
+                    self.chunks[name] = entry
+                continue
+            self.entries.append(entry)
 
-    def _save(self):
+    def _drop(self, typ, name):
+        keep = []
+        dropped = []
+        for e in self.entries:
+            if e.name == name and e.type == typ:
+                self.dead_bytes += e.footprint
+                dropped.append(e)
+            else:
+                keep.append(e)
+        self.entries = keep
+        return dropped
+
+    def _ref(self, digests):
+        for digest in digests:
+            if not self.refs.get(digest):
+                self.dead_bytes -= self.chunks[digest].footprint
+            self.refs[digest] = self.refs.get(digest, 0) + 1
+
+    def _unref(self, digests):
+        # a chunk no file uses any more is dead until compaction drops it
+        for digest in digests:
+            self.refs[digest] -= 1
+            if not self.refs[digest]:
+                self.dead_bytes += self.chunks[digest].footprint
+
+    def _ensure_log(self):
+        if self.version != LOG_HEADER:
+            self._compact()
+
+    def _store(self, data):
         """
-        Rewrite full PFS file: metadata header + metadata lines + data blocks.
+        Append the chunks of data that are not stored yet and return the
+        digests of all of them.
         """
-        with open(self.filename, 'wb') as f:
-            # header
-            f.write((META_HEADER + '\n').encode())
-            # metadata
-            for e in self.entries:
-                line = f"{e.type}|{e.name}|{e.parent}|{e.length}|{e.modified}\n"
-                f.write(line.encode())
-            f.write(b"\n")  # end of metadata
-            # data blocks
+        self._ensure_log()
+        digests = []
+        for piece in pfs_chunks.split(data):
+            digest = pfs_chunks.digest(piece).hex()
+            if digest not in self.chunks:
+                codec, payload = pfs_chunks.encode(piece)
+                chunk = self._append(PFSEntry('C', digest, str(codec), len(payload), 0), payload)
+                self.chunks[digest] = chunk
+                self.dead_bytes += chunk.footprint  # until a file refers to it
+            digests.append(digest)
+        return digests
+
+    def _add_file(self, name, digests, length):
+        entry = PFSEntry('F', name, 'ROOT', length, int(time.time()))
+        entry.chunks = digests
+        self._ref(digests)
+        self.entries.append(self._append(entry, (' '.join(digests) + '\n').encode()))
+
+    def _append(self, entry, data=b''):
+        """
+        Append one record (and its data) instead of rewriting the volume.
+        """
+        self._ensure_log()
+        if self.torn is not None:
+            # otherwise the new record would follow the torn one and never be read
+            os.truncate(self.filename, self.torn)
+            self.size = self.torn
+            self.torn = None
+        line = entry.record()
+        with open(self.filename, 'ab') as f:
+            f.write(line)
+            entry.offset = f.tell() if entry.type == 'C' else None
+            f.write(data)
+        entry.footprint = len(line) + len(data)
+        self.size += entry.footprint
+        return entry
+
+    def _delete(self, typ, name):
+        dropped = self._drop(typ, name)
+        if not dropped:
+            return
+        for e in dropped:
+            if e.chunks is not None:
+                self._unref(e.chunks)
+        tombstone = self._append(PFSEntry('X', name, typ, 0, int(time.time())))
+        self.dead_bytes += tombstone.footprint
+        if self.dead_bytes >= COMPACT_MIN_BYTES and self.dead_bytes * 2 > self.size:
+            self._compact()
+
+    def _compact(self):
+        """
+        Rewrite the live entries into a fresh V3 log, dropping deleted data
+        and chunks no file refers to. V1/V2 content is chunked on the way.
+        """
+        tmp = self.filename + '.tmp'
+        chunks = {}
+        with open(self.filename, 'rb') as src, open(tmp, 'wb') as dst:
+            dst.write((LOG_HEADER + '\n').encode())
             for e in self.entries:
-                if e.type == 'F' and e.data_bytes is not None:
-                    f.write(e.data_bytes)
-        # reload to reset offsets
-        self._load()
+                if e.type == 'F' and e.chunks is None:
+                    src.seek(e.offset)
+                    e.chunks = []
+                    for piece in pfs_chunks.split(src.read(e.length)):
+                        digest = pfs_chunks.digest(piece).hex()
+                        if digest not in chunks:
+                            codec, payload = pfs_chunks.encode(piece)
+                            self._copy_chunk(dst, chunks, digest, str(codec), payload)
+                        e.chunks.append(digest)
+                elif e.type == 'F':
+                    for digest in e.chunks:
+                        if digest not in chunks:
+                            chunk = self.chunks[digest]
+                            src.seek(chunk.offset)
+                            self._copy_chunk(dst, chunks, digest, chunk.parent, src.read(chunk.length))
+                start = dst.tell()
+                dst.write(e.record())
+                if e.type == 'F':
+                    dst.write((' '.join(e.chunks) + '\n').encode())
+                e.footprint = dst.tell() - start
+            self.size = dst.tell()
+        os.replace(tmp, self.filename)
+        self.version = LOG_HEADER
+        self.torn = None
+        self.chunks = chunks
+        self.refs = {}
+        for e in self.entries:
+            if e.chunks is not None:
+                for digest in e.chunks:
+                    self.refs[digest] = self.refs.get(digest, 0) + 1
+        self.dead_bytes = 0
+
+    def _copy_chunk(self, dst, chunks, digest, codec, data):
+        chunk = PFSEntry('C', digest, codec, len(data), 0)
+        start = dst.tell()
+        dst.write(chunk.record())
+        chunk.offset = dst.tell()
+        dst.write(data)
+        chunk.footprint = dst.tell() - start
+        chunks[digest] = chunk
+
+    def _read(self, e):
+        with open(self.filename, 'rb') as f:
+            if e.chunks is None:
+                f.seek(e.offset)
+                return f.read(e.length)
+            pieces = []
+            for digest in e.chunks:
+                chunk = self.chunks[digest]
+                f.seek(chunk.offset)
+                pieces.append(self._decode(chunk, f.read(chunk.length)))
+            return b''.join(pieces)
+
+    def _decode(self, chunk, data):
+        # the codec rides in the parent field of a chunk record
+        if chunk.parent == '-':
+            return data
+        return pfs_chunks.decode(data, int(chunk.parent))
 
     def list(self, path='+'):
         prefix = path.lstrip('+')
         out = []
         for e in self.entries:
-            if e.type != 'X' and (path == '+' or e.parent == prefix):
+            if path == '+' or e.parent == prefix:
                 out.append((e.name, time.ctime(e.modified)))
         return out
 
-    def show(self, filepath):
+    def _find(self, filepath):
         name = filepath.lstrip('+')
         for e in self.entries:
             if e.name == name and e.type == 'F':
-                return e.data_bytes.decode()
+                return e
         raise FileNotFoundError(filepath)
 
+    def show(self, filepath):
+        return self._read(self._find(filepath)).decode()
+
     def mkdir(self, dirname):
         name = dirname.lstrip('+')
         entry = PFSEntry('D', name, 'ROOT', 0, int(time.time()))
-        self.entries.append(entry)
-        self._save()
+        self.entries.append(self._append(entry))
 
     def rmdir(self, dirname):
         name = dirname.lstrip('+')
         # ensure empty
         for e in self.entries:
-            if e.parent == name and e.type != 'X':
+            if e.parent == name:
                 raise OSError('Directory not empty')
-        # mark delete
-        for e in self.entries:
-            if e.name == name and e.type == 'D':
-                e.type = 'X'
-        self._save()
+        self._delete('D', name)
 
     def rm(self, filepath):
         name = filepath.lstrip('+')
-        for e in self.entries:
-            if e.name == name and e.type == 'F':
-                e.type = 'X'
-        self._save()
+        self._delete('F', name)
 
     def cp(self, src, dst):
-        # read source bytes
-        if src.startswith('+'):
-            data = self.show(src).encode()
-        else:
-            with open(src, 'rb') as f:
-                data = f.read()
         name = dst.lstrip('+')
-        entry = PFSEntry('F', name, 'ROOT', len(data), int(time.time()), data)
-        self.entries.append(entry)
-        self._save()
+        if src.startswith('+'):
+            # metadata only: the copy refers to the same chunks
+            source = self._find(src)
+            self._ensure_log()
+            self._add_file(name, list(source.chunks), source.length)
+            return
+        with open(src, 'rb') as f:
+            data = f.read()
+        self._add_file(name, self._store(data), len(data))
 
     def merge(self, a, b, out):
         da = (self.show(a) if a.startswith('+') else open(a).read()).encode()
         db = (self.show(b) if b.startswith('+') else open(b).read()).encode()
         name = out.lstrip('+')
-        entry = PFSEntry('F', name, 'ROOT', len(
-            da+db), int(time.time()), da+db)
-        self.entries.append(entry)
-        self._save()
+        self._add_file(name, self._store(da+db), len(da+db))
 
 
 # instantiate
@@ -2,7 +2,10 @@
 import os
 import sys
 import re
-from fsCommands import fs_cp, fs_show, fs_merge, fs_rm, fs_mkdir, fs_rmdir, fs_ls
+import pfs_engines
+
+# the private.pfs backend, fsCommands unless --engine picks another
+engine = None
 
 #command to split the command but keeps any double quotes 
 # Ex.   grep "test" file.txt --> ['grep', '"test"', 'text.txt']
@@ -147,31 +150,31 @@ def do_command(command):
         return
     #check if the first item in the arg list is the cp command
     elif arg[0] == "cp" and ("+" in arg[1] or "+" in arg[2]):
-        fs_cp(arg[1], arg[2])
+        engine.cp(arg[1], arg[2])
         return
     #check if the first item in the arg list is the show command
     elif arg[0] == "show" and "+" in arg[1]:
-        fs_show(arg[1])
+        engine.show(arg[1])
         return
     #check if the first item in the arg list is the merge command
     elif arg[0] == "merge" and len(arg) == 4:
-        fs_merge(arg[1], arg[2], arg[3])
+        engine.merge(arg[1], arg[2], arg[3])
         return
     #check if the first item in the arg list is the rm command
     elif arg[0] == "rm" and "+" in arg[1]:
-        fs_rm(arg[1])
+        engine.rm(arg[1])
         return
     #check if the first item in the arg list is the mkdir command
     elif arg[0] == "mkdir" and "+" in arg[1]:
-        fs_mkdir(arg[1])
+        engine.mkdir(arg[1])
         return
     #check if the first item in the arg list is the rmdir command
     elif arg[0] == "rmdir" and "+" in arg[1]:
-        fs_rmdir(arg[1])
+        engine.rmdir(arg[1])
         return
     #check if the first item in the arg list is the ls command
     elif arg[0] == "ls" and "+" in arg[1]:
-        fs_ls(arg[1])
+        engine.ls(arg[1])
         return
     
     #process the input output redirection
@@ -243,6 +246,8 @@ def process_in(fd):
             do_command(command)
 
 def main():
+    global engine
+    engine = pfs_engines.select(sys.argv, "lines")
     #check if the argument provided was a file
     if len(sys.argv) > 1:
         try:
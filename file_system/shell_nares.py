@@ -2,7 +2,11 @@ import os
 import sys
 import re
 import time
-import supplemental_fs_2  
+import pfs_crc
+import pfs_engines
+
+# the private.pfs backend, supplemental_fs_2 unless --engine picks another
+engine = None
 
 #command to split the command but keeps any double quotes 
 # Ex.   grep "test" file.txt --> ['grep', '"test"', 'text.txt']
@@ -131,9 +135,17 @@ def do_pipe(command):
 
 # Handle supplementary file system commands
 def handle_pfs_command(command, args):
+    # a block that fails its checksum ends the command, not the shell
+    try:
+        return run_pfs_command(command, args)
+    except pfs_crc.ChecksumError as e:
+        print(f"Error: {e}")
+        return True
+
+def run_pfs_command(command, args):
 
     
-    pfs = supplemental_fs.pfs  # Get the singleton instance
+    pfs = engine  # Get the storage engine
     
     if command == "cp":
         if len(args) != 3:
@@ -226,6 +238,18 @@ def handle_pfs_command(command, args):
             return True
         return False  # Let the normal command handle it
         
+    elif command == "snapshot":
+        if len(args) > 2:
+            print("Usage: snapshot [name]")
+            return True
+        
+        pfs.snapshot(args[1] if len(args) == 2 else None)
+        return True
+        
+    elif command == "fsck":
+        pfs.fsck()
+        return True
+        
     return False  # Not a supplementary file system command
 
 def do_command(command):
@@ -248,6 +272,11 @@ def do_command(command):
         change_dir(arg)
         return
     
+    # snapshots and fsck only exist in the supplementary file system
+    if arg[0] in ("snapshot", "fsck"):
+        handle_pfs_command(arg[0], arg)
+        return
+    
     # Check if it's a supplementary file system command
     if arg[0] in ["cp", "rm", "mkdir", "rmdir", "ls", "merge", "show"]:
         # If any arguments start with '+', handle with supplementary file system
@@ -329,7 +358,10 @@ def main():
     
     # Initialize the supplementary file system
     # This ensures the private.pfs file is created or opened if it exists
-    pfs = supplemental_fs.pfs
+    global engine
+    engine = pfs_engines.select(sys.argv, "tree")
+    pfs = engine
+    pfs.fsck(quiet=True)
     
     #check if the argument provided was a file
     if len(sys.argv) > 1:
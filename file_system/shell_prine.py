@@ -1,9 +1,7 @@
 import os
 import sys
 import re
-import time
-
-private_fs = "private.pfs"
+import pfs_store
 
 #command to split the command but keeps any double quotes 
 # Ex.   grep "test" file.txt --> ['grep', '"test"', 'text.txt']
@@ -140,31 +138,31 @@ def do_command(command):
     # private.fps commands
     # cp
     if arg[0] == "cp" and len(arg) == 3 and arg[2].startswith("+"):
-        sup_cp(arg[1], arg[2])
+        pfs_store.sup_cp(arg[1], arg[2])
         return
     # rm 
     if arg[0] == "rm" and len(arg) == 2 and arg[1].startswith("+"):
-        sup_rm(arg[1])
+        pfs_store.sup_rm(arg[1])
         return
     # mkdir
     if arg[0] == "mkdir" and len(arg) == 2 and arg[1].startswith("+"):
-        sup_mkdir(arg[1])
+        pfs_store.sup_mkdir(arg[1])
         return
     # rmdir 
     if arg[0] == "rmdir" and len(arg) == 2 and arg[1].startswith("+"):
-        sup_rmdir(arg[1])
+        pfs_store.sup_rmdir(arg[1])
         return
     # ls 
     if arg[0] == "ls" and (len(arg) == 1 or arg[1].startswith("+")):
-        sup_ls(arg[1] if len(arg) > 1 else None)
+        pfs_store.sup_ls(arg[1] if len(arg) > 1 else None)
         return
     # show 
     if arg[0] == "show" and len(arg) == 2 and arg[1].startswith("+"):
-        sup_show(arg[1])
+        pfs_store.sup_show(arg[1])
         return
     # merge
     if arg[0] == "merge" and len(arg) == 4 and arg[3].startswith("+"):
-        sup_merge(arg[1], arg[2], arg[3])
+        pfs_store.sup_merge(arg[1], arg[2], arg[3])
         return
 
     #check if pipe 
@@ -249,236 +247,6 @@ def process_in(fd):
                 sys.exit(0) 
             do_command(command)
 
-def load_private_fs():
-    dirs = []
-    files = {}
-    data = ""
-    if not os.path.exists(private_fs):
-        # initialize with an empty metadata block
-        with open(private_fs, 'w') as f:
-            f.write("END\n")
-        return dirs, files, data
-    with open(private_fs, 'r') as f:
-        meta_lines = []
-        # read metadata lines until END
-        while True:
-            pos = f.tell()
-            line = f.readline()
-            if not line:
-                break
-            if line.strip() == "END":
-                break
-            meta_lines.append(line.rstrip('\n'))
-        # remaining is data block
-        data = f.read() or ""
-    # parse metadata
-    for line in meta_lines:
-        if line.startswith("DIR:"):
-            dirname = line[len("DIR:"):].strip()
-            if dirname:
-                dirs.append(dirname)
-        elif line.startswith("FILE:"):
-            parts = line[len("FILE:"):].split(":")
-            if len(parts) == 4:
-                path, offset, length, timestamp = parts
-                files[path] = [int(offset), int(length), int(timestamp)]
-    return dirs, files, data
-
-
-def save_private_fs(dirs, files, data):
-    with open(private_fs, 'w') as f:
-        for d in dirs:
-            f.write(f"DIR:{d}\n")
-        for path, (offset, length, timestamp) in files.items():
-            f.write(f"FILE:{path}:{offset}:{length}:{timestamp}\n")
-        f.write("END\n")
-        f.write(data)
-
-
-def sup_cp(src, dest):
-    if not dest.startswith("+"):
-        print("cp: destination must start with +")
-        return
-    dest_path = dest[1:]
-    dirs, files, data = load_private_fs()
-    if src.startswith("+"):
-        src_path = src[1:]
-        if src_path not in files:
-            print(f"cp: {src}: No such file")
-            return
-        off, length, _ = files[src_path]
-        content = data[off:off+length]
-    else:
-        try:
-            with open(src, 'r') as f:
-                content = f.read()
-        except FileNotFoundError:
-            print(f"cp: {src}: No such file or directory")
-            return
-    if '/' in dest_path:
-        dir_name, _ = dest_path.split('/', 1)
-        if dir_name not in dirs:
-            print(f"cp: cannot create regular file '{dest}': No such directory")
-            return
-    if dest_path in files:
-        sup_rm(dest)
-        dirs, files, data = load_private_fs()
-    timestamp = int(time.time())
-    offset = len(data)
-    length = len(content)
-    files[dest_path] = [offset, length, timestamp]
-    data += content
-    save_private_fs(dirs, files, data)
-
-
-def sup_rm(arg):
-    if not arg.startswith("+"):
-        print("rm: argument must start with +")
-        return
-    file_name = arg[1:]
-    dirs, files, data = load_private_fs()
-    if file_name not in files:
-        print(f"rm: cannot remove '{arg}': No such file")
-        return
-    entries = []
-    for path, (off, length, ts) in files.items():
-        if path == file_name:
-            continue
-        entries.append((off, path, data[off:off+length], ts))
-    entries.sort(key=lambda x: x[0])
-    new_data = ""
-    new_files = {}
-    curr = 0
-    for _, path, content, ts in entries:
-        new_files[path] = [curr, len(content), ts]
-        new_data += content
-        curr += len(content)
-    save_private_fs(dirs, new_files, new_data)
-
-
-def sup_mkdir(arg):
-    if not arg.startswith("+"):
-        print("mkdir: argument must start with +")
-        return
-    dir_name = arg[1:]
-    dirs, files, data = load_private_fs()
-    if dir_name in dirs:
-        print(f"mkdir: cannot create directory '{arg}': File exists")
-        return
-    if '/' in dir_name:
-        print(f"mkdir: cannot create directory '{arg}': Nested directories not supported")
-        return
-    dirs.append(dir_name)
-    save_private_fs(dirs, files, data)
-
-
-def sup_rmdir(arg):
-    if not arg.startswith("+"):
-        print("rmdir: argument must start with +")
-        return
-    dir_name = arg[1:]
-    dirs, files, data = load_private_fs()
-    if dir_name not in dirs:
-        print(f"rmdir: failed to remove '{arg}': No such directory")
-        return
-    for path in files:
-        if path.startswith(dir_name + "/"):
-            print(f"rmdir: failed to remove '{arg}': Directory not empty")
-            return
-    dirs.remove(dir_name)
-    save_private_fs(dirs, files, data)
-
-
-def sup_ls(arg=None):
-    dirs, files, data = load_private_fs()
-    if arg is None:
-        for d in dirs:
-            print(f"{d}/")
-        for path, (_, _, ts) in files.items():
-            if '/' not in path:
-                print(f"{path}\t{ts}")
-        return
-    if arg.startswith("+"):
-        path = arg[1:]
-    else:
-        path = arg
-    if path in dirs:
-        for fpath, (_, _, ts) in files.items():
-            if fpath.startswith(path + "/"):
-                name = fpath.split('/',1)[1]
-                print(f"{name}\t{ts}")
-    elif path in files:
-        _, _, ts = files[path]
-        print(f"{path}\t{ts}")
-    else:
-        print(f"ls: cannot access '{arg}': No such file or directory")
-
-
-def sup_show(arg):
-    if not arg.startswith("+"):
-        print("show: argument must start with +")
-        return
-    file_name = arg[1:]
-    dirs, files, data = load_private_fs()
-    if file_name not in files:
-        print(f"show: cannot show '{arg}': No such file")
-        return
-    off, length, _ = files[file_name]
-    sys.stdout.write(data[off:off+length])
-
-
-def sup_merge(src1, src2, dest):
-    if not dest.startswith("+"):
-        print("merge: destination must start with +")
-        return
-    dest_path = dest[1:]
-    dirs, files, data = load_private_fs()
-    # first source
-    if src1.startswith("+"):
-        s1 = src1[1:]
-        if s1 not in files:
-            print(f"merge: {src1}: No such file")
-            return
-        off, length, _ = files[s1]
-        c1 = data[off:off+length]
-    else:
-        try:
-            with open(src1,'r') as f:
-                c1 = f.read()
-        except FileNotFoundError:
-            print(f"merge: {src1}: No such file or directory")
-            return
-    # second source
-    if src2.startswith("+"):
-        s2 = src2[1:]
-        if s2 not in files:
-            print(f"merge: {src2}: No such file")
-            return
-        off, length, _ = files[s2]
-        c2 = data[off:off+length]
-    else:
-        try:
-            with open(src2,'r') as f:
-                c2 = f.read()
-        except FileNotFoundError:
-            print(f"merge: {src2}: No such file or directory")
-            return
-    merged = c1 + c2
-    if dest_path in files:
-        sup_rm(dest)
-        dirs, files, data = load_private_fs()
-    if '/' in dest_path:
-        dn, fn = dest_path.split('/',1)
-        if dn not in dirs:
-            print(f"merge: cannot create file '{dest}': No such directory")
-            return
-    ts = int(time.time())
-    off = len(data)
-    ln = len(merged)
-    files[dest_path] = [off, ln, ts]
-    data += merged
-    save_private_fs(dirs, files, data)
-
 def main():
     #check if the argument provided was a file
     if len(sys.argv) > 1:
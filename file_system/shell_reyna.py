@@ -2,8 +2,10 @@ import os
 import sys
 import re
 import time
+import struct
 
 fileName = "privatePFS.txt"
+indexName = "privatePFS.idx"
 
 #command to split the command but keeps any double quotes 
 # Ex.   grep "test" file.txt --> ['grep', '"test"', 'text.txt']
@@ -215,13 +217,232 @@ def process_in(fd):
                 sys.exit(0) 
             do_command(command)
 
+# privatePFS.txt is a header followed by length-prefixed records:
+#   kind | path length | created | modified | content length | path | content
+# so content can hold anything (including #END#). privatePFS.idx is an
+# append-only log of path -> record offset so lookups never scan the volume.
+PFS_MAGIC = b"RPFS0002"
+INDEX_MAGIC = b"RIDX"
+RECORD = struct.Struct("<BHddI")
+# index header: magic, volume size the index covers, dead bytes in the volume
+INDEX_HEADER = struct.Struct("<4sQQ")
+# index entry: record offset (0 means the path was removed), path length
+INDEX_ENTRY = struct.Struct("<QH")
+DEAD, DIR, FILE = 0, 1, 2
+COMPACT_MIN = 64 * 1024
+TIME_FORMAT = '%B-%d-%Y:%H:%M:%S'
+
+# path -> record offset, loaded once and reused while the volume is unchanged
+spIndex = None
+spDead = 0
+spStamp = None
+
+def volumeStamp():
+    st = os.stat(fileName)
+    return (st.st_mtime_ns, st.st_size)
+
+def packRecord(kind, path, created, modified, content=b""):
+    path = path.encode()
+    return RECORD.pack(kind, len(path), created, modified, len(content)) + path + content
+
+def readHeader(fd, offset):
+    # returns (kind, path, created, modified, content offset, content size)
+    kind, path_len, created, modified, size = RECORD.unpack(os.pread(fd, RECORD.size, offset))
+    path = os.pread(fd, path_len, offset + RECORD.size).decode()
+    return kind, path, created, modified, offset + RECORD.size + path_len, size
+
+def scanVolume(fd):
+    # walks every record once, only used to rebuild a missing or stale index
+    offset = len(PFS_MAGIC)
+    end = os.fstat(fd).st_size
+    while offset + RECORD.size <= end:
+        kind, path, _, _, data_start, size = readHeader(fd, offset)
+        yield offset, kind, path, data_start + size - offset
+        offset = data_start + size
+
+def parseTime(stamp):
+    try:
+        return time.mktime(time.strptime(stamp, TIME_FORMAT))
+    except ValueError:
+        return time.time()
+
+def migratePFS():
+    # converts the old "+path|FILE|created|modified|size|content#END#" text volume
+    with open(fileName, 'r') as f:
+        content = f.read()
+
+    records = []
+    for entry in content.split('#END#'):
+        entry = entry.strip()
+        if entry == "":
+            continue
+        if '|FILE|' in entry:
+            parts = entry.split('|', 5)
+            if len(parts) < 6:
+                continue
+            records.append(packRecord(FILE, parts[0], parseTime(parts[2]), parseTime(parts[3]), parts[5].encode()))
+        else:
+            now = time.time()
+            records.append(packRecord(DIR, entry, now, now))
+
+    with open(fileName + ".tmp", 'wb') as f:
+        f.write(PFS_MAGIC)
+        f.write(b"".join(records))
+    os.replace(fileName + ".tmp", fileName)
+
+def writeIndex(index, dead):
+    # writes a fresh index log for the current volume
+    size = os.stat(fileName).st_size
+    entries = []
+    for path, offset in index.items():
+        path = path.encode()
+        entries.append(INDEX_ENTRY.pack(offset, len(path)) + path)
+    with open(indexName + ".tmp", 'wb') as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, size, dead))
+        f.write(b"".join(entries))
+    os.replace(indexName + ".tmp", indexName)
+
+def readIndex():
+    # replays the index log, returns None if it does not match the volume
+    try:
+        with open(indexName, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    if len(data) < INDEX_HEADER.size:
+        return None
+    magic, size, dead = INDEX_HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC or size != os.stat(fileName).st_size:
+        return None
+
+    index = {}
+    pos = INDEX_HEADER.size
+    while pos + INDEX_ENTRY.size <= len(data):
+        offset, path_len = INDEX_ENTRY.unpack_from(data, pos)
+        pos += INDEX_ENTRY.size
+        path = data[pos:pos + path_len].decode()
+        pos += path_len
+        if offset:
+            index[path] = offset
+        else:
+            index.pop(path, None)
+    return index, dead
+
+def loadIndex():
+    global spIndex, spDead, spStamp
+
+    if spIndex is not None and spStamp == volumeStamp():
+        return spIndex
+
+    with open(fileName, 'rb') as f:
+        magic = f.read(len(PFS_MAGIC))
+    if magic != PFS_MAGIC:
+        migratePFS()
+
+    loaded = readIndex()
+    if loaded is None:
+        # index missing or out of date, rebuild it from the records
+        index = {}
+        dead = 0
+        fd = os.open(fileName, os.O_RDONLY)
+        try:
+            for offset, kind, path, length in scanVolume(fd):
+                if kind == DEAD:
+                    dead += length
+                else:
+                    index[path] = offset
+        finally:
+            os.close(fd)
+        writeIndex(index, dead)
+        loaded = (index, dead)
+
+    spIndex, spDead = loaded
+    spStamp = volumeStamp()
+    return spIndex
+
+def logIndex(path, offset):
+    # appends one index entry and records the new volume size and dead bytes
+    global spStamp
+    path = path.encode()
+    # not O_APPEND: on Linux that makes the header pwrite below append as well
+    fd = os.open(indexName, os.O_WRONLY)
+    try:
+        os.pwrite(fd, INDEX_ENTRY.pack(offset, len(path)) + path, os.fstat(fd).st_size)
+        os.pwrite(fd, INDEX_HEADER.pack(INDEX_MAGIC, os.stat(fileName).st_size, spDead), 0)
+    finally:
+        os.close(fd)
+    spStamp = volumeStamp()
+
+def appendRecord(kind, path, content=b"", created=None):
+    index = loadIndex()
+    now = time.time()
+    record = packRecord(kind, path, created or now, now, content)
+    fd = os.open(fileName, os.O_WRONLY | os.O_APPEND)
+    try:
+        offset = os.fstat(fd).st_size
+        os.write(fd, record)
+    finally:
+        os.close(fd)
+    index[path] = offset
+    logIndex(path, offset)
+    return offset
+
+def killRecord(path):
+    # flips the kind byte of the record to DEAD, the bytes are reclaimed later
+    global spDead
+    index = loadIndex()
+    offset = index.pop(path)
+    fd = os.open(fileName, os.O_RDWR)
+    try:
+        _, _, _, _, data_start, size = readHeader(fd, offset)
+        os.pwrite(fd, bytes([DEAD]), offset)
+    finally:
+        os.close(fd)
+    spDead += data_start + size - offset
+    logIndex(path, 0)
+
+def compactPFS():
+    # copies the live records into a new volume once half of it is dead
+    global spIndex, spDead, spStamp
+    index = loadIndex()
+    if spDead < COMPACT_MIN or spDead * 2 <= os.stat(fileName).st_size:
+        return
+
+    new_index = {}
+    fd = os.open(fileName, os.O_RDONLY)
+    try:
+        with open(fileName + ".tmp", 'wb') as out:
+            out.write(PFS_MAGIC)
+            for path, offset in sorted(index.items(), key=lambda item: item[1]):
+                _, _, _, _, data_start, size = readHeader(fd, offset)
+                new_index[path] = out.tell()
+                out.write(os.pread(fd, data_start + size - offset, offset))
+    finally:
+        os.close(fd)
+    os.replace(fileName + ".tmp", fileName)
+    writeIndex(new_index, 0)
+    spIndex, spDead, spStamp = new_index, 0, volumeStamp()
+
+def isFile(path):
+    offset = loadIndex().get(path)
+    if offset is None:
+        return False
+    fd = os.open(fileName, os.O_RDONLY)
+    try:
+        return readHeader(fd, offset)[0] == FILE
+    finally:
+        os.close(fd)
+
 def checkPFS():
         #Checks if privatePFS file already exists
     try:
-        privatePFS = open("privatePFS.txt", "x")
-        privatePFS.write("+root/#END#")
+        with open(fileName, "xb") as privatePFS:
+            privatePFS.write(PFS_MAGIC)
+            now = time.time()
+            privatePFS.write(packRecord(DIR, "+root/", now, now))
     except FileExistsError:
         print("File Already Exists")
+    loadIndex()
 
 def do_sp_command(command):
 
@@ -326,42 +547,39 @@ def merge(arg, arg2, arg3):
 def ls(path):
     global fileName
     try:
-        with open(fileName, 'r') as f:
-            content = f.read()
-
-        entries = content.split('#END#')
+        index = loadIndex()
         results = []
 
         # Format check
         if not path.startswith('+'):
             path = '+' + path
 
-        #For the single file ls
-        if ".txt" in path:
-            # Checks for path + |FILE| and displays the name and last mod time
-            for entry in entries:
-                if entry.strip().startswith(path) and '|FILE|' in entry:
-                    parts = entry.split('|')
-                    if len(parts) >= 4:
+        fd = os.open(fileName, os.O_RDONLY)
+        try:
+            #For the single file ls
+            if ".txt" in path:
+                # Looks up the path and displays the name and last mod time
+                if path in index:
+                    kind, _, _, modified, _, _ = readHeader(fd, index[path])
+                    if kind == FILE:
                         filename = path.split('/')[-1]
-                        modified = parts[3]
-                        print([(filename, modified)])
+                        print([(filename, time.strftime(TIME_FORMAT, time.localtime(modified)))])
                         return
 
-        # Format Check
-        if not path.endswith('/'):
-            path += '/'
-
-        #Lists all files underneath this directory
-        for entry in entries:
-            if entry.strip().startswith(path) and '|FILE|' in entry:
-                parts = entry.split('|')
-                if len(parts) >= 4:
-                    # Extract file name from path
-                    fileName = parts[0]
-                    filename = fileName.split('/')[-1]
-                    modified = parts[3]
-                    results.append((filename, modified))
+            # Format Check
+            if not path.endswith('/'):
+                path += '/'
+
+            #Lists all files underneath this directory
+            for entry_path, offset in index.items():
+                if entry_path.startswith(path):
+                    kind, _, _, modified, _, _ = readHeader(fd, offset)
+                    if kind == FILE:
+                        # Extract file name from path
+                        filename = entry_path.split('/')[-1]
+                        results.append((filename, time.strftime(TIME_FORMAT, time.localtime(modified))))
+        finally:
+            os.close(fd)
 
         if not results:
             print("No files found at the given path.")
@@ -377,8 +595,7 @@ def ls(path):
 def rmdir(dir_path):
     global fileName
     try:
-        with open(fileName, 'r+') as f:
-            content = f.read()
+        index = loadIndex()
 
         # Make sure path is formatted is in format
         if not dir_path.endswith('/'):
@@ -386,31 +603,15 @@ def rmdir(dir_path):
         if not dir_path.startswith('+'):
             dir_path = '+' + dir_path
 
-        entries = content.split('#END#')
-        new_entries = []
-        found = False
-
-        for entry in entries:
-            entry = entry.strip()
-            if entry == "":
-                continue
-
-            # Removes the directory and everything under it
-            if entry.startswith(dir_path):
-                found = True
-                continue
-
-            new_entries.append(entry)
-
-        if not found:
+        # Removes the directory and everything under it
+        doomed = [path for path in index if path.startswith(dir_path)]
+        if not doomed:
             print("Directory not found.")
             return False
 
-        # Update and put back
-        new_content = '#END#'.join(new_entries).strip() + '#END#'
-
-        with open(fileName, 'w') as f:
-            f.write(new_content)
+        for path in doomed:
+            killRecord(path)
+        compactPFS()
 
         return True
 
@@ -421,8 +622,7 @@ def rmdir(dir_path):
 def mkdir(path):
     global fileName
     try:
-        with open(fileName, 'r+') as f:
-            content = f.read()
+        index = loadIndex()
 
         #  Makes sure it ends with a slash and starts with '+'
         if not path.endswith('/'):
@@ -431,16 +631,12 @@ def mkdir(path):
             path = '+' + path
 
         # Check if directory already exists
-        if path in content:
+        if path in index:
             print("Directory already exists.")
             return False
 
-        # Format directory entry
-        new_entry = f"{path}#END#"
-
         # Add the new directory
-        with open(fileName, 'a') as f:
-            f.write(new_entry)
+        appendRecord(DIR, path)
 
         return True
 
@@ -451,31 +647,13 @@ def mkdir(path):
 def rm(entry_path):
     global fileName
     try:
-        with open(fileName, 'r+') as f:
-            content = f.read()
-
-        entries = content.split('#END#')
-        new_entries = []
-        found = False
-
-        for entry in entries:
-            if entry.strip() == "":
-                continue
-            if entry_path in entry:
-                # Checks if it's an exact match
-                if entry.strip().startswith(entry_path):
-                    found = True
-                    continue  # Skip this entry (i.e., remove it)
-            new_entries.append(entry.strip())
-
-        if not found:
+        if entry_path not in loadIndex():
             print("Entry not found.")
             return False
 
-        # Update and put it back to PFS
-        new_content = '#END#'.join(new_entries).strip() + '#END#'
-        with open(fileName, 'w') as f:
-            f.write(new_content)
+        # Mark the record dead, compaction reclaims the space later
+        killRecord(entry_path)
+        compactPFS()
 
         return True
 
@@ -495,11 +673,6 @@ def spCopy(arg, arg2):
 
         print("Destination path must start with +")
         return
-    
-    #Checks if the destination file already exists, if not, create a new entry
-    if not checkFileExists(arg2):
-
-        addToPFS(arg2, True, getSPContent(arg))
 
     # get content from real/fake file system
     if arg[0] == '+':
@@ -510,7 +683,14 @@ def spCopy(arg, arg2):
 
         content = getContent(arg)
 
-    overWrite(arg2, content)
+    #Checks if the destination file already exists, if not, create a new entry
+    if not checkFileExists(arg2):
+
+        addToPFS(arg2, True, content)
+
+    else:
+
+        overWrite(arg2, content)
 
     return
 
@@ -518,28 +698,21 @@ def addToPFS(entry_path, is_file=False, file_content=""):
     global fileName
 
     try:
-        with open(fileName, 'r+') as f:
-            content = f.read()
+        index = loadIndex()
+
+        if not is_file and not entry_path.endswith('/'):
+            entry_path += '/'
 
         # Check if entry already exists
-        if entry_path in content:
+        if entry_path in index:
             print("Entry already exists.")
             return False
 
-        # Build new entry
-        new_entry = ""
+        # Add new entry to PFS
         if is_file:
-            now = time.strftime('%B-%d-%Y:%H:%M:%S')
-            size = str(len(file_content))
-            new_entry = f"{entry_path}|FILE|{now}|{now}|{size}|{file_content}#END#"
+            appendRecord(FILE, entry_path, file_content.encode())
         else:
-            if not entry_path.endswith('/'):
-                entry_path += '/'
-            new_entry = f"{entry_path}#END#"
-
-        # Add new entry to PFS
-        with open(fileName, 'a') as f:
-            f.write(new_entry)
+            appendRecord(DIR, entry_path)
 
         return True
 
@@ -552,46 +725,23 @@ def overWrite(file_path, new_content):
     global fileName
     
     try:
-        with open(fileName, 'r+') as f:
-            content = f.read()
-
-        #Split content of the PFS file by #END#
-        entries = content.split('#END#')
-        new_entries = []
-        found = False
-
-        for entry in entries:
-            if file_path in entry and '|FILE|' in entry:
-                parts = entry.split('|')
-                if len(parts) >= 6:
-                    found = True
-                    # Update time for modification section
-                    modified_time = time.strftime('%B-%d-%Y:%H:%M:%S')
-
-                    # Update the file entry
-                    updated_entry = '|'.join([
-                        parts[0],                 # +path
-                        parts[1],                 # FILE
-                        parts[2],                 # Created date + time (unchanged)
-                        modified_time,            # New modified date + time
-                        str(len(new_content)),    # New size
-                        new_content               # New content
-                    ])
-                    new_entries.append(updated_entry)
-                else:
-                    new_entries.append(entry)
-            else:
-                new_entries.append(entry)
+        index = loadIndex()
 
-        if not found:
+        if not isFile(file_path):
             print("File not found.")
             return False
 
-        # Rejoin and put it back to the PFS file
-        new_content_full = '#END#'.join(new_entries).strip()
+        # Keep the created time, the new record gets a new modified time
+        fd = os.open(fileName, os.O_RDONLY)
+        try:
+            created = readHeader(fd, index[file_path])[2]
+        finally:
+            os.close(fd)
 
-        with open(fileName, 'w') as f:
-            f.write(new_content_full)
+        # Old record is marked dead and the new one appended
+        killRecord(file_path)
+        appendRecord(FILE, file_path, new_content.encode(), created)
+        compactPFS()
 
         return True
 
@@ -603,18 +753,9 @@ def checkFileExists(path):
     global fileName
 
     try:
-        # Try to open the private file system file
-        with open(fileName, "r") as privatePFS:
-            # Read the entire content of the file
-            content = privatePFS.read()
-
-        # Split entries using #END#
-        entries = content.split('#END#')
-
-        # Loop through each entry to check if the given path exists in the private system
-        for entry in entries:
-            if path in entry:
-                return True 
+        # Look the path up in the private system index
+        if path in loadIndex():
+            return True
 
         # If not found in private system, try checking the real file system
         with open(path, "r") as file:
@@ -633,22 +774,21 @@ def getSPContent(file_path):
     global fileName
 
     try:
-        with open(fileName, 'r+') as f:
-            content = f.read()
-        
-        # Split the content by the #END# to process each entry.
-        entries = content.split('#END#')
-
-        for entry in entries:
-            # Check if the entry matches to a file and matches the file path
-            if file_path in entry and '|FILE|' in entry:
-                # get the part after |FILE|, which has the content
-                parts = entry.split('|')
-                if len(parts) >= 6:
-                    return parts[5]
-
-        # If file not found
-        return None
+        offset = loadIndex().get(file_path)
+        if offset is None:
+            # If file not found
+            return None
+
+        # Read only this record's content
+        fd = os.open(fileName, os.O_RDONLY)
+        try:
+            kind, _, _, _, data_start, size = readHeader(fd, offset)
+            if kind != FILE:
+                return None
+            return os.pread(fd, size, data_start).decode()
+        finally:
+            os.close(fd)
+
     except FileNotFoundError:
         print(f"The file '{fileName}' does not exist.")
         return None
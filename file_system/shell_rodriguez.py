@@ -1,8 +1,12 @@
-import file_system_logic
+import pfs_crc
+import pfs_engines
 import os
 import sys
 import re
 
+# the private.pfs backend, file_system_logic unless --engine picks another
+engine = None
+
 #command to split the command but keeps any double quotes 
 # Ex.   grep "test" file.txt --> ['grep', '"test"', 'text.txt']
 def split_command(command):
@@ -151,32 +155,31 @@ def do_command(command):
 
     # handle supplemental FS commands
     if arg[0] == "cp" and len(arg) == 3 and ("+" in arg[1] or "+" in arg[2]):
-        file_system_logic.load_index()
-        file_system_logic.cp(arg[1], arg[2])
+        engine.cp(arg[1], arg[2])
         return
     elif arg[0] == "show" and len(arg) == 2 and arg[1].startswith("+"):
-        file_system_logic.load_index()
-        file_system_logic.show(arg[1])
+        engine.show(arg[1])
         return
     elif arg[0] == "rm" and len(arg) == 2 and arg[1].startswith("+"):
-        file_system_logic.load_index()
-        file_system_logic.rm(arg[1])
+        engine.rm(arg[1])
         return
     elif arg[0] == "mkdir" and len(arg) == 2 and arg[1].startswith("+"):
-        file_system_logic.load_index()
-        file_system_logic.mkdir(arg[1])
+        engine.mkdir(arg[1])
         return
     elif arg[0] == "rmdir" and len(arg) == 2 and arg[1].startswith("+"):
-        file_system_logic.load_index()
-        file_system_logic.rmdir(arg[1])
+        engine.rmdir(arg[1])
         return
     elif arg[0] == "ls" and len(arg) == 2 and arg[1].startswith("+"):
-        file_system_logic.load_index()
-        file_system_logic.ls(arg[1])
+        engine.ls(arg[1])
         return
     elif arg[0] == "merge" and len(arg) == 4 and any("+" in a for a in arg[1:]):
-        file_system_logic.load_index()
-        file_system_logic.merge(arg[1], arg[2], arg[3])
+        engine.merge(arg[1], arg[2], arg[3])
+        return
+    elif arg[0] == "snapshot" and len(arg) <= 2:
+        engine.snapshot(arg[1] if len(arg) == 2 else None)
+        return
+    elif arg[0] == "fsck" and len(arg) == 1:
+        engine.fsck()
         return
 
     # process the input output redirection
@@ -234,6 +237,14 @@ def do_command(command):
             os.waitpid(pid, 0)
 
 
+# a block that fails its checksum ends the command, not the shell
+def run_command(command):
+    try:
+        do_command(command)
+    except pfs_crc.ChecksumError as e:
+        print(f"Error: {e}")
+
+
 #used to read files 
 def process_in(fd):
     with fd as openfile:
@@ -244,11 +255,13 @@ def process_in(fd):
                 continue
             if command.lower() == "exit": 
                 sys.exit(0) 
-            do_command(command)
+            run_command(command)
 
 def main():
     #check if the argument provided was a file
-    file_system_logic.open_or_create_pfs()
+    global engine
+    engine = pfs_engines.select(sys.argv, "index")
+    engine.fsck(quiet=True)
     
     if len(sys.argv) > 1:
         try:
@@ -276,7 +289,7 @@ def main():
                 print("There is no current 'inspirational' quote, but\nYou Got This!")
             continue
         
-        do_command(command)
+        run_command(command)
 
 if __name__ == "__main__":
     main()
@@ -1,11 +1,24 @@
 #!/usr/bin/env python3
-import os, sys, time, struct
+import os, sys, time, struct, stat
 
 PFS_PATH = 'private.pfs'
 MAGIC = b'PFS1'
+VERSION = 3
+# version 2 volumes have no snapshot directory, which is read as zero
+COMPATIBLE_VERSIONS = (2, VERSION)
+# version 1 volumes kept each file as one run at its entry's offset, after a
+# 16-byte superblock; they are copied into extents when opened
+V1_SUPERBLOCK_SIZE = 16
 MAX_ENTRIES = 1024
+MAX_EXTENTS = 4096
 NAME_SIZE = 64
 BUFSIZE = 4096
+MAX_BUFSIZE = 8 * 1024 * 1024
+
+# preallocation: a growing file reserves at least PREALLOC_MIN and then
+# roughly doubles its capacity, capped at PREALLOC_MAX per extent
+PREALLOC_MIN = 64 * 1024
+PREALLOC_MAX = 8 * 1024 * 1024
 
 TYPE_UNUSED = 0
 TYPE_FILE   = 1
@@ -33,43 +46,367 @@ class PFSEntry:
         return struct.pack(self.struct_fmt, name_padded, self.type,
                            self.parent, self.size, self.offset, self.mtime)
 
+class PFSExtent:
+    # owner is stored on disk as entry index + 1 so an all-zero slot is free
+    struct_fmt = '!I Q Q Q'
+    struct_len = struct.calcsize(struct_fmt)
+
+    def __init__(self, owner=-1, file_offset=0, disk_offset=0, length=0):
+        self.owner       = owner
+        self.file_offset = file_offset
+        self.disk_offset = disk_offset
+        self.length      = length
+
+    @property
+    def end(self):
+        return self.disk_offset + self.length
+
+    @classmethod
+    def from_bytes(cls, data):
+        owner, file_offset, disk_offset, length = struct.unpack(cls.struct_fmt, data)
+        return cls(owner - 1, file_offset, disk_offset, length)
+
+    def to_bytes(self):
+        return struct.pack(self.struct_fmt, self.owner + 1,
+                           self.file_offset, self.disk_offset, self.length)
+
+class PFSSnapshot:
+    # a snapshot is a copy of the entry and extent tables kept in the data
+    # region; the extents it lists are pinned until the snapshot is dropped
+    struct_fmt = f'!{NAME_SIZE}s Q Q'
+    struct_len = struct.calcsize(struct_fmt)
+
+    def __init__(self, name=b'', mtime=0, offset=0):
+        self.name   = name.rstrip(b'\x00')
+        self.mtime  = mtime
+        self.offset = offset
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(*struct.unpack(cls.struct_fmt, data))
+
+    def to_bytes(self):
+        return struct.pack(self.struct_fmt, self.name.ljust(NAME_SIZE, b'\x00'),
+                           self.mtime, self.offset)
+
+# superblock: magic, version, extent slots in use, data high-water mark,
+# snapshot directory offset (0 when there are no snapshots)
+SUPERBLOCK_FMT = '!4sIIQQ'
+SUPERBLOCK_SIZE = 32
 ENTRY_SIZE = PFSEntry.struct_len
-SUPERBLOCK_SIZE = 16 
+EXTENT_SIZE = PFSExtent.struct_len
 ENTRY_TABLE_OFFSET = SUPERBLOCK_SIZE
-DATA_REGION_OFFSET = SUPERBLOCK_SIZE + MAX_ENTRIES * ENTRY_SIZE
+EXTENT_TABLE_OFFSET = ENTRY_TABLE_OFFSET + MAX_ENTRIES * ENTRY_SIZE
+DATA_REGION_OFFSET = EXTENT_TABLE_OFFSET + MAX_EXTENTS * EXTENT_SIZE
+SNAPSHOT_SIZE = DATA_REGION_OFFSET - ENTRY_TABLE_OFFSET
 
 class PFS:
     def __init__(self, path=PFS_PATH):
+        self.path = path
         self.fd = os.open(path, os.O_RDWR|os.O_CREAT, 0o600)
+        self.read_only = False
         self._init_if_empty()
+        magic, version = struct.unpack('!4sI', os.pread(self.fd, 8, 0))
+        if magic == MAGIC and version == 1:
+            self._migrate_v1()
         self._load_superblock()
         self._load_entries()
+        self._load_snapshots()
+        self._load_extents()
 
     def _init_if_empty(self):
         st = os.fstat(self.fd)
-        if st.st_size < DATA_REGION_OFFSET:
-            os.lseek(self.fd, 0, os.SEEK_SET)
-            header = MAGIC + struct.pack('!III', 1, 1, DATA_REGION_OFFSET)
-            os.write(self.fd, header)
-            os.write(self.fd, b'\x00' * (MAX_ENTRIES * ENTRY_SIZE))
+        if st.st_size == 0:
+            self.num_extents = 0
+            self.data_end = DATA_REGION_OFFSET
+            self.snap_dir = 0
+            self._write_superblock()
+            os.pwrite(self.fd, b'\x00' * (DATA_REGION_OFFSET - ENTRY_TABLE_OFFSET),
+                      ENTRY_TABLE_OFFSET)
+
+    def _migrate_v1(self):
+        """Rewrite a version 1 volume as a current one, keeping entry indexes and mtimes."""
+        raw = os.pread(self.fd, MAX_ENTRIES * ENTRY_SIZE, V1_SUPERBLOCK_SIZE)
+        old = [PFSEntry.from_bytes(raw[i:i + ENTRY_SIZE])
+               for i in range(0, len(raw), ENTRY_SIZE)]
+        tmp = self.path + '.tmp'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        new = PFS(tmp)
+        try:
+            for idx, e in enumerate(old):
+                if e.type == TYPE_UNUSED:
+                    continue
+                # indexes stay the same, so parent links need no rewriting
+                new.entries[idx] = PFSEntry(e.name, e.type, e.parent)
+                if e.type == TYPE_FILE and e.size:
+                    # a fresh volume has no snapshots, so the extents can be filled directly
+                    new.reserve(idx, e.size)
+                    src = e.offset
+                    for off, n in new._map(idx, 0, e.size):
+                        while n:
+                            chunk = os.pread(self.fd, min(MAX_BUFSIZE, n), src)
+                            if not chunk:
+                                raise RuntimeError("truncated version 1 volume")
+                            os.pwrite(new.fd, chunk, off)
+                            src += len(chunk)
+                            off += len(chunk)
+                            n -= len(chunk)
+                    new.entries[idx].size = e.size
+                    new.trim(idx)
+                new.entries[idx].mtime = e.mtime
+                new._write_entry(idx)
+        except BaseException:
+            os.close(new.fd)
+            os.remove(tmp)
+            raise
+        os.close(new.fd)
+        os.replace(tmp, self.path)
+        os.close(self.fd)
+        self.fd = os.open(self.path, os.O_RDWR)
 
     def _load_superblock(self):
-        os.lseek(self.fd, 0, os.SEEK_SET)
-        data = os.read(self.fd, SUPERBLOCK_SIZE)
-        magic, version, self.num_entries, self.next_data_offset = struct.unpack('!4sIII', data)
+        data = os.pread(self.fd, struct.calcsize(SUPERBLOCK_FMT), 0)
+        magic, version, self.num_extents, self.data_end, self.snap_dir = \
+            struct.unpack(SUPERBLOCK_FMT, data)
         if magic != MAGIC:
             raise RuntimeError("Not a PFS volume")
-
-    def _load_entries(self):
-        self.entries = []
-        os.lseek(self.fd, ENTRY_TABLE_OFFSET, os.SEEK_SET)
-        for _ in range(MAX_ENTRIES):
-            raw = os.read(self.fd, ENTRY_SIZE)
-            self.entries.append(PFSEntry.from_bytes(raw))
+        if version not in COMPATIBLE_VERSIONS:
+            raise RuntimeError(f"Unsupported PFS version {version}")
+
+    def _check_writable(self):
+        if self.read_only:
+            raise OSError("PFS: snapshots are read-only")
+
+    def _write_superblock(self):
+        self._check_writable()
+        header = struct.pack(SUPERBLOCK_FMT, MAGIC, VERSION,
+                             self.num_extents, self.data_end, self.snap_dir)
+        os.pwrite(self.fd, header.ljust(SUPERBLOCK_SIZE, b'\x00'), 0)
+
+    def _load_entries(self, raw=None):
+        if raw is None:
+            raw = os.pread(self.fd, MAX_ENTRIES * ENTRY_SIZE, ENTRY_TABLE_OFFSET)
+        self.entries = [PFSEntry.from_bytes(raw[i:i + ENTRY_SIZE])
+                        for i in range(0, len(raw), ENTRY_SIZE)]
+
+    def _load_snapshots(self):
+        # the directory is a count followed by one PFSSnapshot per snapshot
+        self.snapshots = []
+        self.pinned = []
+        if not self.snap_dir:
+            return
+        count, = struct.unpack('!I', os.pread(self.fd, 4, self.snap_dir))
+        raw = os.pread(self.fd, count * PFSSnapshot.struct_len, self.snap_dir + 4)
+        self.snapshots = [PFSSnapshot.from_bytes(raw[i:i + PFSSnapshot.struct_len])
+                          for i in range(0, len(raw), PFSSnapshot.struct_len)]
+        ranges = [(self.snap_dir, 4 + len(raw))]
+        for snap in self.snapshots:
+            ranges.append((snap.offset, SNAPSHOT_SIZE))
+            table = os.pread(self.fd, MAX_EXTENTS * EXTENT_SIZE,
+                             snap.offset + EXTENT_TABLE_OFFSET - ENTRY_TABLE_OFFSET)
+            for i in range(0, len(table), EXTENT_SIZE):
+                x = PFSExtent.from_bytes(table[i:i + EXTENT_SIZE])
+                if x.owner >= 0 and x.length:
+                    ranges.append((x.disk_offset, x.length))
+        # merged [start, end) runs that live writes and the free map must avoid
+        for off, length in sorted(ranges):
+            if self.pinned and off <= self.pinned[-1][1]:
+                self.pinned[-1][1] = max(self.pinned[-1][1], off + length)
+            else:
+                self.pinned.append([off, off + length])
+
+    def _load_extents(self, raw=None):
+        if raw is None:
+            raw = os.pread(self.fd, MAX_EXTENTS * EXTENT_SIZE, EXTENT_TABLE_OFFSET)
+        self.extents = [PFSExtent.from_bytes(raw[i:i + EXTENT_SIZE])
+                        for i in range(0, len(raw), EXTENT_SIZE)]
+        self.free_extent_slots = []
+        self.file_extents = {}
+        for slot in range(MAX_EXTENTS - 1, -1, -1):
+            x = self.extents[slot]
+            if x.owner < 0:
+                self.free_extent_slots.append(slot)
+            else:
+                self.file_extents.setdefault(x.owner, []).append(slot)
+        for slots in self.file_extents.values():
+            slots.sort(key=lambda s: self.extents[s].file_offset)
+        self._build_free_map()
+
+    def _build_free_map(self):
+        # the free-space map is not stored; it is every gap between the
+        # extents and pinned snapshot data below the persisted high-water mark
+        self.free_map = []
+        cur = DATA_REGION_OFFSET
+        used = [(x.disk_offset, x.end) for x in self.extents if x.owner >= 0]
+        for start, end in sorted(used + [tuple(run) for run in self.pinned]):
+            if start > cur:
+                self.free_map.append([cur, start - cur])
+            cur = max(cur, end)
+        if self.data_end > cur:
+            self.free_map.append([cur, self.data_end - cur])
 
     def _write_entry(self, idx):
-        os.lseek(self.fd, ENTRY_TABLE_OFFSET + idx * ENTRY_SIZE, os.SEEK_SET)
-        os.write(self.fd, self.entries[idx].to_bytes())
+        self._check_writable()
+        os.pwrite(self.fd, self.entries[idx].to_bytes(),
+                  ENTRY_TABLE_OFFSET + idx * ENTRY_SIZE)
+
+    def _write_extent(self, slot):
+        self._check_writable()
+        os.pwrite(self.fd, self.extents[slot].to_bytes(),
+                  EXTENT_TABLE_OFFSET + slot * EXTENT_SIZE)
+
+    ##### free-space map #####
+
+    def _alloc_space(self, length):
+        for run in self.free_map:
+            if run[1] >= length:
+                off = run[0]
+                run[0] += length
+                run[1] -= length
+                if run[1] == 0:
+                    self.free_map.remove(run)
+                return off
+        off = self.data_end
+        self.data_end += length
+        self._write_superblock()
+        return off
+
+    def _grow_in_place(self, x, length):
+        if x.end == self.data_end:
+            self.data_end += length
+            self._write_superblock()
+            return True
+        for run in self.free_map:
+            if run[0] == x.end and run[1] >= length:
+                run[0] += length
+                run[1] -= length
+                if run[1] == 0:
+                    self.free_map.remove(run)
+                return True
+        return False
+
+    def _free_space(self, off, length):
+        # bytes a snapshot still uses stay allocated until it is dropped
+        end = off + length
+        for start, stop in self.pinned:
+            if stop <= off or start >= end:
+                continue
+            self._free_run(off, max(0, start - off))
+            off = max(off, stop)
+        self._free_run(off, max(0, end - off))
+
+    def _free_run(self, off, length):
+        if length == 0:
+            return
+        runs = self.free_map
+        i = 0
+        while i < len(runs) and runs[i][0] < off:
+            i += 1
+        runs.insert(i, [off, length])
+        if i + 1 < len(runs) and runs[i][0] + runs[i][1] == runs[i + 1][0]:
+            runs[i][1] += runs.pop(i + 1)[1]
+        if i > 0 and runs[i - 1][0] + runs[i - 1][1] == runs[i][0]:
+            runs[i - 1][1] += runs.pop(i)[1]
+            i -= 1
+        if runs[i][0] + runs[i][1] == self.data_end:
+            self.data_end = runs.pop(i)[0]
+            self._write_superblock()
+
+    ##### per-file extents #####
+
+    def _is_pinned(self, x):
+        return any(start < x.end and x.disk_offset < stop for start, stop in self.pinned)
+
+    def unshare(self, idx):
+        """Move extents of idx that a snapshot still uses, so writing them is safe."""
+        sizes = _buffer_sizes()
+        for slot in self.file_extents.get(idx, ()):
+            x = self.extents[slot]
+            if not self._is_pinned(x):
+                continue
+            off = self._alloc_space(x.length)
+            _copy_range(self.fd, x.disk_offset, self.fd, off, x.length, sizes)
+            self._free_space(x.disk_offset, x.length)
+            x.disk_offset = off
+            self._write_extent(slot)
+
+    def _capacity(self, idx):
+        return sum(self.extents[s].length for s in self.file_extents.get(idx, ()))
+
+    def reserve(self, idx, needed):
+        """Make sure file idx has at least `needed` bytes of backing space."""
+        capacity = self._capacity(idx)
+        if capacity >= needed:
+            return
+        want = max(needed - capacity, min(PREALLOC_MAX, max(PREALLOC_MIN, capacity)))
+        slots = self.file_extents.setdefault(idx, [])
+        if slots and self._grow_in_place(self.extents[slots[-1]], want):
+            self.extents[slots[-1]].length += want
+            self._write_extent(slots[-1])
+            return
+        if not self.free_extent_slots:
+            raise RuntimeError("PFS: extent table full")
+        slot = self.free_extent_slots.pop()
+        self.extents[slot] = PFSExtent(owner=idx, file_offset=capacity,
+                                       disk_offset=self._alloc_space(want),
+                                       length=want)
+        slots.append(slot)
+        self.num_extents += 1
+        self._write_extent(slot)
+        self._write_superblock()
+
+    def _release_extent(self, slot):
+        x = self.extents[slot]
+        self._free_space(x.disk_offset, x.length)
+        self.extents[slot] = PFSExtent()
+        self._write_extent(slot)
+        self.free_extent_slots.append(slot)
+        self.num_extents -= 1
+
+    def _free_extents(self, idx):
+        for slot in self.file_extents.pop(idx, []):
+            self._release_extent(slot)
+        self._write_superblock()
+
+    def trim(self, idx):
+        """Give preallocated space past the end of file idx back to the free map."""
+        size = self.entries[idx].size
+        slots = self.file_extents.get(idx, [])
+        while slots:
+            x = self.extents[slots[-1]]
+            if x.file_offset >= size:
+                self._release_extent(slots.pop())
+                continue
+            keep = size - x.file_offset
+            if keep < x.length:
+                self._free_space(x.disk_offset + keep, x.length - keep)
+                x.length = keep
+                self._write_extent(slots[-1])
+            break
+        self._write_superblock()
+
+    def segments(self, idx, offset=0, length=None):
+        """Return the (fd, disk_offset, length) pieces backing a byte range of idx."""
+        if length is None:
+            length = max(0, self.entries[idx].size - offset)
+        return [(self.fd, off, n) for off, n in self._map(idx, offset, length)]
+
+    def _map(self, idx, offset, length):
+        """Yield (disk_offset, length) pieces covering [offset, offset+length)."""
+        for slot in self.file_extents.get(idx, ()):
+            if length <= 0:
+                return
+            x = self.extents[slot]
+            if offset >= x.file_offset + x.length:
+                continue
+            skip = offset - x.file_offset
+            n = min(length, x.length - skip)
+            yield x.disk_offset + skip, n
+            offset += n
+            length -= n
+
+    ##### entries #####
 
     def _allocate_entry_index(self):
         for i, e in enumerate(self.entries):
@@ -99,15 +436,16 @@ class PFS:
             return pidx, name
         return 0, parts[0]
 
-    def create_file(self, path):
+    def create_file(self, path, size_hint=0):
         idx = self._allocate_entry_index()
         parent, name = self._parent_and_name(path)
-        off = self.next_data_offset
         e = PFSEntry(name=name.encode(), type=TYPE_FILE,
                      parent=parent, size=0,
-                     offset=off, mtime=int(time.time()))
+                     offset=0, mtime=int(time.time()))
         self.entries[idx] = e
         self._write_entry(idx)
+        if size_hint:
+            self.reserve(idx, size_hint)
         return idx
 
     def open_file(self, path):
@@ -118,22 +456,36 @@ class PFS:
 
     def read_file(self, idx, size, offset):
         e = self.entries[idx]
-        os.lseek(self.fd, e.offset + offset, os.SEEK_SET)
-        return os.read(self.fd, min(size, e.size - offset))
+        size = max(0, min(size, e.size - offset))
+        return b''.join(os.pread(self.fd, n, off)
+                        for off, n in self._map(idx, offset, size))
 
-    def write_file(self, idx, data, offset):
+    def write_file(self, idx, data, offset, commit=True):
+        self._check_writable()
         e = self.entries[idx]
-        os.lseek(self.fd, e.offset + offset, os.SEEK_SET)
-        os.write(self.fd, data)
+        self.unshare(idx)
+        self.reserve(idx, offset + len(data))
+        view = memoryview(data)
+        for off, n in self._map(idx, offset, len(data)):
+            os.pwrite(self.fd, view[:n], off)
+            view = view[n:]
         e.size = max(e.size, offset + len(data))
+        if commit:
+            self.commit(idx)
+
+    def commit(self, idx, size=None):
+        """Write the entry record of idx; bulk writers call this once at the end."""
+        e = self.entries[idx]
+        if size is not None:
+            e.size = size
         e.mtime = int(time.time())
-        self.entries[idx] = e
         self._write_entry(idx)
 
     def delete(self, path):
         idx = self._find_entry_idx(path)
         if idx is None:
             raise FileNotFoundError(path)
+        self._free_extents(idx)
         self.entries[idx] = PFSEntry()
         self._write_entry(idx)
 
@@ -170,6 +522,62 @@ class PFS:
                 out.append((entry.name.decode(), entry.mtime))
         return out
 
+    ##### snapshots #####
+
+    def _write_snapshots(self):
+        old = self.snap_dir, 4 + len(self.snapshots) * PFSSnapshot.struct_len
+        if self.snapshots:
+            raw = struct.pack('!I', len(self.snapshots)) + \
+                  b''.join(snap.to_bytes() for snap in self.snapshots)
+            self.snap_dir = self._alloc_space(len(raw))
+            os.pwrite(self.fd, raw, self.snap_dir)
+        else:
+            self.snap_dir = 0
+        self._write_superblock()
+        # the old directory and anything only the dropped snapshots used
+        # fall out of the pinned set and become free space again
+        self._load_snapshots()
+        self._build_free_map()
+
+    def snapshot(self, name):
+        """Freeze the current entry and extent tables under name."""
+        self._check_writable()
+        if not name or '@' in name or len(name.encode()) > NAME_SIZE:
+            raise ValueError(f"invalid snapshot name: {name}")
+        if any(snap.name == name.encode() for snap in self.snapshots):
+            raise FileExistsError(f"snapshot {name} already exists")
+        off = self._alloc_space(SNAPSHOT_SIZE)
+        os.pwrite(self.fd, b''.join(e.to_bytes() for e in self.entries) +
+                  b''.join(x.to_bytes() for x in self.extents), off)
+        self.snapshots.append(PFSSnapshot(name.encode(), int(time.time()), off))
+        self._write_snapshots()
+
+    def drop_snapshot(self, name):
+        self._check_writable()
+        keep = [snap for snap in self.snapshots if snap.name != name.encode()]
+        if len(keep) == len(self.snapshots):
+            raise FileNotFoundError(f"snapshot {name}")
+        self.snapshots = keep
+        self._write_snapshots()
+
+    def open_snapshot(self, name):
+        """Return a read-only PFS showing the tree as it was when name was taken."""
+        for snap in self.snapshots:
+            if snap.name == name.encode():
+                break
+        else:
+            raise FileNotFoundError(f"snapshot {name}")
+        view = PFS.__new__(PFS)
+        view.fd = self.fd
+        view.read_only = True
+        view.num_extents, view.data_end, view.snap_dir = self.num_extents, self.data_end, self.snap_dir
+        view.snapshots, view.pinned = self.snapshots, self.pinned
+        raw = os.pread(self.fd, SNAPSHOT_SIZE, snap.offset)
+        split = EXTENT_TABLE_OFFSET - ENTRY_TABLE_OFFSET
+        view._load_entries(raw[:split])
+        view._load_extents(raw[split:])
+        return view
+
     def update_mtime(self, path):
         idx = self._find_entry_idx(path)
         if idx is None:
@@ -181,47 +589,138 @@ class PFS:
 
 
 # Instantiate PFS
-pfs = PFS()
+try:
+    pfs = PFS()
+except RuntimeError as e:
+    sys.exit(f"{PFS_PATH}: {e}")
 
 ###################### Shell command functions ##################################################3
 
-def cmd_cp(src, dst):
-    # open source
-    if src.startswith('+'):
-        si = pfs.open_file(src[1:])
-        def read_chunk():
-            buf = pfs.read_file(si, BUFSIZE, read_chunk.offset)
-            read_chunk.offset += len(buf)
-            return buf
-        read_chunk.offset = 0
-    else:
-        sf = os.open(src, os.O_RDONLY)
-        def read_chunk():
-            return os.read(sf, BUFSIZE)
-
-    # open/create destination
-    if dst.startswith('+'):
-        try: pfs.delete(dst[1:])
-        except: pass
-        di = pfs.create_file(dst[1:])
-        def write_chunk(data):
-            nonlocal di
-            pfs.write_file(di, data, write_chunk.offset)
-            write_chunk.offset += len(data)
-        write_chunk.offset = 0
-    else:
-        df = os.open(dst, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0o644)
-        def write_chunk(data):
-            os.write(df, data)
-
-    # copy loop
+def _buffer_sizes():
+    # start small for tiny files, double up to MAX_BUFSIZE for big ones
+    size = BUFSIZE
     while True:
-        buf = read_chunk()
+        yield size
+        size = min(size * 2, MAX_BUFSIZE)
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def _read_chunks(segments=None, fd=None):
+    sizes = _buffer_sizes()
+    if segments is None:
+        while True:
+            buf = os.read(fd, next(sizes))
+            if not buf: return
+            yield buf
+    for sfd, off, n in segments:
+        end = off + n
+        while off < end:
+            buf = os.pread(sfd, min(next(sizes), end - off), off)
+            if not buf: return
+            yield buf
+            off += len(buf)
+
+def _copy_range(sfd, soff, dfd, doff, n, sizes):
+    done = 0
+    if hasattr(os, 'copy_file_range'):
+        try:
+            while done < n:
+                k = os.copy_file_range(sfd, dfd, n - done, soff + done, doff + done)
+                if k == 0: break
+                done += k
+        except OSError:
+            # cross-device, unsupported fs, old kernel: finish in userspace
+            pass
+    while done < n:
+        buf = os.pread(sfd, min(next(sizes), n - done), soff + done)
         if not buf: break
-        write_chunk(buf)
+        os.pwrite(dfd, buf, doff + done)
+        done += len(buf)
+    return done
+
+def _copy_segments(src, dst):
+    """Copy between two lists of (fd, offset, length) regular-file segments."""
+    sizes = _buffer_sizes()
+    src, dst = list(src), list(dst)
+    total = 0
+    while src and dst:
+        sfd, soff, slen = src[0]
+        dfd, doff, dlen = dst[0]
+        n = min(slen, dlen)
+        done = _copy_range(sfd, soff, dfd, doff, n, sizes)
+        total += done
+        if done < n: break
+        src[0] = (sfd, soff + n, slen - n)
+        dst[0] = (dfd, doff + n, dlen - n)
+        if src[0][2] == 0: src.pop(0)
+        if dst[0][2] == 0: dst.pop(0)
+    return total
+
+def _volume(path):
+    """Split '+dir/file@name' into the volume to read from and the path in it;
+    without '@name' the live volume is used."""
+    path, _, snap = path[1:].partition('@')
+    return (pfs.open_snapshot(snap) if snap else pfs), path
+
+def _open_source(path):
+    """Return (segments, fd, size); segments is None when the source is not
+    a regular file and has to be streamed from fd."""
+    if path.startswith('+'):
+        vol, path = _volume(path)
+        idx = vol.open_file(path)
+        size = vol.entries[idx].size
+        return vol.segments(idx, 0, size), None, size
+    fd = os.open(path, os.O_RDONLY)
+    st = os.fstat(fd)
+    if stat.S_ISREG(st.st_mode):
+        return [(fd, 0, st.st_size)], fd, st.st_size
+    return None, fd, 0
+
+def _close_source(source):
+    if source[1] is not None:
+        os.close(source[1])
+
+def _append_to_pfs(di, offset, source):
+    # metadata is left to the caller, which commits the entry once
+    segments, fd, size = source
+    if segments is not None:
+        pfs.unshare(di)
+        pfs.reserve(di, offset + size)
+        return _copy_segments(segments, pfs.segments(di, offset, size))
+    written = 0
+    for buf in _read_chunks(None, fd):
+        pfs.write_file(di, buf, offset + written, commit=False)
+        written += len(buf)
+    return written
+
+def _create_dest(path, size_hint):
+    try: pfs.delete(path)
+    except: pass
+    return pfs.create_file(path, size_hint=size_hint)
+
+def cmd_cp(src, dst):
+    source = _open_source(src)
+    try:
+        if dst.startswith('+'):
+            di = _create_dest(dst[1:], source[2])
+            pfs.commit(di, size=_append_to_pfs(di, 0, source))
+            pfs.trim(di)
+            return
 
-    if dst.startswith('+'):
-        pfs.update_mtime(dst[1:])
+        df = os.open(dst, os.O_WRONLY|os.O_CREAT|os.O_TRUNC, 0o644)
+        try:
+            if source[0] is not None and stat.S_ISREG(os.fstat(df).st_mode):
+                _copy_segments(source[0], [(df, 0, source[2])])
+            else:
+                for buf in _read_chunks(*source[:2]):
+                    _write_all(df, buf)
+        finally:
+            os.close(df)
+    finally:
+        _close_source(source)
 
 def cmd_rm(*paths):
     for path in paths:
@@ -251,7 +750,8 @@ def cmd_ls(path):
     if not path.startswith('+'):
         print(f"ls: only supplementary paths allowed: {path}", file=sys.stderr)
         return
-    items = pfs.list_dir(path[1:])
+    vol, path = _volume(path)
+    items = vol.list_dir(path)
     for name, mtime in items:
         print(f"+{name}\t{time.ctime(mtime)}")
 
@@ -260,55 +760,37 @@ def cmd_merge(src1, src2, dst):
         print("merge: destination must be a supplementary path (+...)", file=sys.stderr)
         return
 
-    def make_reader(path):
-        if path.startswith('+'):
-            idx = pfs.open_file(path[1:])
-            def reader():
-                buf = pfs.read_file(reader.idx, BUFSIZE, reader.offset)
-                reader.offset += len(buf)
-                return buf
-            reader.idx = idx
-            reader.offset = 0
-            return reader
-        else:
-            fd = os.open(path, os.O_RDONLY)
-            def reader():
-                return os.read(fd, BUFSIZE)
-            return reader
-
-    r1 = make_reader(src1)
-    r2 = make_reader(src2)
-
-    dpath = dst[1:]
-    try: pfs.delete(dpath)
-    except: pass
-    di = pfs.create_file(dpath)
-
-    def write_dest(data):
-        nonlocal di
-        pfs.write_file(di, data, write_dest.offset)
-        write_dest.offset += len(data)
-    write_dest.offset = 0
-
-    for r in (r1, r2):
-        while True:
-            buf = r()
-            if not buf: break
-            write_dest(buf)
-
-    pfs.update_mtime(dpath)
+    sources = [_open_source(src1), _open_source(src2)]
+    try:
+        di = _create_dest(dst[1:], sum(s[2] for s in sources))
+        size = 0
+        for source in sources:
+            size += _append_to_pfs(di, size, source)
+        pfs.commit(di, size=size)
+        pfs.trim(di)
+    finally:
+        for source in sources:
+            _close_source(source)
 
 def cmd_show(path):
     if not path.startswith('+'):
         print(f"show: only supplementary paths allowed: {path}", file=sys.stderr)
         return
-    idx = pfs.open_file(path[1:])
-    offset = 0
-    while True:
-        buf = pfs.read_file(idx, BUFSIZE, offset)
-        if not buf: break
-        os.write(1, buf)
-        offset += len(buf)
+    vol, path = _volume(path)
+    idx = vol.open_file(path)
+    for buf in _read_chunks(vol.segments(idx)):
+        _write_all(1, buf)
+
+def cmd_snapshot(*args):
+    if not args:
+        for snap in pfs.snapshots:
+            print(f"{snap.name.decode()}\t{time.ctime(snap.mtime)}")
+    elif len(args) == 2 and args[0] == '-d':
+        pfs.drop_snapshot(args[1])
+    elif len(args) == 1:
+        pfs.snapshot(args[0])
+    else:
+        print("Usage: snapshot [name | -d name]", file=sys.stderr)
 
 ######################## CLI dispatch ##############################################################
 
@@ -325,6 +807,7 @@ if __name__ == '__main__':
         elif cmd == 'ls'    and len(args)==1: cmd_ls(args[0])
         elif cmd == 'merge' and len(args)==3: cmd_merge(*args)
         elif cmd == 'show'  and len(args)==1: cmd_show(args[0])
+        elif cmd == 'snapshot' and len(args)<=2: cmd_snapshot(*args)
         else:
             print(f"Unknown or invalid args for '{cmd}'", file=sys.stderr)
             sys.exit(1)
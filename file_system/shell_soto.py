@@ -17,12 +17,48 @@ if not os.path.exists(SUPP_ROOT):
 
 def sup_path(path):
     #Map a '+path' to the SFS location under SUPP_ROOT
-    assert path.startswith('+'),# "Supplementary paths must start with '+'"
+    assert path.startswith('+')  # "Supplementary paths must start with '+'"
     # Remove leading '+' and normalize
     rel = path[1:].lstrip('/')
     return os.path.join(SUPP_ROOT, rel)
 
 
+COPY_CHUNK = 1 << 30   # max bytes per copy_file_range / sendfile call
+BUFSIZE = 1 << 20      # userspace fallback buffer
+
+
+def copy_fd(src_fd, dst_fd):
+    #Append everything left in src_fd to dst_fd, in the kernel when possible
+    try:
+        while os.copy_file_range(src_fd, dst_fd, COPY_CHUNK):
+            pass
+        return
+    except (AttributeError, OSError):
+        # no copy_file_range (old kernel/python, cross-fs, pipe): fall back
+        pass
+    while True:
+        buf = os.read(src_fd, BUFSIZE)
+        if not buf:
+            break
+        while buf:
+            buf = buf[os.write(dst_fd, buf):]
+
+
+def send_fd(src_fd, out_fd):
+    #Stream a whole file to out_fd (a tty, pipe or file) with sendfile
+    offset = 0
+    try:
+        while True:
+            sent = os.sendfile(out_fd, src_fd, offset, COPY_CHUNK)
+            if sent == 0:
+                return
+            offset += sent
+    except (AttributeError, OSError):
+        pass
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    copy_fd(src_fd, out_fd)
+
+
 def fmt_time(epoch):
     #Format 
     return datetime.fromtimestamp(epoch).strftime('%Y-%m-%d %H:%M:%S')
@@ -112,11 +148,10 @@ def cmd_ls(args):
         return
     p = sup_path(target)
     if os.path.isdir(p):
-        entries = os.listdir(p)
-        for name in entries:
-            full = os.path.join(p, name)
-            mtime = fmt_time(os.path.getmtime(full))
-            print(f"{name}\t{mtime}")
+        with os.scandir(p) as entries:
+            for entry in entries:
+                mtime = fmt_time(entry.stat().st_mtime)
+                print(f"{entry.name}\t{mtime}")
     elif os.path.isfile(p):
         name = target[1:]
         mtime = fmt_time(os.path.getmtime(p))
@@ -146,9 +181,9 @@ def cmd_merge(args):
         else:
             dp = dst
         # Concatenate
-        with open(dp, 'w') as out, open(path1) as i1, open(path2) as i2:
-            out.write(i1.read())
-            out.write(i2.read())
+        with open(dp, 'wb') as out, open(path1, 'rb') as i1, open(path2, 'rb') as i2:
+            copy_fd(i1.fileno(), out.fileno())
+            copy_fd(i2.fileno(), out.fileno())
     except FileNotFoundError:
         print("merge: input file not found")
     except Exception as e:
@@ -163,8 +198,9 @@ def cmd_show(args):
     if not os.path.isfile(p):
         print(f"show: {args[1]}: No such file")
         return
-    with open(p) as f:
-        sys.stdout.write(f.read())
+    sys.stdout.flush()
+    with open(p, 'rb') as f:
+        send_fd(f.fileno(), sys.stdout.fileno())
 
 
 def split_command(command):
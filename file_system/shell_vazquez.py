@@ -5,71 +5,187 @@ import time
 
 PFS_FILE = 'private.pfs'
 
-def load_pfs_records(): #Loads pfs records into directories
-    if not os.path.exists(PFS_FILE):
-        open(PFS_FILE, 'wb').close()
-    records = []
-    with open(PFS_FILE, 'rb') as f:
-        while True:
-            header = f.readline()
-            if not header:
-                break
-            header = header.rstrip(b'\n')
-            parts = header.split(b'|')
-            tag = parts[0].decode()
-            if tag == 'DIR':
-                records.append({
-                    'type': 'DIR',
-                    'name': parts[1].decode(),
-                    'ts': parts[2].decode()
-                })
-            elif tag == 'FILE':
-                path = parts[1].decode()
-                size = int(parts[2].decode())
-                ts = parts[3].decode()
-                data = f.read(size)
-                f.read(1)
-                records.append({
-                    'type': 'FILE',
-                    'path': path,
-                    'size': size,
-                    'ts': ts,
-                    'data': data
-                })
-            else:
-                break
-    return records
-
-
-def save_pfs_records(records): #saves pfs records onto pfs file
-    with open(PFS_FILE, 'wb') as f:
-        for rec in records:
-            if rec['type'] == 'DIR':
-                f.write(f"DIR|{rec['name']}|{rec['ts']}\n".encode())
-            else:
-                f.write(f"FILE|{rec['path']}|{rec['size']}|{rec['ts']}\n".encode())
-                f.write(rec['data'])
-                f.write(b"\n")
+TOMBSTONE = {'FILE': 'GONE', 'DIR': 'RMD'} #same length, patched over the tag on delete
+COMPACT_MIN_BYTES = 64 * 1024
+
+
+class PFSRecords: #records as offsets into the pfs file, file data is read on demand
+    def __init__(self, path=PFS_FILE):
+        self.path = os.path.abspath(path) #load_pfs_records opens a new one after a cd
+        if not os.path.exists(self.path):
+            open(self.path, 'wb').close()
+        self.fd = os.open(self.path, os.O_RDWR)
+        self.files = {} #path -> FILE record
+        self.dirs = {} #name -> DIR record
+        self.children = {} #directory prefix -> paths of files under it
+        self.appended = [] #new records not written yet
+        self.deleted = [] #written records waiting for their tombstone
+        self.dead = 0
+        self.size = 0
+        self._load()
+        self.stamp = self.file_stamp()
+
+    def file_stamp(self):
+        st = os.fstat(self.fd)
+        return (st.st_mtime_ns, st.st_size)
+
+    def current(self): #false once the cwd moved or another shell changed the file
+        if os.path.abspath(PFS_FILE) != self.path:
+            return False
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (st.st_mtime_ns, st.st_size) == self.stamp
+
+    def close(self):
+        os.close(self.fd)
+
+    def _load(self):
+        with open(self.path, 'rb') as f:
+            while True:
+                pos = f.tell()
+                header = f.readline()
+                if not header:
+                    break
+                parts = header.rstrip(b'\n').split(b'|')
+                tag = parts[0].decode()
+                if tag in ('DIR', 'RMD'):
+                    if tag == 'DIR':
+                        self._index({'type': 'DIR', 'name': parts[1].decode(),
+                                     'ts': parts[2].decode(), 'pos': pos})
+                    else:
+                        self.dead += f.tell() - pos
+                elif tag in ('FILE', 'GONE'):
+                    size = int(parts[2].decode())
+                    offset = f.tell()
+                    f.seek(size + 1, os.SEEK_CUR)
+                    if tag == 'FILE':
+                        self._index({'type': 'FILE', 'path': parts[1].decode(), 'size': size,
+                                     'ts': parts[3].decode(), 'pos': pos, 'offset': offset})
+                    else:
+                        self.dead += f.tell() - pos
+                else:
+                    break
+            self.size = f.tell()
+
+    def _index(self, rec):
+        if rec['type'] == 'DIR':
+            self.dirs[rec['name']] = rec
+            return
+        path = rec['path']
+        self.files[path] = rec
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            self.children.setdefault('/'.join(parts[:i]), {})[path] = None
+
+    def _unindex(self, rec):
+        if rec['type'] == 'DIR':
+            del self.dirs[rec['name']]
+            return
+        path = rec['path']
+        del self.files[path]
+        parts = path.split('/')
+        for i in range(1, len(parts)):
+            prefix = '/'.join(parts[:i])
+            del self.children[prefix][path]
+            if not self.children[prefix]:
+                del self.children[prefix]
+
+    def files_under(self, name):
+        return [self.files[path] for path in self.children.get(name, ())]
+
+    def read(self, rec):
+        if 'data' in rec:
+            return rec['data']
+        return os.pread(self.fd, rec['size'], rec['offset'])
+
+    def append(self, rec):
+        self._index(rec)
+        self.appended.append(rec)
+
+    def remove(self, rec):
+        self._unindex(rec)
+        if 'pos' in rec:
+            self.deleted.append(rec)
+        else:
+            self.appended.remove(rec)
+
+    @staticmethod
+    def encode(rec):
+        if rec['type'] == 'DIR':
+            return f"DIR|{rec['name']}|{rec['ts']}\n".encode()
+        return f"FILE|{rec['path']}|{rec['size']}|{rec['ts']}\n".encode()
+
+    def save(self): #writes only the dirty records: one append and a tag patch per delete
+        if not self.deleted and not self.appended:
+            return
+        current = self.file_stamp() == self.stamp #else another shell wrote, and the next load picks that up
+        for rec in self.deleted:
+            header = self.encode(rec)
+            os.pwrite(self.fd, TOMBSTONE[rec['type']].encode(), rec['pos'])
+            self.dead += len(header) + (rec['size'] + 1 if rec['type'] == 'FILE' else 0)
+        self.deleted = []
+        if self.appended:
+            chunks = []
+            # the real end of the file, in case it grew since the records were read
+            pos = self.size = os.fstat(self.fd).st_size
+            for rec in self.appended:
+                header = self.encode(rec)
+                rec['pos'] = pos
+                chunks.append(header)
+                pos += len(header)
+                if rec['type'] == 'FILE':
+                    rec['offset'] = pos
+                    chunks.append(rec.pop('data'))
+                    chunks.append(b"\n")
+                    pos += rec['size'] + 1
+            os.pwrite(self.fd, b''.join(chunks), self.size)
+            self.size = pos
+            self.appended = []
+        if current:
+            self.stamp = self.file_stamp()
+        if current and self.dead >= COMPACT_MIN_BYTES and self.dead * 2 > self.size:
+            self.compact()
+
+    def compact(self): #rewrites the live records and drops deleted ones
+        tmp = self.path + '.tmp'
+        live = sorted(list(self.dirs.values()) + list(self.files.values()), key=lambda r: r['pos'])
+        with open(tmp, 'wb') as f:
+            for rec in live:
+                f.write(self.encode(rec))
+                if rec['type'] == 'FILE':
+                    f.write(self.read(rec))
+                    f.write(b"\n")
+        os.replace(tmp, self.path)
+        self.close()
+        self.__init__(self.path)
+
+
+def load_pfs_records(records=None): #Loads pfs record headers into indexes, keeps records that are still current
+    if records is not None:
+        if records.current():
+            return records
+        records.close()
+    return PFSRecords()
+
+
+def save_pfs_records(records): #saves pending pfs record changes onto pfs file
+    records.save()
 
 
 def find_dir(records, name): #finds directories in pfs file
-    for rec in records:
-        if rec['type'] == 'DIR' and rec['name'] == name:
-            return rec
-    return None
+    return records.dirs.get(name)
 
 
 def find_file(records, path): #finds files in pfs file
-    for rec in records:
-        if rec['type'] == 'FILE' and rec['path'] == path:
-            return rec
-    return None
+    return records.files.get(path)
 
 
 def read_src(src, records): #gets data from files, both disk files and pfs files
     if src.startswith('+'):
         rec = find_file(records, src.lstrip('+'))
-        return None if not rec else rec['data']
+        return None if not rec else records.read(rec)
     if not os.path.exists(src):
         return None
     raw = open(src, 'rb').read()
@@ -108,8 +224,7 @@ def cmd_rmdir(records, arg):#handles rmdir for pfs
     if not dirrec:
         print(f"rmdir: '{arg}' not found")
     else:
-        prefix = name + '/'
-        if any(r['type'] == 'FILE' and r['path'].startswith(prefix) for r in records):
+        if records.files_under(name):
             print(f"rmdir: '{arg}' not empty")
         else:
             records.remove(dirrec)
@@ -125,11 +240,9 @@ def cmd_ls(records, arg):#handles ls for pfs
     if not dirrec:
         print(f"ls: '{arg}' not found")
         return
-    prefix = name + '/'
-    for r in records:
-        if r['type'] == 'FILE' and r['path'].startswith(prefix):
-            sub = r['path'].split('/', 1)[1]
-            print(sub, r['ts'])
+    for r in records.files_under(name):
+        sub = r['path'].split('/', 1)[1]
+        print(sub, r['ts'])
 
 
 def cmd_show(records, arg):#handles show for pfs
@@ -137,7 +250,7 @@ def cmd_show(records, arg):#handles show for pfs
     if not frec:
         print(f"show: '{arg}' not found")
     else:
-        sys.stdout.buffer.write(frec['data'])
+        sys.stdout.buffer.write(records.read(frec))
         sys.stdout.write("\n")
 
 
@@ -190,6 +303,7 @@ def main():#main loop
         'merge': cmd_merge,
         'rm': cmd_rm
     }
+    records = None
     while True:
         try:
             line = input('$ ')
@@ -206,7 +320,7 @@ def main():#main loop
                 try: os.chdir(args[0])
                 except Exception as e: print(f"cd: {e}")
             continue
-        records = load_pfs_records()
+        records = load_pfs_records(records)
         if op in ['mkdir','rmdir','ls','show','rm'] and args and args[0].startswith('+'):
             cmds[op](records, args[0])
         elif op == 'cp' and len(args) == 2 and args[1].startswith('+'):
@@ -101,31 +101,138 @@ def do_pipe(command):
 
 # --- PFS (Private File System) Functions ---
 
+# Every PFS line starts with its type byte (F, D or X for a deleted entry),
+# so a delete only has to overwrite that one byte in place.
+TOMBSTONE = b"X"
+# Compact once this many bytes are deleted and they are over half the file
+COMPACT_MIN_DEAD = 64 * 1024
+
+class PFSIndex:
+    """Byte offsets of the live PFS lines, built once per session."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.stamp = None
+        self.lines = {}
+        self.children = {}
+        self.dead = 0
+
+    def _stamp(self):
+        st = os.stat(self.path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def load(self):
+        """Scan the PFS file unless it is unchanged since the last scan."""
+        stamp = self._stamp()
+        if stamp == self.stamp:
+            return self
+        self.lines = {}
+        self.children = {}
+        self.dead = 0
+        offset = 0
+        with open(self.path, "rb") as pfs:
+            for raw in pfs:
+                parts = raw.decode().strip().split("|")
+                if raw.startswith(TOMBSTONE):
+                    self.dead += len(raw)
+                elif len(parts) > 1 and parts[1] not in self.lines:
+                    self.lines[parts[1]] = (offset, len(raw))
+                    if len(parts) > 2:
+                        self.children.setdefault(parts[2], set()).add(parts[1])
+                offset += len(raw)
+        self.stamp = stamp
+        return self
+
+    def read(self, name):
+        """Return the split line for name, or None if it has no live entry."""
+        if name not in self.lines:
+            return None
+        return self.read_at(*self.lines[name])
+
+    def read_at(self, offset, length):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            return os.pread(fd, length, offset).decode().strip().split("|")
+        finally:
+            os.close(fd)
+
+    def remove(self, name):
+        """Tombstone the live line for name by overwriting its type byte."""
+        offset, length = self.lines.pop(name)
+        parts = self.read_at(offset, length)
+        if len(parts) > 2:
+            self.children.get(parts[2], set()).discard(name)
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            os.pwrite(fd, TOMBSTONE, offset)
+        finally:
+            os.close(fd)
+        self.dead += length
+        self.stamp = self._stamp()
+
+    def append(self, entry):
+        """Append entry as a new line and point its name at it."""
+        line = ("|".join(entry) + "\n").encode()
+        fd = os.open(self.path, os.O_RDWR | os.O_APPEND)
+        try:
+            size = os.fstat(fd).st_size
+            # keep one entry per line even if the file lost its last newline
+            if size and os.pread(fd, 1, size - 1) != b"\n":
+                os.write(fd, b"\n")
+                size += 1
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+        self.lines[entry[1]] = (size, len(line))
+        if len(entry) > 2:
+            self.children.setdefault(entry[2], set()).add(entry[1])
+        self.stamp = self._stamp()
+
+    def compact(self):
+        """Rewrite the PFS file without deleted lines once enough are dead."""
+        size = self._stamp()[1]
+        if self.dead < COMPACT_MIN_DEAD or self.dead * 2 <= size:
+            return
+        lines = {}
+        offset = 0
+        with open(self.path, "rb") as pfs, open(self.path + ".tmp", "wb") as out:
+            for name, (old, length) in sorted(self.lines.items(), key=lambda item: item[1][0]):
+                pfs.seek(old)
+                out.write(pfs.read(length))
+                lines[name] = (offset, length)
+                offset += length
+        os.replace(self.path + ".tmp", self.path)
+        self.lines = lines
+        self.dead = 0
+        self.stamp = self._stamp()
+
+pfs_index = None
+
+def get_pfs_index():
+    """Return the session's PFS index, rescanning only if the file changed."""
+    global pfs_index
+    if pfs_index is None:
+        pfs_index = PFSIndex(PFS_FILENAME)
+    return pfs_index.load()
+
 def find_pfs_entry(name):
     """Find a file or directory entry in PFS."""
-    with open(PFS_FILENAME, "r") as pfs:
-        for line in pfs:
-            parts = line.strip().split("|")
-            if len(parts) > 1 and parts[1] == name and parts[0] != 'X':
-                return parts
-    return None
+    return get_pfs_index().read(name)
 
 def write_pfs_entry(entry):
     """Write or update an entry in PFS."""
-    entries = []
-    updated = False
-    with open(PFS_FILENAME, "r") as pfs:
-        for line in pfs:
-            parts = line.strip().split("|")
-            if len(parts) > 1 and parts[1] == entry[1] and parts[0] != 'X':
-                entries.append("|".join(entry) + "\n")
-                updated = True
-            else:
-                entries.append(line)
-    if not updated:
-        entries.append("|".join(entry) + "\n")
-    with open(PFS_FILENAME, "w") as pfs:
-        pfs.writelines(entries)
+    index = get_pfs_index()
+    # the old line is tombstoned and the new version appended
+    if entry[1] in index.lines:
+        index.remove(entry[1])
+    index.append(entry)
+    index.compact()
+
+def remove_pfs_entry(name):
+    """Delete an entry from PFS in place."""
+    index = get_pfs_index()
+    index.remove(name)
+    index.compact()
 
 def cp_supplemental(source, destination):
     """Copy file to or from PFS."""
@@ -160,8 +267,7 @@ def rm_supplemental(name):
     if not entry:
         print(f"File {name} not found in PFS")
         return
-    entry[0] = 'X'
-    write_pfs_entry(entry)
+    remove_pfs_entry(name)
 
 def mkdir_supplemental(name):
     """Create a directory in PFS."""
@@ -173,19 +279,11 @@ def mkdir_supplemental(name):
 def rmdir_supplemental(name):
     """Remove a directory in PFS if empty."""
     name = name[1:]
-    children = []
-    with open(PFS_FILENAME, "r") as pfs:
-        for line in pfs:
-            parts = line.strip().split("|")
-            if len(parts) > 2 and parts[2] == name and parts[0] != 'X':
-                children.append(parts[1])
-    if children:
+    if get_pfs_index().children.get(name):
         print(f"Directory {name} not empty")
         return
-    entry = find_pfs_entry(name)
-    if entry:
-        entry[0] = 'X'
-        write_pfs_entry(entry)
+    if find_pfs_entry(name):
+        remove_pfs_entry(name)
 
 def ls_supplemental(target):
     """List a file or directory in PFS."""
@@ -198,11 +296,10 @@ def ls_supplemental(target):
     if entry:
         print(f"{entry[1]} {entry[3]}")
         return
-    with open(PFS_FILENAME, "r") as pfs:
-        for line in pfs:
-            parts = line.strip().split("|")
-            if len(parts) > 2 and parts[2] == name and parts[0] != 'X':
-                print(f"{parts[1]} {parts[3]}")
+    index = get_pfs_index()
+    for child in sorted(index.children.get(name, ()), key=lambda child: index.lines[child][0]):
+        parts = index.read(child)
+        print(f"{parts[1]} {parts[3]}")
 
 def merge_supplemental(file1, file2, destination):
     """Merge contents of two files and store in destination (PFS)."""
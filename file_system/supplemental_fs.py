@@ -8,9 +8,45 @@ Assignment: Supplementary File System - File System
 
 import time
 import os
+import pfs_crc
 
 PFS_FILE = "private.pfs"
 DELIMITER = "|"
+# Metadata lines are padded to at least this many bytes; longer ones are kept whole
+RECORD_WIDTH = 100
+
+# Metadata lines end with two checksums: the CRC32 of the file content and
+# the CRC32 of the line's own fields (without the offset, which update_offset
+# rewrites; a wrong offset shows up as a content mismatch). Lines written
+# before checksums have only the first six fields and are not checked.
+
+# CRC32 of the fields of a metadata line
+def metadata_crc(entry):
+    fields = f"{entry['type']}|{entry['name']}|{entry['folder']}|{entry['size']}|{entry['timestamp']}|{entry['crc']:08x}"
+    return pfs_crc.crc32(fields.encode("utf-8"))
+
+# Parse one metadata line, None if it is not valid or fails its checksum
+def parse_record(line):
+    parts = line.strip().split(DELIMITER)
+    if len(parts) not in (6, 8) or parts[0] not in ("f", "d"):
+        return None
+    try:
+        entry = {
+            "type": parts[0].strip(),
+            "name": parts[1].strip(),
+            "folder": parts[2].strip(),
+            "offset": int(parts[3]),
+            "size": int(parts[4]),
+            "timestamp": float(parts[5]),
+            "crc": None
+        }
+        if len(parts) == 8:
+            entry["crc"] = int(parts[6], 16)
+            if int(parts[7], 16) != metadata_crc(entry):
+                return None
+    except ValueError:
+        return None
+    return entry
 
 # Load metadata into memory from private.pfs
 def load_metadata():
@@ -23,42 +59,54 @@ def load_metadata():
 
     i = 0
     while i < len(lines):
-        line = lines[i].strip()
-        parts = line.split(DELIMITER)
+        entry = parse_record(lines[i])
 
         # Only process valid metadata lines
-        if len(parts) == 6 and parts[0] in ("f", "d"):
-            try:
-                entry = {
-                    "type": parts[0].strip(),
-                    "name": parts[1].strip(),
-                    "folder": parts[2].strip(),
-                    "offset": int(parts[3]),
-                    "size": int(parts[4]),
-                    "timestamp": float(parts[5])
-                }
-                metadata.append(entry)
-                # Skip content line only for files
-                if entry["type"] == "f":
-                    i += 2
-                else:  # entry["type"] == "d"
-                    i += 1
-            except ValueError:
-                i += 1  # corrupted metadata, skip
+        if entry is not None:
+            metadata.append(entry)
+            # Skip content line only for files
+            if entry["type"] == "f":
+                i += 2
+            else:  # entry["type"] == "d"
+                i += 1
         else:
             i += 1  # skip content or corrupted lines
 
     return metadata
 
+# Metadata line for an entry whose line starts at byte pos of the file. The
+# content starts right after the line, and the line's length depends on that
+# offset, so the offset is recomputed until it stays the same.
+def format_metadata(entry_type, name, folder, size, timestamp, checksums, pos):
+    content_start = pos + RECORD_WIDTH + 1
+    while True:
+        fields = [entry_type, name, folder, str(content_start), str(size), str(timestamp)] + checksums
+        line = DELIMITER.join(fields)
+        line += " " * (RECORD_WIDTH - len(line.encode("utf-8")))
+        start = pos + len(line.encode("utf-8")) + 1
+        if start == content_start:
+            return line
+        content_start = start
+
+# Read the content of a file entry and check it against its checksum
+def read_content(entry):
+    with open(PFS_FILE, "rb") as f:
+        f.seek(entry["offset"])
+        raw = f.read(entry["size"])
+    if entry["crc"] is not None and pfs_crc.crc32(raw) != entry["crc"]:
+        raise pfs_crc.ChecksumError(f"{entry['folder'].rstrip('/')}/{entry['name']} is corrupt (checksum mismatch)")
+    return raw
+
 # Write new metadata + content to private.pfs (FIXED OFFSET)
 def write_entry(entry_type, name, folder, content=""):
     with open(PFS_FILE, "a+", encoding="utf-8") as f:
-        f.seek(0, os.SEEK_END)
-        content_start = f.tell() + 101  # metadata (100) + newline
+        pos = os.fstat(f.fileno()).st_size
         size = len(content.encode("utf-8"))
         timestamp = time.time()
-        metadata_line = f"{entry_type}|{name}|{folder}|{content_start}|{size}|{timestamp}"
-        metadata_line = metadata_line.ljust(100)
+        entry = {"type": entry_type, "name": name, "folder": folder, "size": size,
+                 "timestamp": timestamp, "crc": pfs_crc.crc32(content.encode("utf-8"))}
+        metadata_line = format_metadata(entry_type, name, folder, size, timestamp,
+                                        [f"{entry['crc']:08x}", f"{metadata_crc(entry):08x}"], pos)
 
         # Write metadata + newline
         f.write(metadata_line + "\n")
@@ -76,8 +124,8 @@ def update_offset():
         # Read all lines into memory
         lines = f.readlines()
 
-        # Starting point for the offset
-        new_offset = 101  # After metadata header (100 bytes)
+        # Byte position of the current line
+        pos = 0
 
         # Iterate through the lines that contain metadata
         i = 0
@@ -92,31 +140,32 @@ def update_offset():
                 size = int(parts[4].strip())
                 timestamp = float(parts[5].strip())
 
-                # Update the offset in the metadata (modify it directly)
-                new_metadata_line = f"{entry_type}|{name}|{folder}|{new_offset}|{size}|{timestamp}"
-                new_metadata_line = new_metadata_line.ljust(100)
+                # Update the offset in the metadata (modify it directly), keeping the checksums
+                new_metadata_line = format_metadata(entry_type, name, folder, size, timestamp,
+                                                    [checksum.strip() for checksum in parts[6:]], pos)
 
                 # Replace the old metadata line with the new one
                 lines[i] = new_metadata_line + "\n"
+                pos += len(lines[i].encode("utf-8"))
+                i += 1
 
-                # Move the offset forward (content size + newline)
-                new_offset += size + 100  # 100 for each new line
-                if entry_type =='f':
-                    new_offset +=2 #considering content
-                    
-                elif entry_type == 'd':
-                    new_offset +=1 #not considering content
-
-                # Skip the content line for files (only files have content)
+                # Skip the content lines for files (content plus its newline)
                 if entry_type == "f":
-                    i += 1  # Skip the content line for files
+                    content_bytes = 0
+                    while i < len(lines) and content_bytes < size + 1:
+                        content_bytes += len(lines[i].encode("utf-8"))
+                        i += 1
+                    pos += content_bytes
+                continue
 
             # Move to the next entry
+            pos += len(metadata_line.encode("utf-8"))
             i += 1
 
         # Go back to the beginning of the file and update the modified lines
         f.seek(0)
         f.writelines(lines)
+        f.truncate()
 
 
 
@@ -136,9 +185,11 @@ def cp(src, dest):
         for entry in metadata:
             if entry["name"] == src_name:
                 # Read the content of the existing supplemental file
-                with open(PFS_FILE, "r", encoding="utf-8") as f:
-                    f.seek(entry["offset"])
-                    new_content = f.read(entry["size"])
+                try:
+                    new_content = read_content(entry).decode("utf-8")
+                except pfs_crc.ChecksumError as e:
+                    print(f"Error: {e}")
+                    return
                 found = True
                 break
         
@@ -224,15 +275,14 @@ def show(file):
 
     for entry in metadata:
         if entry["name"] == name and entry["folder"] == folder:
-            with open(PFS_FILE, "rb") as f:  # OPEN IN BINARY
-                f.seek(entry["offset"])
-                raw = f.read(entry["size"])
-                try:
-                    content = raw.decode("utf-8")
-                    print(content.strip())
-                except UnicodeDecodeError as e:
-                    print(f"(Decode error: {e})")
-                return
+            try:
+                content = read_content(entry).decode("utf-8")
+                print(content.strip())
+            except pfs_crc.ChecksumError as e:
+                print(f"Error: {e}")
+            except UnicodeDecodeError as e:
+                print(f"(Decode error: {e})")
+            return
     print("File not found.")
 
 
@@ -365,10 +415,7 @@ def merge(file1, file2, newfile):
             # Find the file in the metadata
             for entry in metadata:
                 if entry["name"] == name and entry["folder"] == folder:
-                    with open(PFS_FILE, "rb") as f:
-                        f.seek(entry["offset"])  # Seek to the content position
-                        data = f.read(entry["size"])  # Read the content
-                        return data.decode("utf-8")  # Return as string
+                    return read_content(entry).decode("utf-8")  # Return as string
             return ""  # Return empty if supplementary file not found
         else:
             # Handle regular file (does not start with '+')
@@ -384,18 +431,22 @@ def merge(file1, file2, newfile):
     is_file2_supplementary = file2.startswith("+")
     
     # Handle the different cases
-    if is_file1_supplementary and is_file2_supplementary:
-        # Both files are supplementary
-        content1 = get_content(file1, True)
-        content2 = get_content(file2, True)
-        merged_content = content1 + content2
-    elif is_file1_supplementary or is_file2_supplementary:
-        # One file is supplementary, the other is regular
-        content1 = get_content(file1, is_file1_supplementary)
-        content2 = get_content(file2, is_file2_supplementary)
-        merged_content = content1 + content2
-    else:
-        print("Error: At least one file must be a supplementary file (start with '+').")
+    try:
+        if is_file1_supplementary and is_file2_supplementary:
+            # Both files are supplementary
+            content1 = get_content(file1, True)
+            content2 = get_content(file2, True)
+            merged_content = content1 + content2
+        elif is_file1_supplementary or is_file2_supplementary:
+            # One file is supplementary, the other is regular
+            content1 = get_content(file1, is_file1_supplementary)
+            content2 = get_content(file2, is_file2_supplementary)
+            merged_content = content1 + content2
+        else:
+            print("Error: At least one file must be a supplementary file (start with '+').")
+            return
+    except pfs_crc.ChecksumError as e:
+        print(f"Error: {e}")
         return
 
     # Write the merged content to the new supplementary file
@@ -414,3 +465,30 @@ def merge(file1, file2, newfile):
     else:
         print("Destination must be a supplemental file (start with '+').")
 
+
+# fsck: Check every metadata line and the content of every file against its checksum
+def fsck(quiet=False):
+    if not os.path.exists(PFS_FILE):
+        return True
+
+    checked = 0
+    bad = []
+    blocks = []
+    with open(PFS_FILE, "rb") as f:
+        lines = f.readlines()
+
+    # metadata lines are checked here, file content in parallel by pfs_crc
+    position = 0
+    for line in lines:
+        parts = line.split(DELIMITER.encode())
+        if len(parts) == 8 and parts[0] in (b"f", b"d"):
+            checked += 1
+            entry = parse_record(line.decode("utf-8", errors="replace"))
+            if entry is None:
+                bad.append(pfs_crc.Block(position, len(line)))
+            elif entry["type"] == "f":
+                blocks.append(pfs_crc.Block(entry["offset"], entry["size"], entry["crc"]))
+        position += len(line)
+
+    bad += pfs_crc.verify(PFS_FILE, blocks)
+    return pfs_crc.report(PFS_FILE, checked + len(blocks), bad, quiet)
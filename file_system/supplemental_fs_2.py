@@ -3,22 +3,62 @@ import os
 import time
 import struct
 import sys
+import codecs
+from contextlib import contextmanager
+import pfs_crc
+import pfs_lock
+import pfs_chunks
 
 class SupplementalFileSystem:
     MAGIC_NUMBER = b'SPFS'
-    VERSION = 1
+    VERSION = 3
+    # version 2 volumes have no checksums and are used as they are
+    UNCHECKED_VERSION = 2
     
+    # header: magic, version, root directory offset, snapshot table offset
+    ROOT_POS = 5
+    SNAPSHOTS_POS = 13
+    HEADER_SIZE = 21
+    # type, status and name length come before the name, these fields after it
+    ENTRY_FIELDS = struct.Struct('=QIQ')
     
     FILE_TYPE = b'F'
     DIR_TYPE = b'D'
+    # a file whose content is a pfs_chunks recipe, so identical chunks are stored once
+    CHUNKED_TYPE = b'C'
+    # the same with every chunk compressed by the codec its recipe names
+    PACKED_TYPE = b'Z'
     
     
     ACTIVE = b'A'
     DELETED = b'D'
     
+    # Entries and directory listings are never changed once written. A change
+    # appends the new entry plus a new copy of every directory on the path up to
+    # the root, then points the header at the new root. A snapshot keeps an old
+    # root offset, so its whole tree stays readable.
+    #
+    # From version 3 every entry, listing, recipe, chunk and snapshot table is
+    # followed by a CRC32 of its bytes, checked whenever it is read and by
+    # fsck(). The header only holds offsets, which the checksum of whatever
+    # they point at covers.
+    #
+    # Several shells may share the volume. A change holds the pfs_lock writer
+    # lock from refresh() to the root swap, so writers take turns; the header
+    # is read and rewritten under its range lock. Readers only need a fresh
+    # root, since nothing it points at is ever rewritten.
+    
     def __init__(self):
         self.file_path = "private.pfs"
+        self.chunks = pfs_chunks.ChunkIndex(os.path.abspath(self.file_path))
+        
+        self.lock = pfs_lock.for_volume(self.file_path)
         
+        # opening may create or migrate the volume, which no other shell may see half done
+        with self.lock.writing(), self.lock.swapping():
+            self._open()
+    
+    def _open(self):
         if os.path.exists(self.file_path):
             self.file = open(self.file_path, "r+b")
             
@@ -28,64 +68,117 @@ class SupplementalFileSystem:
                 
             
             version = struct.unpack('B', self.file.read(1))[0]
-            if version != self.VERSION:
+            if version not in (1, self.UNCHECKED_VERSION, self.VERSION):
                 raise ValueError(f"Unsupported version: {version}")
+            self.checksummed = version == self.VERSION
+            if version == 1:
+                self._migrate_v1()
                 
             
+            self.file.seek(self.ROOT_POS)
             self.root_dir_offset = struct.unpack('Q', self.file.read(8))[0]
         else:
             
             self.file = open(self.file_path, "w+b")
-            
-            
-            self.file.write(self.MAGIC_NUMBER)  
-            self.file.write(struct.pack('B', self.VERSION))  
-            
-            
-            root_offset_pos = self.file.tell()
-            self.file.write(struct.pack('Q', 0))  
-            
-            
-            self.root_dir_offset = self.file.tell()
-            
-            
-            self.file.seek(root_offset_pos)
-            self.file.write(struct.pack('Q', self.root_dir_offset))
-            self.file.seek(self.root_dir_offset)
-            
-            
-            self.file.write(self.DIR_TYPE)  
-            self.file.write(self.ACTIVE)    
-            self.file.write(struct.pack('B', 1))  
-            self.file.write(b'/')           
-            self.file.write(struct.pack('Q', int(time.time())))  
-            
-            
-            self.file.write(struct.pack('I', 4))  
-            
-            
-            content_offset = self.file.tell() + 8  
-            self.file.write(struct.pack('Q', content_offset))
-            
-            
-            self.file.write(struct.pack('I', 0))  
-            
-            
-            self.file.flush()
+            self.checksummed = True
+            self.chunks.reset()
+            self._write_header()
+            self._set_root(self._append_entry(self.DIR_TYPE, '/', int(time.time()), self._listing_payload([])))
     
     def close(self):
         if hasattr(self, 'file') and self.file:
             self.file.close()
     
-    def _read_entry(self, offset):
-        self.file.seek(offset)
-        entry_type = self.file.read(1)
-        status = self.file.read(1)
-        name_len = struct.unpack('B', self.file.read(1))[0]
-        name = self.file.read(name_len).decode('utf-8')
-        timestamp = struct.unpack('Q', self.file.read(8))[0]
-        size = struct.unpack('I', self.file.read(4))[0]
-        content_offset = struct.unpack('Q', self.file.read(8))[0]
+    def _write_header(self):
+        self.file.seek(0)
+        self.file.write(self.MAGIC_NUMBER)  
+        self.file.write(struct.pack('B', self.VERSION))  
+        self.file.write(struct.pack('Q', 0))  
+        self.file.write(struct.pack('Q', 0))  
+        self.file.flush()
+    
+    def _set_root(self, offset):
+        # everything the new root points at is already written
+        self.file.flush()
+        with self.lock.swapping():
+            self.file.seek(self.ROOT_POS)
+            self.file.write(struct.pack('Q', offset))
+            self.file.flush()
+        self.root_dir_offset = offset
+    
+    def _header_field(self, pos):
+        # pread, since the file's read buffer may hold the header from before another shell changed it
+        with self.lock.reading():
+            return struct.unpack('Q', os.pread(self.file.fileno(), 8, pos))[0]
+    
+    def refresh(self):
+        """Pick up the root another shell may have committed since the last command."""
+        self.root_dir_offset = self._header_field(self.ROOT_POS)
+    
+    @contextmanager
+    def writing(self):
+        """Hold the writer lock over a whole change, starting from the latest root."""
+        with self.lock.writing():
+            self.refresh()
+            try:
+                yield
+            finally:
+                self.file.flush()
+    
+    def _migrate_v1(self):
+        """Rewrite a version 1 volume in the current version, keeping every entry still reachable."""
+        self.file.seek(0)
+        data = self.file.read()
+        root = struct.unpack_from('Q', data, self.ROOT_POS)[0]
+        tree = self._load_v1_tree(data, root, set())
+        
+        self.file.close()
+        self.file = open(self.file_path + ".tmp", "w+b")
+        self.checksummed = True
+        self.chunks.reset()
+        self._write_header()
+        self._set_root(self._store_tree(*tree))
+        self.file.close()
+        os.replace(self.file_path + ".tmp", self.file_path)
+        self.file = open(self.file_path, "r+b")
+    
+    def _load_v1_tree(self, data, offset, seen):
+        entry = self._unpack_entry(data, offset)
+        if entry['type'] == self.FILE_TYPE:
+            return entry, data[entry['content_offset']:entry['content_offset'] + entry['size']]
+        
+        # version 1 grew listings in place over whatever followed them, so
+        # anything that does not parse as a live entry is dropped
+        listing = entry['content_offset']
+        count = struct.unpack_from('I', data, listing)[0]
+        count = min(count, max(0, (len(data) - listing - 4) // 8))
+        children = []
+        for i in range(count):
+            child_offset = struct.unpack_from('Q', data, listing + 4 + i * 8)[0]
+            if child_offset in seen or child_offset >= len(data):
+                continue
+            seen.add(child_offset)
+            try:
+                child = self._unpack_entry(data, child_offset)
+                if child['status'] != self.ACTIVE or child['type'] not in (self.FILE_TYPE, self.DIR_TYPE):
+                    continue
+                children.append(self._load_v1_tree(data, child_offset, seen))
+            except (struct.error, UnicodeDecodeError, IndexError):
+                continue
+        return entry, children
+    
+    def _store_tree(self, entry, body):
+        if entry['type'] == self.FILE_TYPE:
+            return self._link_entry(entry['name'], entry['timestamp'], *self._store(body))
+        offsets = [self._store_tree(*child) for child in body]
+        return self._append_entry(self.DIR_TYPE, entry['name'], entry['timestamp'], self._listing_payload(offsets))
+    
+    def _unpack_entry(self, data, offset):
+        entry_type = data[offset:offset + 1]
+        status = data[offset + 1:offset + 2]
+        name_len = data[offset + 2]
+        name = data[offset + 3:offset + 3 + name_len].decode('utf-8')
+        timestamp, size, content_offset = self.ENTRY_FIELDS.unpack_from(data, offset + 3 + name_len)
         
         return {
             'offset': offset,
@@ -97,148 +190,295 @@ class SupplementalFileSystem:
             'content_offset': content_offset
         }
     
-    def _find_entry(self, path):
-        if not path or path == '/':
-            return self._read_entry(self.root_dir_offset)
+    def _read_entry(self, offset):
+        self.file.seek(offset + 2)
+        name_len = struct.unpack('B', self.file.read(1))[0]
+        entry = self._unpack_entry(self._read_at(offset, 3 + name_len + self.ENTRY_FIELDS.size), 0)
+        entry['offset'] = offset
+        return entry
+    
+    def _entry_bytes(self, entry_type, name_bytes, timestamp, size, content_offset):
+        return (entry_type + self.ACTIVE + struct.pack('B', len(name_bytes)) + name_bytes
+                + self.ENTRY_FIELDS.pack(timestamp, size, content_offset))
+    
+    def _append_entry(self, entry_type, name, timestamp, payload):
         
+        name_bytes = name.encode('utf-8')
+        self.file.seek(0, 2)
+        content_offset = self.file.tell() + len(self._entry_bytes(entry_type, name_bytes, 0, 0, 0))
+        if self.checksummed:
+            content_offset += pfs_crc.TRAILER.size
         
-        if path.startswith('+'):
-            path = path[1:]
+        entry_offset = self._link_entry(name, timestamp, entry_type, len(payload), content_offset)
+        self._append_blob(payload)
         
+        return entry_offset
+    
+    def _link_entry(self, name, timestamp, entry_type, size, content_offset):
+        # the content may be anywhere in the volume, including shared with other entries
+        name_bytes = name.encode('utf-8')
+        return self._append_blob(self._entry_bytes(entry_type, name_bytes, timestamp, size, content_offset))
+    
+    def _read_at(self, offset, length):
+        self.file.seek(offset)
+        if not self.checksummed:
+            return self.file.read(length)
+        return pfs_crc.unseal(self.file.read(length + pfs_crc.TRAILER.size), f"in {self.file_path} at offset {offset}")
+    
+    def _find_read(self, offset, length):
+        # the chunk index is only a hint, so a bad block just means no match
+        try:
+            return self._read_at(offset, length)
+        except pfs_crc.ChecksumError:
+            return None
+    
+    def _append_blob(self, data):
+        self.file.seek(0, 2)
+        offset = self.file.tell()
+        self.file.write(pfs_crc.seal(data) if self.checksummed else data)
+        return offset
+    
+    def _store(self, content):
+        """Store content as compressed, deduplicated chunks; returns the type, size and content offset of its entry."""
+        recipe_offset = pfs_chunks.store(content, self.chunks, self._find_read, self._append_blob, packed=True)
+        return self.PACKED_TYPE, len(content), recipe_offset
+    
+    def _is_file(self, entry):
+        return entry['type'] in (self.FILE_TYPE, self.CHUNKED_TYPE, self.PACKED_TYPE)
+    
+    def _listing_payload(self, offsets):
+        return struct.pack('I', len(offsets)) + b''.join(struct.pack('Q', offset) for offset in offsets)
+    
+    def _listing_offsets(self, dir_entry):
+        self.file.seek(dir_entry['content_offset'])
+        entry_count = struct.unpack('I', self.file.read(4))[0]
+        listing = self._read_at(dir_entry['content_offset'], 4 + 8 * entry_count)
+        return list(struct.unpack_from(f'{entry_count}Q', listing, 4))
+    
+    def _read_listing(self, dir_entry):
+        children = []
+        for offset in self._listing_offsets(dir_entry):
+            entry = self._read_entry(offset)
+            if entry['status'] == self.ACTIVE:
+                children.append(entry)
+        return children
+    
+    def _stream_content(self, entry):
+        """Yield the content of entry one chunk at a time."""
+        if entry['type'] in (self.CHUNKED_TYPE, self.PACKED_TYPE):
+            yield from pfs_chunks.stream(entry['content_offset'], entry['size'], self._read_at,
+                                         packed=entry['type'] == self.PACKED_TYPE)
+            return
+        # plain content is sealed as one block, so it has to be read whole
+        yield self._read_at(entry['content_offset'], entry['size'])
+    
+    def _read_content(self, entry):
+        return b"".join(self._stream_content(entry))
+    
+    def _find_chain(self, path, root=None):
+        """Entries from the root down to path, or None if path does not exist."""
+        current_dir = self._read_entry(self.root_dir_offset if root is None else root)
         
-        if path.startswith('/'):
+        if path.startswith('+'):
             path = path[1:]
         
-        components = path.split('/')
-        current_dir = self._read_entry(self.root_dir_offset)
         
+        path = path.strip('/')
+        if not path:
+            return [current_dir]
         
-        if not components[0]:
-            return current_dir
-        
-        
-        for i, component in enumerate(components):
+        chain = [current_dir]
+        for component in path.split('/'):
             if current_dir['type'] != self.DIR_TYPE:
                 return None  
             
-            
-            self.file.seek(current_dir['content_offset'])
-            entry_count = struct.unpack('I', self.file.read(4))[0]
-            
-            found = False
-            
-            for _ in range(entry_count):
-                entry_offset = struct.unpack('Q', self.file.read(8))[0]
-                entry = self._read_entry(entry_offset)
-                
-                if entry['status'] == self.ACTIVE and entry['name'] == component:
-                    
-                    if i == len(components) - 1:
-                        
-                        return entry
-                    else:
-                        
-                        current_dir = entry
-                        found = True
-                        break
-            
-            if not found:
+            for entry in self._read_listing(current_dir):
+                if entry['name'] == component:
+                    current_dir = entry
+                    break
+            else:
                 return None  
+            chain.append(current_dir)
         
-        return None  
+        return chain
+    
+    def _find_entry(self, path, root=None):
+        chain = self._find_chain(path, root)
+        return chain[-1] if chain else None
     
     def _get_parent_and_name(self, path):
-        if not path or path == '/':
-            return None, ''
-        
-        
+        """The chain of directories down to the parent of path, and the last component."""
         if path.startswith('+'):
             path = path[1:]
         
         
-        if path.startswith('/'):
-            path = path[1:]
-        
-        components = path.split('/')
-        
-        
-        if len(components) == 1:
-            parent_dir = self._read_entry(self.root_dir_offset)
-            return parent_dir, components[0]
-        
+        components = path.strip('/').split('/')
+        parents = self._find_chain('/'.join(components[:-1]))
         
-        parent_path = '/'.join(components[:-1])
-        parent_dir = self._find_entry(parent_path)
-        
-        return parent_dir, components[-1]
+        return parents, components[-1]
     
-    def _add_to_directory(self, dir_entry, new_entry_offset):
-        
-        self.file.seek(dir_entry['content_offset'])
-        entry_count = struct.unpack('I', self.file.read(4))[0]
-        
-        
-        self.file.seek(dir_entry['content_offset'])
-        self.file.write(struct.pack('I', entry_count + 1))
-        
-        
-        self.file.seek(dir_entry['content_offset'] + 4 + (entry_count * 8))
-        
-        
-        self.file.write(struct.pack('Q', new_entry_offset))
+    def _update_path(self, parents, name, new_offset):
+        """Point name in parents[-1] at new_offset (None removes it), copying every directory up to the root."""
+        timestamp = int(time.time())
+        for parent in reversed(parents):
+            offsets = []
+            replaced = False
+            for child in self._read_listing(parent):
+                if child['name'] != name:
+                    offsets.append(child['offset'])
+                elif new_offset is not None:
+                    offsets.append(new_offset)
+                    replaced = True
+            if new_offset is not None and not replaced:
+                offsets.append(new_offset)
+            
+            new_offset = self._append_entry(self.DIR_TYPE, parent['name'], timestamp, self._listing_payload(offsets))
+            name = parent['name']
+            timestamp = parent['timestamp']
+        
+        self._set_root(new_offset)
+    
+    def _read_snapshots(self):
+        table_offset = self._header_field(self.SNAPSHOTS_POS)
+        snapshots = {}
+        if not table_offset:
+            return snapshots
+        
+        self.file.seek(table_offset)
+        count = struct.unpack('I', self.file.read(4))[0]
+        for _ in range(count):
+            name_len = struct.unpack('B', self.file.read(1))[0]
+            name = self.file.read(name_len).decode('utf-8')
+            timestamp = struct.unpack('Q', self.file.read(8))[0]
+            root = struct.unpack('Q', self.file.read(8))[0]
+            snapshots[name] = (root, timestamp)
+        if self.checksummed:
+            self._read_at(table_offset, self.file.tell() - table_offset)
+        return snapshots
+    
+    def _resolve(self, path):
+        """Split 'path@name' into the path and the root it should be read from."""
+        if '@' not in path:
+            return path, self.root_dir_offset
+        
+        path, name = path.rsplit('@', 1)
+        snapshots = self._read_snapshots()
+        if name not in snapshots:
+            print(f"Error: Snapshot '{name}' not found")
+            return path, None
+        return path, snapshots[name][0]
+    
+    def _find_file(self, path):
+        """Entry of a supplementary file, which may be read from a snapshot."""
+        path, root = self._resolve(path)
+        if root is None:
+            return None
         
+        entry = self._find_entry(path, root)
+        if not entry:
+            print(f"Error: File '{path}' not found")
+            return None
         
-        self.file.seek(dir_entry['offset'] + 3 + struct.unpack('B', self.file.read(1))[0])  
-        self.file.write(struct.pack('Q', int(time.time())))
+        if not self._is_file(entry):
+            print(f"Error: '{path}' is not a file")
+            return None
         
-        self.file.flush()
+        return entry
+    
+    def _is_directory_empty(self, dir_entry):
+        return not self._read_listing(dir_entry)
     
-    def _create_entry(self, entry_type, name, parent_dir, content_size=0):
+    def snapshot(self, name=None):
+        """Freeze the current tree under name, or list the snapshots if no name is given."""
+        snapshots = self._read_snapshots()
+        
+        if name is None:
+            for snap, (_, timestamp) in snapshots.items():
+                timestamp_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+                print(f"{snap} (Created: {timestamp_str})")
+            return True
         
-        self.file.seek(0, 2)
-        entry_offset = self.file.tell()
+        if not name or '@' in name or '/' in name or len(name.encode('utf-8')) > 255:
+            print(f"Error: Invalid snapshot name '{name}'")
+            return False
         
+        if name in snapshots:
+            print(f"Error: Snapshot '{name}' already exists")
+            return False
         
-        name_bytes = name.encode('utf-8')
-        content_offset = entry_offset + 1 + 1 + 1 + len(name_bytes) + 8 + 4 + 8
+        snapshots[name] = (self.root_dir_offset, int(time.time()))
         
         
-        self.file.write(entry_type)  
-        self.file.write(self.ACTIVE)  
-        self.file.write(struct.pack('B', len(name_bytes)))  
-        self.file.write(name_bytes)  
-        self.file.write(struct.pack('Q', int(time.time())))  
-        self.file.write(struct.pack('I', content_size))  
-        self.file.write(struct.pack('Q', content_offset))  
+        table = struct.pack('I', len(snapshots))
+        for snap, (root, timestamp) in snapshots.items():
+            snap_bytes = snap.encode('utf-8')
+            table += struct.pack('B', len(snap_bytes)) + snap_bytes + struct.pack('QQ', timestamp, root)
+        table_offset = self._append_blob(table)
+        self.file.flush()
         
+        with self.lock.swapping():
+            self.file.seek(self.SNAPSHOTS_POS)
+            self.file.write(struct.pack('Q', table_offset))
+            self.file.flush()
         
-        if parent_dir:
-            self._add_to_directory(parent_dir, entry_offset)
+        return True
+    
+    def fsck(self, quiet=False):
+        """Check the checksum of everything reachable from the live tree and the snapshots.
+
+        Entries, listings and recipes are checked as the trees are walked;
+        the chunks they lead to, which are most of the volume, are then
+        checked in parallel by pfs_crc.verify.
+        """
+        if not self.checksummed:
+            if not quiet:
+                print(f"fsck: {self.file_path}: version {self.UNCHECKED_VERSION} volumes have no checksums")
+            return True
         
         self.file.flush()
-        return entry_offset, content_offset
+        seen = set()
+        blocks = set()
+        bad = []
+        try:
+            roots = [self.root_dir_offset] + [root for root, _ in self._read_snapshots().values()]
+        except (pfs_crc.ChecksumError, struct.error, UnicodeDecodeError):
+            bad.append(pfs_crc.Block(self.SNAPSHOTS_POS, 8))
+            roots = [self.root_dir_offset]
+        for root in roots:
+            self._check_tree(root, seen, blocks, bad)
+        
+        bad += pfs_crc.verify(self.file_path, blocks)
+        return pfs_crc.report(self.file_path, len(seen) + len(blocks), bad, quiet)
     
-    def _mark_as_deleted(self, entry):
-        self.file.seek(entry['offset'] + 1)  
-        self.file.write(self.DELETED)
-        self.file.flush()
+    def _check_tree(self, offset, seen, blocks, bad):
+        if offset in seen:
+            return
+        seen.add(offset)
+        try:
+            entry = self._read_entry(offset)
+            if entry['type'] == self.DIR_TYPE:
+                for child in self._listing_offsets(entry):
+                    self._check_tree(child, seen, blocks, bad)
+            elif entry['type'] in (self.CHUNKED_TYPE, self.PACKED_TYPE):
+                blocks.update(self._chunk_blocks(entry, seen))
+            else:
+                blocks.add(pfs_crc.Block(entry['content_offset'], entry['size']))
+        except (pfs_crc.ChecksumError, struct.error, UnicodeDecodeError, IndexError):
+            bad.append(pfs_crc.Block(offset, 0))
     
-    def _is_directory_empty(self, dir_entry):
-        self.file.seek(dir_entry['content_offset'])
-        entry_count = struct.unpack('I', self.file.read(4))[0]
-        
-        if entry_count == 0:
-            return True
-        
-        
-        active_entries = 0
-        for _ in range(entry_count):
-            entry_offset = struct.unpack('Q', self.file.read(8))[0]
-            entry = self._read_entry(entry_offset)
-            if entry['status'] == self.ACTIVE:
-                active_entries += 1
-        
-        return active_entries == 0
+    def _chunk_blocks(self, entry, seen):
+        recipe_offset = entry['content_offset']
+        if recipe_offset in seen:
+            return []
+        seen.add(recipe_offset)
+        count = pfs_chunks.chunk_count(entry['size'])
+        if entry['type'] == self.PACKED_TYPE:
+            recipe = self._read_at(recipe_offset, count * pfs_chunks.PACKED_REF.size)
+            return [pfs_crc.Block(offset, length)
+                    for offset, length, _ in pfs_chunks.PACKED_REF.iter_unpack(recipe)]
+        recipe = self._read_at(recipe_offset, count * pfs_chunks.CHUNK_REF.size)
+        return [pfs_crc.Block(offset, min(pfs_chunks.CHUNK_SIZE, entry['size'] - i * pfs_chunks.CHUNK_SIZE))
+                for i, (offset,) in enumerate(pfs_chunks.CHUNK_REF.iter_unpack(recipe))]
     
     def cp(self, source, dest):       
         
@@ -249,54 +489,38 @@ class SupplementalFileSystem:
         dest = dest[1:]  
         
         
-        content = None
         if source.startswith('+'):
             
-            source = source[1:]  
-            source_entry = self._find_entry(source)
-            if not source_entry:
-                print(f"Error: Source file '{source}' not found")
-                return False
-            
-            if source_entry['type'] != self.FILE_TYPE:
-                print(f"Error: '{source}' is not a file")
+            source_entry = self._find_file(source[1:])
+            if source_entry is None:
                 return False
             
-            
-            self.file.seek(source_entry['content_offset'])
-            content = self.file.read(source_entry['size'])
+            # metadata only: the new entry shares the stored content
+            stored = source_entry['type'], source_entry['size'], source_entry['content_offset']
         else:
             
             try:
                 with open(source, 'rb') as f:
-                    content = f.read()
+                    stored = self._store(f.read())
             except FileNotFoundError:
                 print(f"Error: Source file '{source}' not found")
                 return False
         
-        
-        parent_dir, filename = self._get_parent_and_name(dest)
-        if not parent_dir:
+        return self._write_file(dest, stored)
+    
+    def _write_file(self, dest, stored):
+        parents, filename = self._get_parent_and_name(dest)
+        if not parents:
             print(f"Error: Parent directory for '{dest}' not found")
             return False
         
-        if parent_dir['type'] != self.DIR_TYPE:
-            print(f"Error: '{parent_dir['name']}' is not a directory")
+        if parents[-1]['type'] != self.DIR_TYPE:
+            print(f"Error: '{parents[-1]['name']}' is not a directory")
             return False
         
         
-        dest_entry = self._find_entry(dest)
-        if dest_entry and dest_entry['status'] == self.ACTIVE:
-            
-            self._mark_as_deleted(dest_entry)
-        
-        
-        _, content_offset = self._create_entry(self.FILE_TYPE, filename, parent_dir, len(content))
-        
-        
-        self.file.seek(content_offset)
-        self.file.write(content)
-        self.file.flush()
+        entry_offset = self._link_entry(filename, int(time.time()), *stored)
+        self._update_path(parents, filename, entry_offset)
         
         return True
     
@@ -307,17 +531,18 @@ class SupplementalFileSystem:
         
         path = path[1:]  
         
-        entry = self._find_entry(path)
-        if not entry:
+        chain = self._find_chain(path)
+        if not chain:
             print(f"Error: File '{path}' not found")
             return False
         
-        if entry['type'] != self.FILE_TYPE:
+        entry = chain[-1]
+        if not self._is_file(entry):
             print(f"Error: '{path}' is not a file")
             return False
         
         
-        self._mark_as_deleted(entry)
+        self._update_path(chain[:-1], entry['name'], None)
         return True
     
     def mkdir(self, path):
@@ -329,23 +554,19 @@ class SupplementalFileSystem:
         
         
         existing = self._find_entry(path)
-        if existing and existing['status'] == self.ACTIVE:
+        if existing:
             print(f"Error: '{path}' already exists")
             return False
         
         
-        parent_dir, dirname = self._get_parent_and_name(path)
-        if not parent_dir:
+        parents, dirname = self._get_parent_and_name(path)
+        if not parents or parents[-1]['type'] != self.DIR_TYPE:
             print(f"Error: Parent directory for '{path}' not found")
             return False
         
         
-        entry_offset, content_offset = self._create_entry(self.DIR_TYPE, dirname, parent_dir, 4)
-        
-        
-        self.file.seek(content_offset)
-        self.file.write(struct.pack('I', 0))  
-        self.file.flush()
+        entry_offset = self._append_entry(self.DIR_TYPE, dirname, int(time.time()), self._listing_payload([]))
+        self._update_path(parents, dirname, entry_offset)
         
         return True
     
@@ -356,22 +577,27 @@ class SupplementalFileSystem:
         
         path = path[1:]  
         
-        entry = self._find_entry(path)
-        if not entry:
+        chain = self._find_chain(path)
+        if not chain:
             print(f"Error: Directory '{path}' not found")
             return False
         
+        entry = chain[-1]
         if entry['type'] != self.DIR_TYPE:
             print(f"Error: '{path}' is not a directory")
             return False
         
+        if len(chain) == 1:
+            print("Error: Cannot remove the root directory")
+            return False
+        
         
         if not self._is_directory_empty(entry):
             print(f"Error: Directory '{path}' is not empty")
             return False
         
         
-        self._mark_as_deleted(entry)
+        self._update_path(chain[:-1], entry['name'], None)
         return True
     
     def ls(self, path):
@@ -379,32 +605,25 @@ class SupplementalFileSystem:
             print("Error: Path must be a supplementary file or directory")
             return False
         
-        path = path[1:]  
+        path, root = self._resolve(path[1:])
+        if root is None:
+            return False
         
-        entry = self._find_entry(path)
+        entry = self._find_entry(path, root)
         if not entry:
             print(f"Error: '{path}' not found")
             return False
         
-        if entry['type'] == self.FILE_TYPE:
+        if self._is_file(entry):
             
             timestamp_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['timestamp']))
             print(f"{entry['name']} (Last modified: {timestamp_str})")
         elif entry['type'] == self.DIR_TYPE:
             
-            self.file.seek(entry['content_offset'])
-            entry_count = struct.unpack('I', self.file.read(4))[0]
-            
-            
-            for _ in range(entry_count):
-                entry_offset = struct.unpack('Q', self.file.read(8))[0]
-                child_entry = self._read_entry(entry_offset)
-                
-                if child_entry['status'] == self.ACTIVE:
-                    
-                    entry_type = 'D' if child_entry['type'] == self.DIR_TYPE else 'F'
-                    timestamp_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(child_entry['timestamp']))
-                    print(f"{entry_type} {child_entry['name']} (Last modified: {timestamp_str})")
+            for child_entry in self._read_listing(entry):
+                entry_type = 'D' if child_entry['type'] == self.DIR_TYPE else 'F'
+                timestamp_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(child_entry['timestamp']))
+                print(f"{entry_type} {child_entry['name']} (Last modified: {timestamp_str})")
         
         return True
     
@@ -419,40 +638,20 @@ class SupplementalFileSystem:
             print("Error: Destination must be a supplementary file")
             return False
         
-        file1 = file1[1:]  
-        dest = dest[1:]    
-        
-        
-        file1_entry = self._find_entry(file1)
-        if not file1_entry:
-            print(f"Error: File '{file1}' not found")
-            return False
         
-        if file1_entry['type'] != self.FILE_TYPE:
-            print(f"Error: '{file1}' is not a file")
+        file1_entry = self._find_file(file1[1:])
+        if file1_entry is None:
             return False
-        
-        
-        self.file.seek(file1_entry['content_offset'])
-        content1 = self.file.read(file1_entry['size'])
+        content1 = self._read_content(file1_entry)
         
         
         content2 = None
         if file2.startswith('+'):
             
-            file2 = file2[1:]  
-            file2_entry = self._find_entry(file2)
-            if not file2_entry:
-                print(f"Error: File '{file2}' not found")
-                return False
-            
-            if file2_entry['type'] != self.FILE_TYPE:
-                print(f"Error: '{file2}' is not a file")
+            file2_entry = self._find_file(file2[1:])
+            if file2_entry is None:
                 return False
-            
-            
-            self.file.seek(file2_entry['content_offset'])
-            content2 = self.file.read(file2_entry['size'])
+            content2 = self._read_content(file2_entry)
         else:
             
             try:
@@ -463,60 +662,36 @@ class SupplementalFileSystem:
                 return False
         
         
-        merged_content = content1 + content2
-        
-        
-        parent_dir, filename = self._get_parent_and_name(dest)
-        if not parent_dir:
-            print(f"Error: Parent directory for '{dest}' not found")
-            return False
-        
-        if parent_dir['type'] != self.DIR_TYPE:
-            print(f"Error: '{parent_dir['name']}' is not a directory")
-            return False
-        
-        
-        dest_entry = self._find_entry(dest)
-        if dest_entry and dest_entry['status'] == self.ACTIVE:
-            
-            self._mark_as_deleted(dest_entry)
-        
-        
-        _, content_offset = self._create_entry(self.FILE_TYPE, filename, parent_dir, len(merged_content))
-        
-        
-        self.file.seek(content_offset)
-        self.file.write(merged_content)
-        self.file.flush()
-        
-        return True
+        return self._write_file(dest[1:], self._store(content1 + content2))
     
     def show(self, path):
         if not path.startswith('+'):
             print("Error: Path must be a supplementary file")
             return False
         
-        path = path[1:]  
-        
-        entry = self._find_entry(path)
-        if not entry:
-            print(f"Error: File '{path}' not found")
+        entry = self._find_file(path[1:])
+        if entry is None:
             return False
         
-        if entry['type'] != self.FILE_TYPE:
-            print(f"Error: '{path}' is not a file")
-            return False
-        
-        
-        self.file.seek(entry['content_offset'])
-        content = self.file.read(entry['size'])
-        
+        # decode as the chunks come in instead of building the whole file first
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        head = b''
+        written = False
         try:
-            
-            print(content.decode('utf-8'))
+            for piece in self._stream_content(entry):
+                if len(head) < 100:
+                    head += piece[:100 - len(head)]
+                text = decoder.decode(piece)
+                sys.stdout.write(text)
+                written = written or bool(text)
+            sys.stdout.write(decoder.decode(b'', final=True))
         except UnicodeDecodeError:
             
-            print("Binary content (first 100 bytes):", content[:100])
+            if written:
+                print()
+            print("Binary content (first 100 bytes):", head)
+            return True
+        print()
         
         return True
 